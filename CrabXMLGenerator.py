@@ -0,0 +1,119 @@
+import fnmatch
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from DatasetXMLHelper import NumberEntries, natural_sort_key, parse_prefix_rewrites, rewrite_prefix, write_xml
+from FileMetadataCache import add_cache_arguments, open_cache
+
+
+NTUPLE_PATTERN = "Ntuple_*.root"
+
+
+def _subdirectories(path):
+    with os.scandir(path) as entries:
+        return sorted(entry.path for entry in entries if entry.is_dir())
+
+
+def _is_block_dir(path):
+    # crab numbers the output blocks 0000, 0001, ..., each with up to 1000 files
+    name = os.path.basename(path)
+    return len(name) == 4 and name.isdigit()
+
+
+def find_block_dirs(crab_dir, latest=False):
+    """Return the sorted block directories (crab_<task>/<timestamp>/000N) of a crab output directory.
+
+    Args:
+        crab_dir (`str`): The crab_<task> directory, or one of its <timestamp> directories
+        latest (`bool`): Only use the newest <timestamp> directory, e.g. if a task was submitted again
+    """
+    subdirectories = _subdirectories(crab_dir)
+    if any(_is_block_dir(path) for path in subdirectories):
+        return [path for path in subdirectories if _is_block_dir(path)]
+    if latest:
+        subdirectories = subdirectories[-1:]
+    return [block for timestamp in subdirectories for block in _subdirectories(timestamp) if _is_block_dir(block)]
+
+
+def scan_block(block_dir, pattern=NTUPLE_PATTERN):
+    """Return the paths of the files in one block directory that match pattern, without descending into log/ or failed/."""
+    with os.scandir(block_dir) as entries:
+        return [entry.path for entry in entries if fnmatch.fnmatchcase(entry.name, pattern) and entry.is_file()]
+
+
+def find_ntuples(crab_dirs, pattern=NTUPLE_PATTERN, latest=False, workers=16):
+    """Return the sorted paths of all ntuples below crab output directories.
+
+    The block directories are listed concurrently with os.scandir, which mostly waits for the (shared) filesystem.
+    The paths are sorted naturally by (timestamp, block, index), see natural_sort_key.
+    """
+    block_dirs = [block for crab_dir in crab_dirs for block in find_block_dirs(crab_dir, latest)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        blocks = list(executor.map(lambda block: scan_block(block, pattern), block_dirs))
+    return sorted((path for block in blocks for path in block), key=natural_sort_key)
+
+
+def sum_cached_entries(filenames, cache):
+    """Return (total number of entries, number of files without cached entries) of the files."""
+    metadata = cache.get_many(filenames)
+    total, n_missing = 0, 0
+    for filename in filenames:
+        entries = metadata[filename].entries if filename in metadata else None
+        if entries is None:
+            n_missing += 1
+        else:
+            total += entries
+    return total, n_missing
+
+
+def generate_xml(crab_dirs, output, prefixes=None, pattern=NTUPLE_PATTERN, latest=False, workers=16, cache=None):
+    """Write the dataset XML of crab output directories in natural order and return the list of its filenames.
+
+    Args:
+        crab_dirs (:obj:`list` of `str`): crab_<task> or <timestamp> directories
+        output (`str`): The XML file to write
+        prefixes (:obj:`list` of `tuple`): (old, new) prefix rewrites from the local paths to the paths in the XML,
+            e.g. from a mounted /pnfs to /pnfs/desy.de/cms/tier2//store
+        pattern (`str`): Shell pattern of the ntuple names
+        latest (`bool`): Only use the newest <timestamp> directory of each crab_<task> directory
+        workers (`int`): Number of block directories listed concurrently
+        cache (:obj:`FileMetadataCache`): If given, a NumberEntries trailer with the fast method is appended, provided
+            the number of entries of every file is cached
+    """
+    filenames = [rewrite_prefix(path, prefixes or []) for path in find_ntuples(crab_dirs, pattern, latest, workers)]
+    number_entries = []
+    if cache is not None:
+        total, n_missing = sum_cached_entries(filenames, cache)
+        if n_missing == 0:
+            number_entries.append(NumberEntries(int(round(total)), "fast"))
+        else:
+            print("WARNING CrabXMLGenerator: %d of %d file(s) have no cached number of entries, no NumberEntries written to %s"%(n_missing, len(filenames), output), file=sys.stderr)
+    write_xml(output, filenames, number_entries)
+    return filenames
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Write a dataset XML from crab output directories (crab_<task>/<timestamp>/000N/Ntuple_*.root).")
+
+    parser.add_argument("crab_dirs", nargs="+", help="crab_<task> or <timestamp> directories.")
+    parser.add_argument("-o", "--output", required=True, help="the dataset XML to write.")
+    parser.add_argument("--rewrite", nargs="*", default=[], help="prefix rewrite(s) old=new from the local paths to the paths in the XML.")
+    parser.add_argument("--pattern", default=NTUPLE_PATTERN, help="pattern of the ntuple names (default: %(default)s).")
+    parser.add_argument("--latest", action="store_true", help="only use the newest <timestamp> directory of each crab_<task> directory.")
+    parser.add_argument("-j", "--workers", type=int, default=16, help="number of block directories listed concurrently (default: %(default)s).")
+    parser.add_argument("--force", action="store_true", help="overwrite the output XML if it exists.")
+    add_cache_arguments(parser)
+
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        parser.error("%s exists, use --force to overwrite it"%args.output)
+
+    start = time.perf_counter()
+    cache = open_cache(args)
+    filenames = generate_xml(args.crab_dirs, args.output, parse_prefix_rewrites(args.rewrite), args.pattern, args.latest, args.workers, cache)
+    if cache is not None:
+        cache.close()
+    print("%d file(s) written to %s in %.2f s"%(len(filenames), args.output, time.perf_counter()-start))
@@ -0,0 +1,400 @@
+import importlib.util
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+
+UHH2_DATASETS_BASE = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(UHH2_DATASETS_BASE, "CrossSectionHelper.py")
+DEFAULT_SOCKET = os.environ.get("UHH2_XSEC_SOCKET") or os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "uhh2-xsec-%d.sock"%os.getuid())
+
+# the lookups that can be requested, op -> MCSampleValuesHelper.get_<op>
+OPS = ["xs", "nevt", "br", "kfactor", "corr", "lumi", "xml"]
+# errors of lookups that are sent to the client and raised there again
+_ERRORS = {error.__name__: error for error in [KeyError, ValueError, TypeError, ZeroDivisionError, AttributeError]}
+
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 1 << 28
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def send_frame(sock, obj):
+    """Send one frame of the protocol: the length of the compact JSON encoding as 4-byte big-endian integer, then the JSON."""
+    data = json.dumps(obj, separators=(",", ":")).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock):
+    """Receive one frame of the protocol, see send_frame. Returns None if the connection was closed."""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    length, = _HEADER.unpack(header)
+    if length > _MAX_FRAME:
+        raise ValueError("ERROR CrossSectionDaemon::Frame of %d bytes exceeds the maximum of %d bytes"%(length, _MAX_FRAME))
+    data = _recv_exactly(sock, length)
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def load_helper(import_signal=None, database_path=DATABASE_PATH):
+    """Return a new MCSampleValuesHelper with the given signal dicts, from a fresh execution of CrossSectionHelper.py.
+
+    A fresh module is used so that a reload picks up edits of the database and does not share the class-level dict
+    with earlier helpers.
+    """
+    spec = importlib.util.spec_from_file_location("CrossSectionHelper_daemon", database_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MCSampleValuesHelper(import_signal=list(import_signal or []))
+
+
+def database_files(import_signal=None):
+    """Return the files the database is read from: CrossSectionHelper.py and the signal dicts."""
+    cmssw_base = os.environ.get("CMSSW_BASE")
+    base = f"{cmssw_base}/src/UHH2/common/UHH2-datasets" if cmssw_base is not None else UHH2_DATASETS_BASE
+    return [DATABASE_PATH] + [f"{base}/xsec_signal_dicts/{name}.py" for name in (import_signal or [])]
+
+
+def _mtimes(paths):
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def resolve_query(helper, query):
+    """Return the result [1, value] or [0, error type, message] of one query [op, process, energy, year, *args].
+
+    The extra args are passed on to the getter, e.g. kFactor and Corrections for lumi or info="Source" for the others.
+    """
+    try:
+        op, process, energy, year = query[:4]
+        if not op in OPS:
+            raise ValueError("ERROR CrossSectionDaemon::Unknown lookup \"" + str(op) + "\", use one of " + ", ".join(OPS))
+        return [1, getattr(helper, "get_" + op)(process, energy, year, *query[4:])]
+    except Exception as error:
+        name = type(error).__name__ if type(error).__name__ in _ERRORS else "ValueError"
+        return [0, name, error.args[0] if len(error.args) == 1 and isinstance(error.args[0], str) else str(error)]
+
+
+def check_socket_owner(path):
+    """Raise a PermissionError unless path is a Unix domain socket of the current user.
+
+    The default socket may be in a shared directory (e.g. /tmp on a login node), where another user could create it
+    first and serve wrong values.
+    """
+    info = os.stat(path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError("ERROR CrossSectionClient::" + path + " is not a socket of the current user")
+
+
+def check_peer_owner(sock):
+    """Raise a PermissionError unless the process on the other end of a connected Unix domain socket runs as the
+    current user. Only checked where SO_PEERCRED is available (Linux), check_socket_owner covers the others."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    if uid != os.getuid():
+        raise PermissionError("ERROR CrossSectionClient::The server of the socket runs as user %d"%uid)
+
+
+class CrossSectionServer():
+    """Long-lived lookup server of the cross section database on a Unix domain socket.
+
+    The database, including the requested signal dicts, is loaded once and reloaded when one of its files changes.
+    Every request is one frame (see send_frame) with a dict {"signal": [names], "queries": [[op, process, energy, year], ...]},
+    answered by a frame with a dict {"results": [[1, value] or [0, error type, message], ...]}. Requests needing
+    signal dicts that are not loaded are answered with {"error": ...}, and the client falls back to in-process lookups.
+    A request {"ping": true} is answered with the state of the server. Connections are kept open for many requests and
+    served in their own threads.
+
+    Args:
+        socket_path (`str`): Path of the Unix domain socket, only accessible by the user
+        import_signal (:obj:`list` of `str`): Signal dicts of xsec_signal_dicts to load
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, import_signal=None):
+        self.socket_path = socket_path
+        self.import_signal = sorted(set(import_signal or []))
+        self.helper = load_helper(self.import_signal)
+        self._files = database_files(self.import_signal)
+        self._mtimes = _mtimes(self._files)
+        self._last_check = time.monotonic()
+        self._lock = threading.Lock()
+        # the counters are updated by the threads of all connections
+        self._count_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._socket = None
+        self.n_requests = self.n_queries = self.n_reloads = 0
+        self.started = time.time()
+
+    def _current_helper(self):
+        """Return the helper, reloading the database first if one of its files changed (checked at most once per interval)."""
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return self.helper
+        with self._lock:
+            if now - self._last_check >= RELOAD_CHECK_INTERVAL:
+                self._last_check = now
+                mtimes = _mtimes(self._files)
+                if mtimes != self._mtimes:
+                    try:
+                        self.helper = load_helper(self.import_signal)
+                        self.n_reloads += 1
+                    except Exception as error:
+                        # keep serving the last good database while an edit is in progress
+                        print("WARNING CrossSectionServer: reloading the database failed, keeping the previous one: %s"%error, flush=True)
+                    self._mtimes = mtimes
+        return self.helper
+
+    def handle(self, request):
+        """Return the response to one request, see the class description."""
+        if request.get("ping"):
+            return {"pid": os.getpid(), "signal": self.import_signal, "requests": self.n_requests, "queries": self.n_queries,
+                    "reloads": self.n_reloads, "uptime": time.time() - self.started}
+        missing = sorted(set(request.get("signal") or []) - set(self.import_signal))
+        if len(missing) > 0:
+            return {"error": "signal dict(s) not loaded by the server: " + ", ".join(missing)}
+        helper = self._current_helper()
+        queries = request.get("queries", [])
+        with self._count_lock:
+            self.n_requests += 1
+            self.n_queries += len(queries)
+        return {"results": [resolve_query(helper, query) for query in queries]}
+
+    def _serve_connection(self, connection):
+        with connection:
+            try:
+                while True:
+                    request = recv_frame(connection)
+                    if request is None:
+                        break
+                    send_frame(connection, self.handle(request))
+            except (OSError, ValueError):
+                pass
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                probe.close()
+                raise ValueError("ERROR CrossSectionServer::A server is already listening on " + self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left over from a server that did not shut down cleanly
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self._socket.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._socket.listen(128)
+
+    def serve_forever(self):
+        """Accept connections until stop is called, then remove the socket."""
+        self._bind()
+        self._socket.settimeout(0.5)
+        try:
+            while not self._stop.is_set():
+                try:
+                    connection, _ = self._socket.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            self._socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def stop(self):
+        self._stop.set()
+
+
+class CrossSectionClient():
+    """Thin client of a CrossSectionServer, with the lookup methods of MCSampleValuesHelper.
+
+    If no server is listening on the socket, the socket or the server belong to another user (see check_socket_owner),
+    or the server has not loaded the requested signal dicts, the database is loaded in this process on the first
+    lookup instead, so the client can always be used. Only the standard library is imported
+    as long as the server answers.
+
+    Args:
+        import_signal (:obj:`list` of `str`): Signal dicts of xsec_signal_dicts needed for the lookups
+        socket_path (`str`): Path of the Unix domain socket of the server
+        timeout (`float`): Timeout in seconds of connecting and of every request to the server
+
+    Example:
+        client = CrossSectionClient(import_signal=["AZHToLLTTBar"])
+        lumis = client.lookup([("lumi", process, "13TeV", "UL18") for process in processes])
+        xml = client.get_xml("TTToSemiLeptonic", "13TeV", "UL18")
+    """
+
+    def __init__(self, import_signal=None, socket_path=DEFAULT_SOCKET, timeout=10.0):
+        self.import_signal = sorted(set(import_signal or []))
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._socket = None
+        self._helper = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    @property
+    def using_server(self):
+        """Whether the lookups are answered by the server, only known after the first lookup."""
+        return self._socket is not None
+
+    def _request(self, request):
+        """Return the response of the server to a request, or None if there is no (usable) server."""
+        if self._helper is not None:
+            return None
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.settimeout(self.timeout)
+                check_socket_owner(self.socket_path)
+                self._socket.connect(self.socket_path)
+                check_peer_owner(self._socket)
+            send_frame(self._socket, request)
+            response = recv_frame(self._socket)
+        except (OSError, ValueError):
+            response = None
+        if response is None or "error" in response:
+            self.close()
+            return None
+        return response
+
+    def _fallback(self):
+        if self._helper is None:
+            from CrossSectionHelper import MCSampleValuesHelper
+            self._helper = MCSampleValuesHelper(import_signal=self.import_signal)
+        return self._helper
+
+    def ping(self):
+        """Return the state of the server as dict, or None if no server is listening."""
+        return self._request({"ping": True})
+
+    def lookup(self, queries, raise_errors=True):
+        """Return the values of a batch of queries (op, process, energy, year, *args) with op one of OPS, in one request.
+
+        Args:
+            raise_errors (`bool`): Raise the error of the first failed query as the helper would, otherwise failed
+                queries give None
+        """
+        queries = [list(query) for query in queries]
+        response = self._request({"signal": self.import_signal, "queries": queries})
+        if response is not None:
+            results = response["results"]
+        else:
+            helper = self._fallback()
+            results = [resolve_query(helper, query) for query in queries]
+        values = []
+        for result in results:
+            if result[0] == 1:
+                values.append(result[1])
+            elif raise_errors:
+                raise _ERRORS[result[1]](result[2])
+            else:
+                values.append(None)
+        return values
+
+    def get_xs(self, name, energy, year, info=""):
+        return self.lookup([("xs", name, energy, year, info)])[0]
+
+    def get_nevt(self, name, energy, year, info=""):
+        return self.lookup([("nevt", name, energy, year, info)])[0]
+
+    def get_br(self, name, energy, year, info=""):
+        return self.lookup([("br", name, energy, year, info)])[0]
+
+    def get_kfactor(self, name, energy, year, info=""):
+        return self.lookup([("kfactor", name, energy, year, info)])[0]
+
+    def get_corr(self, name, energy, year, info=""):
+        return self.lookup([("corr", name, energy, year, info)])[0]
+
+    def get_xml(self, name, energy, year, info=""):
+        return self.lookup([("xml", name, energy, year, info)])[0]
+
+    def get_lumi(self, name, energy, year, kFactor=False, Corrections=False):
+        return self.lookup([("lumi", name, energy, year, kFactor, Corrections)])[0]
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import signal
+    import sys
+    parser = argparse.ArgumentParser(description="Serve cross section database lookups from a long-lived process over a Unix domain socket, or query such a server.")
+
+    parser.add_argument("processes", nargs="*", help="processes to look up with the client, e.g. TTToSemiLeptonic.")
+    parser.add_argument("--serve", action="store_true", help="run the server in the foreground until it is interrupted or terminated.")
+    parser.add_argument("--status", action="store_true", help="print the state of the server and exit with an error if none is listening.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="path of the Unix domain socket (default: %(default)s, or $UHH2_XSEC_SOCKET).")
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to load (server) or to require (client).")
+    parser.add_argument("--op", nargs="+", default=["xs", "nevt", "lumi", "xml"], choices=OPS, help="values to look up (default: %(default)s).")
+    parser.add_argument("--year", default=None, help="year of the lookups, e.g. UL18.")
+    parser.add_argument("--energy", default="13TeV", help="energy of the lookups (default: %(default)s).")
+
+    args = parser.parse_args()
+
+    if args.serve:
+        server = CrossSectionServer(args.socket, args.import_signal)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        print("serving the cross section database on %s (pid %d, signal dicts: %s)"%(args.socket, os.getpid(), ", ".join(server.import_signal) or "none"), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    with CrossSectionClient(args.import_signal, args.socket) as client:
+        if args.status:
+            state = client.ping()
+            if state is None:
+                print("no server listening on " + args.socket)
+                sys.exit(1)
+            print("server on %s: pid %d, up %.0f s, %d request(s) with %d lookup(s), %d reload(s), signal dicts: %s"%(
+                args.socket, state["pid"], state["uptime"], state["requests"], state["queries"], state["reloads"], ", ".join(state["signal"]) or "none"))
+            sys.exit(0)
+        if len(args.processes) == 0:
+            parser.error("give processes to look up, or use --serve or --status")
+        if args.year is None:
+            parser.error("--year is required for lookups")
+        values = client.lookup([(op, process, args.energy, args.year) for process in args.processes for op in args.op], raise_errors=False)
+        print("\t".join(["process"] + args.op))
+        for i, process in enumerate(args.processes):
+            print("\t".join([process] + [str(value) for value in values[i*len(args.op):(i+1)*len(args.op)]]))
+        print("(%s)"%("server " + args.socket if client.using_server else "in-process lookup, no server on " + args.socket), file=sys.stderr)
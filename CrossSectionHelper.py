@@ -1,10 +1,25 @@
+import bisect
+import cmd
+import fnmatch
 import importlib.util
-from collections import namedtuple,Mapping
+from collections import namedtuple
+from collections.abc import Mapping
 import os
+import re
 import sys
 
 
 CMSSW_BASE = os.environ.get("CMSSW_BASE")
+UHH2_DATASETS_BASE = os.path.dirname(os.path.abspath(__file__))
+
+
+SampleRow = namedtuple("SampleRow", ["nevt", "lumi", "xml"])
+
+# the columns of the machine-readable output, see MCSampleValuesHelper.get_record
+DATABASE_FIELDS = ["process", "energy", "year", "is_data", "xs", "xs_source", "br", "br_source", "kfactor", "kfactor_source",
+                   "corr", "corr_source", "nevt", "nevt_source", "lumi", "xml", "xml_source"]
+DATABASE_FORMATS = ["json", "ndjson", "csv"]
+_RECORD_KEYS = [("xs", "CrossSection"), ("br", "BranchingRatio"), ("kfactor", "kFactor"), ("corr", "Correction"), ("nevt", "NEvents"), ("xml", "XMLname")]
 
 
 def namedtuple_with_defaults(typename, field_names, default_values=()):
@@ -54,6 +69,14 @@ class MCSampleValuesHelperPrototype():
     CorrValues    = namedtuple_with_defaults("CorrValues",    __corr_field_names,     [_key_field_map["Correction"][1],""]*len(__years+__energies))
     XMLValues     = namedtuple_with_defaults("XMLValues",     __xml_field_names,      [_key_field_map["XMLname"][1],""]*len(__years+__energies))
 
+    @classmethod
+    def get_years(cls):
+        return list(cls.__years)
+
+    @classmethod
+    def get_energies(cls):
+        return list(cls.__energies)
+
 
 class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
     """Stores the cross sections and k-factors associated to a given physics process.
@@ -63,6 +86,7 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
 
     Args:
         extra_dicts (:obj:`dict` of :obj:`dict` of :obj:`namedtuple_with_defaults`): Extra cross sections and k-factors to add to the __values_dict.
+        import_signal (`str` or :obj:`list` of `str`): Name(s) of signal dicts in xsec_signal_dicts to add to the __values_dict.
 
     Example:
         from CrossSectionHelper import *
@@ -406,7 +430,7 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
             ),
             "XMLname" : MCSampleValuesHelperPrototype.XMLValues(
                 Xml_UL16preVFP="RunII_106X_v2/data/UL16preVFP/MuonEG_Run2016E-HIPM_UL2016_MiniAODv2-v2.xml", XmlSource_UL16preVFP="/MuonEG/Run2016E-HIPM_UL2016_MiniAODv2-v2/MINIAOD",
-                Xml_UL17="RunII_106X_v2/data/UL17/MuonEG_Run2017E-UL2017_MiniAODv2-v1.xml", XmlSource_UL18="/MuonEG/Run2017E-UL2017_MiniAODv2-v1/MINIAOD",
+                Xml_UL17="RunII_106X_v2/data/UL17/MuonEG_Run2017E-UL2017_MiniAODv2-v1.xml", XmlSource_UL17="/MuonEG/Run2017E-UL2017_MiniAODv2-v1/MINIAOD",
             ),
         },
 
@@ -419,7 +443,7 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
             "XMLname" : MCSampleValuesHelperPrototype.XMLValues(
                 Xml_UL16preVFP="RunII_106X_v2/data/UL16preVFP/MuonEG_Run2016F-HIPM_UL2016_MiniAODv2-v2.xml", XmlSource_UL16preVFP="/MuonEG/Run2016F-HIPM_UL2016_MiniAODv2-v2/MINIAOD",
                 Xml_UL16postVFP="RunII_106X_v2/data/UL16postVFP/MuonEG_Run2016F-UL2016_MiniAODv2-v2.xml", XmlSource_UL16postVFP="/MuonEG/Run2016H-UL2016_MiniAODv2-v2/MINIAOD",
-                Xml_UL17="RunII_106X_v2/data/UL17/MuonEG_Run2017F-UL2017_MiniAODv2-v1.xml", XmlSource_UL18="/MuonEG/Run2017F-UL2017_MiniAODv2-v1/MINIAOD",
+                Xml_UL17="RunII_106X_v2/data/UL17/MuonEG_Run2017F-UL2017_MiniAODv2-v1.xml", XmlSource_UL17="/MuonEG/Run2017F-UL2017_MiniAODv2-v1/MINIAOD",
             ),
         },
 
@@ -7125,19 +7149,37 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
                     self.__values_dict.update(ed)
 
         if import_signal is not None:
-            imported_dict = self._import_signal(import_signal)
-            self.__values_dict = {**self.__values_dict, **imported_dict}
+            if type(import_signal) == str:
+                import_signal = [import_signal]
+            for signal_name in import_signal:
+                imported_dict = self._import_signal(signal_name)
+                self.__values_dict = {**self.__values_dict, **imported_dict}
+
+    @classmethod
+    def from_values(cls, values_dict):
+        """Return a helper with the given dict process -> {key: values} as its database instead of the one of this file.
+
+        This is used to resolve the processes of another revision of the database, see ValidateChanges.read_process_entries.
+        """
+        helper = cls()
+        helper.__values_dict = dict(values_dict)
+        return helper
 
     def _import_signal(self, signal_name):
+        base = f"{CMSSW_BASE}/src/UHH2/common/UHH2-datasets" if CMSSW_BASE is not None else UHH2_DATASETS_BASE
         spec = importlib.util.spec_from_file_location(
             "MCSignalValuesHelper",
-            f"{CMSSW_BASE}/src/UHH2/common/UHH2-datasets/xsec_signal_dicts/{signal_name}.py"
+            f"{base}/xsec_signal_dicts/{signal_name}.py"
         )
         module = importlib.util.module_from_spec(spec)
         sys.modules["MCSignalHelper"] = module
         spec.loader.exec_module(module)
         return module.MCSignalValuesHelper.signal_values_dict
 
+    def get_processes(self):
+        """Return the sorted list of all process names, including the ones of imported signal dicts."""
+        return sorted(self.__values_dict.keys())
+
     def get_value(self, name, energy, year, key, strict=False, info = ""):
         """Return the value for a given MC sample, energy or year, and information type
 
@@ -7153,26 +7195,58 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
             strict (`bool`): Whether or not to perform strict checking of the dictionary
 
         """
-        fields = [self._key_field_map[key][0]+info+"_"+energy,self._key_field_map[key][0]+info+"_"+year]
         if not name in self.__values_dict:
             raise KeyError("ERROR MCSampleValuesHelper::Unknown process \"" + str(name) + "\"")
-        if not key in self.__values_dict[name]:
+        return self._resolve_value(name, self.__values_dict[name], energy, year, key, strict, info)
+
+    def _resolve_value(self, name, values, energy, year, key, strict=False, info=""):
+        """Return the value of one information type from the dict of a process, see get_value."""
+        fields = [self._key_field_map[key][0]+info+"_"+energy,self._key_field_map[key][0]+info+"_"+year]
+        # the *Source fields are strings, empty if not given
+        default = "" if info == "Source" else self._key_field_map[key][1]
+        if not key in values:
             if strict:
-                print(self.__values_dict[name])
+                print(values)
                 raise KeyError("ERROR MCSampleValuesHelper::The process \"" + str(name) + "\" does not contain a " + str(key) + " tuple")
             else:
-                return self._key_field_map[key][1]
-        if not any(f in self.__values_dict[name][key]._fields for f in fields):
+                return default
+        if not any(f in values[key]._fields for f in fields):
             if strict:
-                print(self.__values_dict[name][key])
+                print(values[key])
                 raise KeyError("ERROR MCSampleValuesHelper::The " + str(key) + " tuple for process \"" + str(name) + "\" does contain the key(s) \"" + str(fields) + "\"")
             else:
                 self._key_field_map[key][1]
 
-        if self.__values_dict[name][key].__getattribute__(fields[0]) != self._key_field_map[key][1]:
-            return self.__values_dict[name][key].__getattribute__(fields[0])
+        if values[key].__getattribute__(fields[0]) != default:
+            return values[key].__getattribute__(fields[0])
         else:
-            return self.__values_dict[name][key].__getattribute__(fields[1])
+            return values[key].__getattribute__(fields[1])
+
+    def get_record(self, name, energy, year):
+        """Return a dict with all resolved values of a process for one energy and year, with the keys DATABASE_FIELDS.
+
+        Missing values are given by their defaults (e.g. -1 for NEVT and cross section), sources by empty strings.
+        The luminosity is calculated as by get_lumi (see record_lumi), it is None for data, and if NEVT or the cross
+        section are not known.
+        """
+        if not name in self.__values_dict:
+            raise KeyError("ERROR MCSampleValuesHelper::Unknown process \"" + str(name) + "\"")
+        values = self.__values_dict[name]
+        return make_record(name, energy, year, lambda key, strict=False, info="": self._resolve_value(name, values, energy, year, key, strict, info))
+
+    def get_row(self, name, energy, year, lumi=True):
+        """Return the SampleRow (nevt, lumi, xml) of a process, resolving every value only once.
+
+        The process dict is looked up once, and the cross section, branching ratio and NEVT used for the luminosity are
+        not resolved again as in separate get_nevt, get_lumi and get_xml calls.
+
+        Args:
+            lumi (`bool`): Whether to calculate the luminosity, e.g. not for data. It is None if False or if NEVT is unknown.
+        """
+        if not name in self.__values_dict:
+            raise KeyError("ERROR MCSampleValuesHelper::Unknown process \"" + str(name) + "\"")
+        values = self.__values_dict[name]
+        return make_row(lambda key, strict=False, info="": self._resolve_value(name, values, energy, year, key, strict, info), lumi)
 
     def get_xs(self, name, energy, year, info=""):
         return self.get_value(name, energy, year, "CrossSection", True, info)
@@ -7199,17 +7273,190 @@ class MCSampleValuesHelper(MCSampleValuesHelperPrototype):
         if Corrections: xsec *= self.get_corr(name, energy, year)
         return abs(self.get_nevt(name, energy, year))/xsec
 
-def print_database(raise_errors=False):
-    helper = MCSampleValuesHelper()
-    samples = list(MCSampleValuesHelper.__dict__["_MCSampleValuesHelper__values_dict"].keys())
-    samples.sort()
-    energies = MCSampleValuesHelperPrototype.__dict__["_MCSampleValuesHelperPrototype__energies"]
-    years = MCSampleValuesHelperPrototype.__dict__["_MCSampleValuesHelperPrototype__years"]
-    import re
-    run_pattern = re.compile("(?P<run>(Run)+[ABCDEFGH]{1})")
+def collect_xml_references(helper, energies=None, years=None):
+    """Return the list of (process, energy, year, xml) for every non-empty XML reference in the database.
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database to read the Xml_* fields from
+        energies (:obj:`list` of `str`): Energies to consider. All energies of the database are used if None.
+        years (:obj:`list` of `str`): Years to consider. All years of the database are used if None.
+    """
+    energies = helper.get_energies() if energies is None else energies
+    years = helper.get_years() if years is None else years
+    references = []
+    for process in helper.get_processes():
+        for energy in energies:
+            for year in years:
+                xml = helper.get_xml(process, energy, year)
+                if xml != "":
+                    references.append((process, energy, year, xml))
+    return references
+
+
+def find_existing_files(relpaths, base=UHH2_DATASETS_BASE, walk_threshold=256):
+    """Return the set of the given paths (relative to base) that exist as files.
+
+    Instead of one stat call per path, every top-level directory (i.e. campaign, e.g. RunII_106X_v2) referenced by
+    many paths is walked once and the paths are looked up in the resulting set of files.
+    Paths outside of a campaign directory, and the paths of campaigns referenced less than walk_threshold times (e.g.
+    when printing a filtered database), are checked individually.
+
+    Args:
+        relpaths (:obj:`iterable` of `str`): Paths relative to base, duplicates are only resolved once
+        base (`str`): The UHH2-datasets directory
+    """
+    normpaths = {}
+    for relpath in set(relpaths):
+        normpaths.setdefault(os.path.normpath(relpath), []).append(relpath)
+    n_paths = {}
+    for p in normpaths:
+        if os.sep in p and not p.startswith(os.pardir):
+            campaign = p.split(os.sep, 1)[0]
+            n_paths[campaign] = n_paths.get(campaign, 0) + 1
+    campaigns = [c for c, n in n_paths.items() if n >= walk_threshold and os.path.isdir(os.path.join(base, c))]
+    files = set()
+    for campaign in campaigns:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(base, campaign)):
+            reldir = os.path.relpath(dirpath, base)
+            files.update(os.path.join(reldir, f) for f in filenames)
+    existing = set()
+    for normpath, relpaths in normpaths.items():
+        if normpath.split(os.sep, 1)[0] in campaigns:
+            found = normpath in files
+        else:
+            found = os.path.isfile(os.path.join(base, normpath))
+        if found:
+            existing.update(relpaths)
+    return existing
+
+
+_RUN_PATTERN = re.compile("(?P<run>(Run)+[ABCDEFGH]{1})")
+
+
+def is_data(name):
+    """Return whether a process is a data sample (e.g. SingleMuon_RunB), for which no luminosity is calculated."""
+    return _RUN_PATTERN.search(name) is not None
+
+
+def record_lumi(record, kFactor=False, Corrections=False):
+    """Return the luminosity of a record (see MCSampleValuesHelper.get_record) as get_lumi calculates it, i.e. negative
+    for samples with a negative cross section (e.g. interference), or None if NEVT or the cross section are not given."""
+    xsec = record["xs"]*record["br"]
+    if kFactor: xsec *= record["kfactor"]
+    if Corrections: xsec *= record["corr"]
+    if record["nevt"] == MCSampleValuesHelper._key_field_map["NEvents"][1] or record["xs"] == MCSampleValuesHelper._key_field_map["CrossSection"][1] or xsec == 0:
+        return None
+    return abs(record["nevt"])/xsec
+
+
+def make_record(name, energy, year, resolve):
+    """Return the record of a process (see MCSampleValuesHelper.get_record) from its resolved values.
+
+    Args:
+        resolve (`function`): resolve(key, strict=False, info="") returns the value of a key of the process for the
+            energy and year, as MCSampleValuesHelper.get_value
+    """
+    record = {"process": name, "energy": energy, "year": year, "is_data": is_data(name)}
+    for field, key in _RECORD_KEYS:
+        record[field] = resolve(key)
+        record[field+"_source"] = resolve(key, info="Source")
+    record["lumi"] = None if record["is_data"] else record_lumi(record)
+    return {field: record[field] for field in DATABASE_FIELDS}
+
+
+def make_row(resolve, lumi=True):
+    """Return the SampleRow of a process (see MCSampleValuesHelper.get_row) from its resolved values, see make_record."""
+    nevt = resolve("NEvents", True)
+    xml = resolve("XMLname")
+    if not lumi or nevt < 0:
+        return SampleRow(nevt, None, xml)
+    xsec = resolve("CrossSection", True)
+    xsec *= resolve("BranchingRatio")
+    return SampleRow(nevt, abs(nevt)/xsec, xml)
+
+
+def select_database(helper, years=None, energies=None, sample_pattern=None):
+    """Return the (samples, energies, years) of the database selected by the filters, in database order.
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database
+        years (:obj:`list` of `str`): Only select these years (default: all)
+        energies (:obj:`list` of `str`): Only select these energies (default: all)
+        sample_pattern (`str`): Only select samples whose name matches this regular expression (default: all)
+    """
+    samples = helper.get_processes()
+    energies = helper.get_energies() if energies is None else [e for e in helper.get_energies() if e in energies]
+    years = helper.get_years() if years is None else [y for y in helper.get_years() if y in years]
+    if sample_pattern is not None:
+        pattern = re.compile(sample_pattern)
+        samples = [s for s in samples if pattern.search(s) is not None]
+    return samples, energies, years
+
+
+def iter_database_records(helper, years=None, energies=None, sample_pattern=None, skip_undefined=False):
+    """Yield the record (see MCSampleValuesHelper.get_record) of every selected process, energy and year, one at a time.
+
+    Args:
+        skip_undefined (`bool`): Skip combinations without NEVT, cross section and XML
+        For the other arguments see select_database.
+    """
+    samples, energies, years = select_database(helper, years, energies, sample_pattern)
+    for energy in energies:
+        for year in years:
+            for sample in samples:
+                record = helper.get_record(sample, energy, year)
+                if skip_undefined and record["nevt"] < 0 and record["xs"] < 0 and record["xml"] == "":
+                    continue
+                yield record
+
+
+def write_database_records(records, output, output_format="ndjson", flush_every=100):
+    """Write records as they are produced to a stream, as JSON array, newline-delimited JSON or CSV with a header line.
+
+    The output is flushed regularly, so that a consumer reading from a pipe can start before all records are resolved.
+    Returns the number of records written.
+    """
+    import csv
+    import json
+    if not output_format in DATABASE_FORMATS:
+        raise ValueError("ERROR write_database_records::Unknown format \"" + str(output_format) + "\", use one of " + ", ".join(DATABASE_FORMATS))
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=DATABASE_FIELDS, lineterminator="\n")
+        writer.writeheader()
+    elif output_format == "json":
+        output.write("[")
+    n = 0
+    for record in records:
+        if output_format == "csv":
+            writer.writerow({field: "" if value is None else value for field, value in record.items()})
+        elif output_format == "json":
+            output.write(("\n" if n == 0 else ",\n") + json.dumps(record))
+        else:
+            output.write(json.dumps(record) + "\n")
+        n += 1
+        if n % flush_every == 0:
+            output.flush()
+    if output_format == "json":
+        output.write("\n]\n")
+    output.flush()
+    return n
+
+
+def print_database(raise_errors=False, years=None, energies=None, sample_pattern=None, import_signal=None):
+    """Print NEVT and luminosity of the samples in the database and check that their XMLs exist.
+
+    Args:
+        raise_errors (`bool`): Raise an error if any XML is not found
+        import_signal (`str` or :obj:`list` of `str`): Signal dicts of xsec_signal_dicts to include
+        For the filters see select_database.
+    """
+    helper = MCSampleValuesHelper(import_signal=import_signal)
+    samples, energies, years = select_database(helper, years, energies, sample_pattern)
+    if len(samples) == 0:
+        print("No sample matches \"" + str(sample_pattern) + "\"")
+        return 0
 
     max_sample_length = max(len(s) for s in samples)
-    abspath_uhh2datasets = os.path.dirname(os.path.abspath(__file__))
     wrong_xmlpaths = []
 
     def banner(text, decorator = "#", line_width = 30):
@@ -7219,20 +7466,25 @@ def print_database(raise_errors=False):
         print(decorator*line_width)
         print("")
 
+    # resolve all rows first, so that the XML paths can be checked in one batch
+    rows = {}
+    for energy in energies:
+        for year in years:
+            for sample in samples:
+                row = helper.get_row(sample, energy, year, lumi=not is_data(sample))
+                lumi = "/" if row.lumi is None else "%10.2g"%row.lumi
+                nevt = "%10.2g"%row.nevt
+                line = '{sample: <{width}}-> nevt:{nevt: >5}, lumi:{lumi: >5}'.format(sample=sample, width=max_sample_length+3, nevt=nevt, lumi=lumi)
+                rows[(energy, year, sample)] = (line, row.xml)
+    existing_xmlpaths = find_existing_files(xmlpath for line, xmlpath in rows.values() if xmlpath != "")
+
     for energy in energies:
         banner(energy)
         for year in years:
             banner(year)
             for sample in samples:
-                run_match = run_pattern.search(sample)
-                isData = run_match is not None
-                nevt = helper.get_nevt(sample,energy,year)
-                lumi = "/" if (isData or nevt<0) else "%10.2g"%helper.get_lumi(sample,energy,year)
-                nevt = "%10.2g"%nevt
-                line = '{sample: <{width}}-> nevt:{nevt: >5}, lumi:{lumi: >5}'.format(sample=sample, width=max_sample_length+3, nevt=nevt, lumi=lumi)
-                xmlpath = helper.get_xml(sample,energy,year)
-                xmlabspath = os.path.join(abspath_uhh2datasets, xmlpath)
-                if xmlpath != "" and not os.path.isfile(xmlabspath):
+                line, xmlpath = rows[(energy, year, sample)]
+                if xmlpath != "" and not xmlpath in existing_xmlpaths:
                     line += " "*3+"Error: XML not found!"
                     wrong_xmlpaths.append(xmlpath)
                 print(line)
@@ -7247,14 +7499,398 @@ def print_database(raise_errors=False):
     return 0
 
 
+CheckFailure = namedtuple("CheckFailure", ["check", "subject", "message"])
+CheckResult = namedtuple("CheckResult", ["check", "failures", "seconds"])
+
+_SOURCE_FIELDS = [("xs", "cross section"), ("br", "branching ratio"), ("kfactor", "k-factor"), ("corr", "correction"), ("xml", "XML")]
+
+
+def record_subject(record):
+    """Return the subject of the CheckFailures of a record, e.g. "TTToSemiLeptonic (13TeV, UL18)"."""
+    return "%s (%s, %s)"%(record["process"], record["energy"], record["year"])
+
+
+def check_xml_exists(records, base=UHH2_DATASETS_BASE):
+    """Every referenced XML must exist."""
+    existing = find_existing_files((record["xml"] for record in records if record["xml"] != ""), base)
+    return [CheckFailure("xml_exists", record_subject(record), "XML not found: " + record["xml"])
+            for record in records if record["xml"] != "" and not record["xml"] in existing]
+
+
+def check_nevt(records, base=UHH2_DATASETS_BASE):
+    """MC samples with an XML must have a non-zero NEVT, negative only for samples with a negative cross section (e.g. interference)."""
+    failures = []
+    for record in records:
+        if record["is_data"] or record["xml"] == "":
+            continue
+        if record["nevt"] == MCSampleValuesHelper._key_field_map["NEvents"][1]:
+            failures.append(CheckFailure("nevt", record_subject(record), "NEVT not set"))
+        elif record["nevt"] == 0:
+            failures.append(CheckFailure("nevt", record_subject(record), "NEVT is zero"))
+        elif record["nevt"] < 0 and record["xs"] > 0:
+            failures.append(CheckFailure("nevt", record_subject(record), "negative NEVT %g with positive cross section %g"%(record["nevt"], record["xs"])))
+    return failures
+
+
+def check_xs(records, base=UHH2_DATASETS_BASE):
+    """MC samples with an XML or NEVT must have a non-zero cross section."""
+    failures = []
+    for record in records:
+        if record["is_data"] or (record["xml"] == "" and record["nevt"] == MCSampleValuesHelper._key_field_map["NEvents"][1]):
+            continue
+        if record["xs"] == MCSampleValuesHelper._key_field_map["CrossSection"][1]:
+            failures.append(CheckFailure("xs", record_subject(record), "cross section not set"))
+        elif record["xs"] == 0:
+            failures.append(CheckFailure("xs", record_subject(record), "cross section is zero"))
+    return failures
+
+
+def check_sources(records, base=UHH2_DATASETS_BASE):
+    """Cross sections, branching ratios, k-factors and corrections different from their defaults, and XMLs, must have a source."""
+    failures = []
+    defaults = {"xs": MCSampleValuesHelper._key_field_map["CrossSection"][1], "br": 1.0, "kfactor": 1.0, "corr": 1.0, "xml": ""}
+    for record in records:
+        for field, label in _SOURCE_FIELDS:
+            if record[field] != defaults[field] and record[field+"_source"] == "":
+                failures.append(CheckFailure("sources", record_subject(record), "no source of the " + label))
+    return failures
+
+
+def check_duplicate_xmls(records, base=UHH2_DATASETS_BASE):
+    """Every XML must only be referenced by one process and year."""
+    references = {}
+    for record in records:
+        if record["xml"] != "":
+            references.setdefault(os.path.normpath(record["xml"]), set()).add((record["process"], record["year"]))
+    return [CheckFailure("duplicate_xmls", xml, "referenced by " + ", ".join("%s (%s)"%reference for reference in sorted(users)))
+            for xml, users in sorted(references.items()) if len(users) > 1]
+
+
+def _count_active_entries(path):
+    from DatasetXMLHelper import STATUS_ACTIVE, XMLScanner
+    with XMLScanner(path) as scanner:
+        return scanner.count_statuses()[STATUS_ACTIVE]
+
+
+def check_xml_nonempty(records, base=UHH2_DATASETS_BASE, workers=None):
+    """Every existing referenced XML must have at least one active entry, the XMLs are read in parallel worker processes."""
+    from concurrent.futures import ProcessPoolExecutor
+    xmls = sorted(set(os.path.normpath(record["xml"]) for record in records if record["xml"] != ""))
+    # missing XMLs are reported by check_xml_exists
+    existing = find_existing_files(xmls, base)
+    xmls = [xml for xml in xmls if xml in existing]
+    paths = [os.path.join(base, xml) for xml in xmls]
+    if len(paths) < 64:
+        # starting the worker processes takes longer than reading a few XMLs, e.g. of changed processes
+        counts = [_count_active_entries(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths)//(4*(workers or os.cpu_count() or 1)))
+            counts = list(executor.map(_count_active_entries, paths, chunksize=chunksize))
+    return [CheckFailure("xml_nonempty", xml, "no active entries") for xml, n in zip(xmls, counts) if n == 0]
+
+
+# the checks of run_checks, in the order of their report
+CHECKS = {
+    "xml_exists": check_xml_exists,
+    "nevt": check_nevt,
+    "xs": check_xs,
+    "sources": check_sources,
+    "duplicate_xmls": check_duplicate_xmls,
+    "xml_nonempty": check_xml_nonempty,
+}
+
+
+def run_checks(helper, checks=None, years=None, energies=None, sample_pattern=None, workers=None, base=UHH2_DATASETS_BASE, records=None):
+    """Run independent integrity checks of the database concurrently and return their CheckResults.
+
+    The records of the selected processes (see iter_database_records) are resolved once and shared by all checks, which
+    then run in a thread pool. Every check reports all its failures, the wall time of every check is measured on its own.
+    The first CheckResult ("resolve") holds the time spent resolving the records.
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database, including the signal dicts to check
+        checks (:obj:`list` of `str`): Names of the CHECKS to run (default: all)
+        workers (`int`): Number of worker processes reading the XMLs (default: number of CPUs)
+        records (:obj:`list` of `dict`): Records to check instead of the selected ones, e.g. of changed processes
+        For the filters see select_database.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    checks = list(CHECKS) if checks is None else checks
+    for check in checks:
+        if not check in CHECKS:
+            raise ValueError("ERROR run_checks::Unknown check \"" + str(check) + "\", use one of " + ", ".join(CHECKS))
+    start = time.perf_counter()
+    if records is None:
+        records = list(iter_database_records(helper, years, energies, sample_pattern))
+    results = [CheckResult("resolve", [], time.perf_counter() - start)]
+
+    def run(check):
+        check_start = time.perf_counter()
+        if check == "xml_nonempty":
+            failures = CHECKS[check](records, base, workers)
+        else:
+            failures = CHECKS[check](records, base)
+        return CheckResult(check, failures, time.perf_counter() - check_start)
+
+    with ThreadPoolExecutor(max_workers=len(checks) or 1) as executor:
+        results += list(executor.map(run, checks))
+    return results
+
+
+class DatabaseShell(cmd.Cmd):
+    """Interactive query shell of the database, see help inside the shell.
+
+    The records of all processes, energies and years, and the indexes of processes by XML and by source are built once
+    when the shell starts, the index of ntuples (sorted 64-bit keys of the active entries of every referenced XML)
+    on the first which command. Process names, years and energies are completed with tab.
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database, including the signal dicts to query
+    """
+
+    intro = "CrossSectionHelper shell, type help or ? to list the commands, tab completes process names."
+    prompt = "(xsec) "
+    _VALUE_FIELDS = {"lumi": "lumi", "xs": "xs", "nevt": "nevt", "br": "br", "kfactor": "kfactor", "corr": "corr"}
+
+    def __init__(self, helper, base=UHH2_DATASETS_BASE, **kwargs):
+        super().__init__(**kwargs)
+        self.helper = helper
+        self.base = base
+        self.processes = helper.get_processes()
+        self._process_set = set(self.processes)
+        self.years = helper.get_years()
+        self.energies = helper.get_energies()
+        self.records = {}
+        self.xml_index = {}
+        self.source_index = {}
+        for record in iter_database_records(helper):
+            key = (record["process"], record["energy"], record["year"])
+            self.records[key] = record
+            if record["xml"] != "":
+                self.xml_index.setdefault(os.path.normpath(record["xml"]), []).append(key)
+            for field, label in _SOURCE_FIELDS + [("nevt", "NEVT")]:
+                if record[field+"_source"] != "":
+                    self.source_index.setdefault(record[field+"_source"], set()).add((record["process"], record["year"], label))
+        self._ntuple_digests = None
+
+    def preloop(self):
+        try:
+            import readline
+            # process names contain "-", which readline splits words at by default
+            readline.set_completer_delims(" \t\n")
+        except ImportError:
+            pass
+
+    # lookups
+
+    def _parse_key(self, arg, n_min=2):
+        words = arg.split()
+        if len(words) < n_min or len(words) > 3:
+            raise ValueError("expected PROCESS YEAR [ENERGY]" if n_min == 2 else "expected PROCESS [YEAR [ENERGY]]")
+        if not words[0] in self._process_set:
+            import difflib
+            close = difflib.get_close_matches(words[0], self.processes, n=5, cutoff=0.8)
+            raise ValueError("unknown process \"%s\"%s"%(words[0], (", similar: " + " ".join(close)) if len(close) > 0 else ""))
+        years = [words[1]] if len(words) > 1 else self.years
+        for year in years:
+            if not year in self.years:
+                raise ValueError("unknown year \"%s\", use one of %s"%(year, " ".join(self.years)))
+        energy = words[2] if len(words) > 2 else self.energies[0]
+        if not energy in self.energies:
+            raise ValueError("unknown energy \"%s\", use one of %s"%(energy, " ".join(self.energies)))
+        return words[0], years, energy
+
+    def _print_value(self, name, arg):
+        process, years, energy = self._parse_key(arg)
+        record = self.records[(process, energy, years[0])]
+        value = record[self._VALUE_FIELDS[name]]
+        if name == "lumi" and value is not None:
+            print("%g pb^-1 (NEVT %g / (xs %g pb * BR %g))"%(value, record["nevt"], record["xs"], record["br"]))
+        else:
+            source = record.get(name+"_source", "")
+            print(("/" if value is None else "%g"%value) + ("   # " + source if source != "" else ""))
+
+    def do_lumi(self, arg):
+        """lumi PROCESS YEAR [ENERGY]: luminosity of a sample, from NEVT, cross section and branching ratio."""
+        self._print_value("lumi", arg)
+
+    def do_xs(self, arg):
+        """xs PROCESS YEAR [ENERGY]: cross section with its source."""
+        self._print_value("xs", arg)
+
+    def do_nevt(self, arg):
+        """nevt PROCESS YEAR [ENERGY]: number of (weighted) events."""
+        self._print_value("nevt", arg)
+
+    def do_xml(self, arg):
+        """xml PROCESS YEAR [ENERGY]: the dataset XML with its source (the dataset name)."""
+        process, years, energy = self._parse_key(arg)
+        record = self.records[(process, energy, years[0])]
+        print(record["xml"] or "/")
+        if record["xml_source"] != "":
+            print("   # " + record["xml_source"])
+
+    def do_show(self, arg):
+        """show PROCESS [YEAR [ENERGY]]: all values of a process, for all years if none is given."""
+        process, years, energy = self._parse_key(arg, n_min=1)
+        for year in years:
+            record = self.records[(process, energy, year)]
+            print("%s (%s, %s):"%(process, energy, year))
+            for field in DATABASE_FIELDS[4:]:
+                if not field.endswith("_source"):
+                    source = record.get(field+"_source", "")
+                    print("    {:<8s} {}{}".format(field, "/" if record[field] is None else record[field], ("   # " + source) if source else ""))
+
+    def do_find(self, arg):
+        """find PATTERN: processes matching a shell pattern (e.g. QCD_HT*), or containing the text if it has no wildcard."""
+        pattern = arg.strip()
+        if not any(c in pattern for c in "*?["):
+            pattern = "*" + pattern + "*"
+        matches = fnmatch.filter(self.processes, pattern)
+        for process in matches:
+            years = [year for year in self.years if any(self.records[(process, energy, year)]["xml"] != "" for energy in self.energies)]
+            print("{:<60s} {}".format(process, " ".join(years)))
+        print("%d process(es)"%len(matches))
+
+    def do_source(self, arg):
+        """source TEXT: processes whose sources (dataset names, references of cross sections, ...) contain the text."""
+        text = arg.strip().lower()
+        n = 0
+        for source in sorted(self.source_index):
+            if text in source.lower():
+                for process, year, label in sorted(self.source_index[source]):
+                    print("{:<60s} {:<12s} {:<16s} {}".format(process, year, label, source))
+                    n += 1
+        print("%d match(es)"%n)
+
+    def _ntuple_index(self):
+        if self._ntuple_digests is None:
+            from DuplicateXMLFinder import digest_xmls
+            xmls = sorted(self.xml_index)
+            existing = find_existing_files(xmls, self.base)
+            xmls = [xml for xml in xmls if xml in existing]
+            print("indexing the ntuples of %d XML(s) ..."%len(xmls))
+            self._ntuple_digests = [(digest.xml, digest.keys) for digest in digest_xmls(xmls, self.base)]
+        return self._ntuple_digests
+
+    def do_which(self, arg):
+        """which PATH: processes using a dataset XML, or the XMLs (and their processes) listing an ntuple as active entry."""
+        path = arg.strip()
+        if path.endswith(".xml"):
+            xmls = [os.path.normpath(os.path.relpath(path, self.base) if os.path.isabs(path) else path)]
+        else:
+            from DatasetXMLHelper import filename_key
+            key = filename_key(path)
+            xmls = []
+            for xml, keys in self._ntuple_index():
+                i = bisect.bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    xmls.append(xml)
+        if len(xmls) == 0 or not any(xml in self.xml_index for xml in xmls):
+            print("not referenced by the database")
+        for xml in xmls:
+            print(xml)
+            for process, energy, year in self.xml_index.get(xml, []):
+                print("    %s (%s, %s)"%(process, energy, year))
+
+    def do_years(self, arg):
+        """years: the years and energies of the database."""
+        print("years: " + " ".join(self.years))
+        print("energies: " + " ".join(self.energies))
+
+    def do_quit(self, arg):
+        """quit: leave the shell (also exit or Ctrl-D)."""
+        return True
+
+    do_exit = do_quit
+
+    def do_EOF(self, arg):
+        print("")
+        return True
+
+    def emptyline(self):
+        pass
+
+    def onecmd(self, line):
+        try:
+            return super().onecmd(line)
+        except ValueError as error:
+            print("Error: " + str(error))
+            return False
+
+    # completion
+
+    @staticmethod
+    def _complete_from(names, text):
+        # names are sorted, so the completions are a contiguous range
+        start = bisect.bisect_left(names, text)
+        end = start
+        while end < len(names) and names[end].startswith(text):
+            end += 1
+        return names[start:end]
+
+    def _complete_key(self, text, line, begidx, endidx):
+        position = len(line[:begidx].split()) - 1
+        if position == 0:
+            return self._complete_from(self.processes, text)
+        if position == 1:
+            return [year for year in self.years if year.startswith(text)]
+        if position == 2:
+            return [energy for energy in self.energies if energy.startswith(text)]
+        return []
+
+    complete_lumi = complete_xs = complete_nevt = complete_xml = complete_show = _complete_key
+
+    def complete_find(self, text, line, begidx, endidx):
+        return self._complete_from(self.processes, text)
+
+
 if(__name__ == "__main__"):
     import argparse
     parser = argparse.ArgumentParser(description="CrossSectionHelper Database: find and calculate crucial information for your Analysis!")
 
     parser.add_argument("--print", action="store_true", help="print number of events and calculated luminosity of all samples in database (This is primarily to test the integrety of the database).")
-    parser.add_argument("--throw", action="store_true", help="raise erros if they occur. Should be used together with --print option.")
+    parser.add_argument("--throw", action="store_true", help="raise erros if they occur. Should be used together with --print or --check option.")
+    parser.add_argument("--check", action="store_true", help="run all integrity checks of the database concurrently and report all failures with the time of every check.")
+    parser.add_argument("--checks", nargs="+", default=None, choices=list(CHECKS), help="with --check, only run the given check(s) (default: all).")
+    parser.add_argument("--workers", type=int, default=None, help="with --check, number of worker processes reading the XMLs (default: number of CPUs).")
+    parser.add_argument("--shell", action="store_true", help="start an interactive shell to query the database, e.g. \"lumi TTToSemiLeptonic UL18\", \"find QCD_HT*\" or \"which <ntuple>\".")
+    parser.add_argument("--year", nargs="+", default=None, choices=MCSampleValuesHelper.get_years(), help="only print the given year(s).")
+    parser.add_argument("--energy", nargs="+", default=None, choices=MCSampleValuesHelper.get_energies(), help="only print the given energy(ies).")
+    parser.add_argument("--sample", default=None, help="only print samples whose name matches this regular expression, e.g. \"^TTTo\".")
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to include.")
+    parser.add_argument("--format", choices=["text"]+DATABASE_FORMATS, default="text", help="output format of --print: the human-readable table, or all resolved values per process, energy and year as JSON array, NDJSON or CSV streamed to stdout (default: %(default)s).")
+    parser.add_argument("--skip-undefined", action="store_true", help="with a machine-readable --format, skip process/year combinations without NEVT, cross section and XML.")
 
     args = parser.parse_args()
 
     if(args.print):
-        print_database(args.throw)
+        if args.format == "text":
+            print_database(args.throw, years=args.year, energies=args.energy, sample_pattern=args.sample, import_signal=args.import_signal)
+        else:
+            helper = MCSampleValuesHelper(import_signal=args.import_signal)
+            records = iter_database_records(helper, years=args.year, energies=args.energy, sample_pattern=args.sample, skip_undefined=args.skip_undefined)
+            write_database_records(records, sys.stdout, args.format)
+
+    if(args.check):
+        import time
+        start = time.perf_counter()
+        helper = MCSampleValuesHelper(import_signal=args.import_signal)
+        results = run_checks(helper, args.checks, years=args.year, energies=args.energy, sample_pattern=args.sample, workers=args.workers)
+        failures = [failure for result in results for failure in result.failures]
+        for failure in failures:
+            print("Error [%s] %s: %s"%failure)
+        if len(failures) > 0:
+            print("")
+        print("{:<16s} {:>8s} {:>10s}".format("check", "failures", "time"))
+        for result in results:
+            print("{:<16s} {:>8d} {:>8.3f} s".format(result.check, len(result.failures), result.seconds))
+        print("")
+        print("%d failure(s), done in %.2f s"%(len(failures), time.perf_counter()-start))
+        if args.throw and len(failures) > 0:
+            raise ValueError("%d failure(s) in the integrity checks of the database"%len(failures))
+
+    if(args.shell):
+        DatabaseShell(MCSampleValuesHelper(import_signal=args.import_signal)).cmdloop()
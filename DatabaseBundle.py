@@ -0,0 +1,335 @@
+import contextlib
+import io
+import json
+import struct
+import sys
+from array import array
+
+
+MAGIC = b"UHH2XSDB"
+SCHEMA_VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+KEYS = ["CrossSection", "NEvents", "BranchingRatio", "kFactor", "Correction", "XMLname"]
+INFOS = ["", "Source"]
+STRING_KEYS = ["XMLname"]
+_FLAG_DATA = 1
+
+
+class _StringTable():
+    """Interns strings, every distinct string is stored once and referenced by its index."""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def add(self, text):
+        if not text in self._index:
+            self._index[text] = len(self.strings)
+            self.strings.append(text)
+        return self._index[text]
+
+
+def build_bundle(helper, import_signal=None, digest=b"\0"*16):
+    """Return the bytes of a bundle of all resolved values of the database, see load_bundle.
+
+    The bundle is a preamble (PREAMBLE: magic "UHH2XSDB", uint32 schema version, uint32 length H of the header), the
+    header (H bytes of JSON: processes, energies, years, defaults, the signal dicts and the digest of the database files
+    and the offset, type and length of every column) and the columns, 8-byte aligned, in little-endian byte order:
+
+        strings              the interned string table, the concatenated UTF-8 strings
+        string_offsets       uint32  offset of each string in the table, and the end of the last one
+        process              uint32  string index of the name of each of the P processes
+        flags                uint8   per process: bit 0 data, bit 1+k the process has a tuple of KEYS[k]
+        <key><info>          per key and info ("" or "Source"), the resolved value of each process, energy and year at
+                             (p*E + e)*Y + y: float64 for numbers, uint32 string indices for XML names and sources
+        <key>_int            uint8   1 if the number at the same position is an int, so that it is read back as one
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database, including the signal dicts
+        import_signal (:obj:`list` of `str`): The signal dicts loaded into the helper, stored in the header
+        digest (`bytes`): The digest of the database files, see NormalisationTable.database_digest
+    """
+    from CrossSectionHelper import is_data
+    processes = helper.get_processes()
+    energies, years = helper.get_energies(), helper.get_years()
+    strings = _StringTable()
+    columns = {"process": array("I", [strings.add(name) for name in processes]), "flags": array("B")}
+    for key in KEYS:
+        for info in INFOS:
+            columns[key+info] = array("I" if key in STRING_KEYS or info == "Source" else "d")
+        if not key in STRING_KEYS:
+            columns[key+"_int"] = array("B")
+    for name in processes:
+        flags = _FLAG_DATA if is_data(name) else 0
+        for k, key in enumerate(KEYS):
+            try:
+                # the strict lookup prints the dict of a process without the tuple
+                with contextlib.redirect_stdout(io.StringIO()):
+                    helper.get_value(name, energies[0], years[0], key, True)
+                flags |= 2 << k
+            except KeyError:
+                pass
+        columns["flags"].append(flags)
+        for energy in energies:
+            for year in years:
+                for key in KEYS:
+                    for info in INFOS:
+                        value = helper.get_value(name, energy, year, key, False, info)
+                        if key in STRING_KEYS or info == "Source":
+                            if not isinstance(value, str):
+                                raise ValueError("ERROR DatabaseBundle::The %s%s of process \"%s\" for %s %s is not a string: %r"%(key, info, name, energy, year, value))
+                            columns[key+info].append(strings.add(value))
+                        else:
+                            if not isinstance(value, (int, float)):
+                                raise ValueError("ERROR DatabaseBundle::The %s of process \"%s\" for %s %s is not a number: %r"%(key, name, energy, year, value))
+                            columns[key].append(value)
+                            columns[key+"_int"].append(isinstance(value, int))
+    encoded = [text.encode() for text in strings.strings]
+    columns["string_offsets"] = array("I", [0])
+    for text in encoded:
+        columns["string_offsets"].append(columns["string_offsets"][-1] + len(text))
+    blobs = [("strings", b"".join(encoded), None)]
+    for column, values in columns.items():
+        if sys.byteorder != "little":
+            values.byteswap()
+        blobs.append((column, values.tobytes(), values.typecode))
+    header = {"processes": len(processes), "energies": energies, "years": years, "keys": KEYS, "infos": INFOS,
+              "defaults": {key: helper._key_field_map[key][1] for key in KEYS}, "signal": sorted(import_signal or []),
+              "digest": digest.hex(), "columns": {}}
+    offset, data = 0, []
+    for column, blob, typecode in blobs:
+        header["columns"][column] = {"offset": offset, "length": len(blob), "type": typecode}
+        padding = b"\0"*(-len(blob) % 8)
+        data += [blob, padding]
+        offset += len(blob) + len(padding)
+    header = json.dumps(header, separators=(",", ":")).encode()
+    header += b" "*(-(PREAMBLE.size + len(header)) % 8)
+    return PREAMBLE.pack(MAGIC, SCHEMA_VERSION, len(header)) + header + b"".join(data)
+
+
+def export_bundle(path, import_signal=None):
+    """Write the bundle of the database with the given signal dicts to path (atomically) and return its size."""
+    from CrossSectionHelper import MCSampleValuesHelper
+    from DatasetXMLHelper import atomic_write
+    from NormalisationTable import database_digest
+    helper = MCSampleValuesHelper(import_signal=import_signal)
+    data = build_bundle(helper, import_signal, database_digest(import_signal))
+    atomic_write(path, data)
+    return len(data)
+
+
+def _read_v1(header, data, offset):
+    """Return the columns of a bundle of schema version 1, the string table as bytes."""
+    columns = {}
+    for column, location in header["columns"].items():
+        start = offset + location["offset"]
+        blob = data[start:start+location["length"]]
+        if location["type"] is None:
+            columns[column] = blob
+            continue
+        values = array(location["type"])
+        values.frombytes(blob)
+        if sys.byteorder != "little":
+            values.byteswap()
+        columns[column] = values
+    return columns
+
+
+# readers of every schema version written so far, so that older bundles stay readable
+_READERS = {1: _read_v1}
+
+
+def load_bundle(path):
+    """Load a bundle written by export_bundle into a BundledValuesHelper, without importing CrossSectionHelper."""
+    with open(path, "rb") as f:
+        return read_bundle(f.read(), path)
+
+
+def read_bundle(data, name="bundle"):
+    """Return the BundledValuesHelper of the bytes of a bundle, e.g. of build_bundle, name is used in the errors."""
+    if len(data) < PREAMBLE.size:
+        raise ValueError("ERROR DatabaseBundle::" + name + " is too short for a database bundle")
+    magic, version, header_length = PREAMBLE.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("ERROR DatabaseBundle::" + name + " is not a database bundle")
+    if not version in _READERS:
+        raise ValueError("ERROR DatabaseBundle::" + name + " has schema version %d, only versions %s can be read"%(version, sorted(_READERS)))
+    header = json.loads(data[PREAMBLE.size:PREAMBLE.size+header_length])
+    columns = _READERS[version](header, data, PREAMBLE.size + header_length)
+    return BundledValuesHelper(header, columns, version)
+
+
+class BundledValuesHelper():
+    """The database of a bundle, with the lookup methods of MCSampleValuesHelper.
+
+    The values are the resolved ones of MCSampleValuesHelper (with the signal dicts of the bundle), including the strict
+    checks of get_xs and get_nevt for processes without a cross section or NEVT tuple. Instances are created by
+    load_bundle or read_bundle.
+
+    It is not a subclass of MCSampleValuesHelper, and only supports its lookups: get_processes, get_years,
+    get_energies, get_value, get_xs, get_nevt, get_br, get_kfactor, get_corr, get_xml, get_lumi, get_record and
+    get_row. It can be passed as helper to iter_database_records, collect_xml_references and run_checks of
+    CrossSectionHelper, but has neither the value tuples (XSValues, ...) nor extra_dicts, import_signal or from_values,
+    as the database of a bundle cannot be changed.
+    """
+
+    def __init__(self, header, columns, schema_version=SCHEMA_VERSION):
+        self.schema_version = schema_version
+        self.signal = header["signal"]
+        self.digest = bytes.fromhex(header["digest"])
+        self.defaults = dict(header["defaults"])
+        self._key_field_map = {key: (None, default) for key, default in self.defaults.items()}
+        self.__energies = header["energies"]
+        self.__years = header["years"]
+        self.__keys = {key: k for k, key in enumerate(header["keys"])}
+        self.__strings = columns["strings"]
+        self.__string_offsets = columns["string_offsets"]
+        self.__columns = columns
+        self.__index = {self._string(i): p for p, i in enumerate(columns["process"])}
+        self.__energy_index = {energy: e for e, energy in enumerate(self.__energies)}
+        self.__year_index = {year: y for y, year in enumerate(self.__years)}
+
+    def get_years(self):
+        return list(self.__years)
+
+    def get_energies(self):
+        return list(self.__energies)
+
+    def get_processes(self):
+        """Return the sorted list of all process names, including the ones of the signal dicts of the bundle."""
+        return sorted(self.__index)
+
+    def is_data(self, name):
+        return bool(self.__columns["flags"][self._process(name)] & _FLAG_DATA)
+
+    def _string(self, index):
+        # strings are only decoded when they are looked up
+        return self.__strings[self.__string_offsets[index]:self.__string_offsets[index+1]].decode()
+
+    def _process(self, name):
+        if not name in self.__index:
+            raise KeyError("ERROR MCSampleValuesHelper::Unknown process \"" + str(name) + "\"")
+        return self.__index[name]
+
+    def _value(self, p, name, energy, year, key, strict=False, info=""):
+        if not energy in self.__energy_index:
+            raise KeyError("ERROR MCSampleValuesHelper::Unknown energy \"" + str(energy) + "\"")
+        if not year in self.__year_index:
+            raise KeyError("ERROR MCSampleValuesHelper::Unknown year \"" + str(year) + "\"")
+        if strict and not self.__columns["flags"][p] & (2 << self.__keys[key]):
+            raise KeyError("ERROR MCSampleValuesHelper::The process \"" + str(name) + "\" does not contain a " + str(key) + " tuple")
+        cell = (p*len(self.__energies) + self.__energy_index[energy])*len(self.__years) + self.__year_index[year]
+        value = self.__columns[key+info][cell]
+        if key in STRING_KEYS or info == "Source":
+            return self._string(value)
+        return int(value) if self.__columns[key+"_int"][cell] else value
+
+    def get_value(self, name, energy, year, key, strict=False, info = ""):
+        """Return the value for a given MC sample, energy or year, and information type, see MCSampleValuesHelper.get_value."""
+        return self._value(self._process(name), name, energy, year, key, strict, info)
+
+    def _resolver(self, name, energy, year):
+        p = self._process(name)
+        return lambda key, strict=False, info="": self._value(p, name, energy, year, key, strict, info)
+
+    def get_record(self, name, energy, year):
+        """Return a dict with all resolved values of a process for one energy and year, see MCSampleValuesHelper.get_record.
+
+        The record is made by CrossSectionHelper (imported on the first call) as for the database itself.
+        """
+        from CrossSectionHelper import make_record
+        return make_record(name, energy, year, self._resolver(name, energy, year))
+
+    def get_row(self, name, energy, year, lumi=True):
+        """Return the SampleRow (nevt, lumi, xml) of a process, see MCSampleValuesHelper.get_row."""
+        from CrossSectionHelper import make_row
+        return make_row(self._resolver(name, energy, year), lumi)
+
+    def get_xs(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "CrossSection", True, info)
+
+    def get_nevt(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "NEvents", True, info)
+
+    def get_br(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "BranchingRatio", False, info)
+
+    def get_kfactor(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "kFactor", False, info)
+
+    def get_corr(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "Correction", False, info)
+
+    def get_xml(self, name, energy, year, info=""):
+        return self.get_value(name, energy, year, "XMLname", False, info)
+
+    def get_lumi(self, name, energy, year, kFactor=False, Corrections=False):
+        xsec = self.get_xs(name, energy, year)
+        xsec *= self.get_br(name, energy, year)
+        if kFactor: xsec *= self.get_kfactor(name, energy, year)
+        if Corrections: xsec *= self.get_corr(name, energy, year)
+        return abs(self.get_nevt(name, energy, year))/xsec
+
+
+def verify_bundle(bundle, helper):
+    """Return the list of (process, energy, year, key, info, bundle value, database value) that differ between a bundle and the database.
+
+    Values are compared including their type, and a process missing on either side is reported with None as its value.
+    """
+    differences = []
+    processes, expected_processes = bundle.get_processes(), helper.get_processes()
+    for name in sorted(set(processes) ^ set(expected_processes)):
+        differences.append((name, None, None, None, None, name if name in processes else None, name if name in expected_processes else None))
+    for name in sorted(set(processes) & set(expected_processes)):
+        for energy in helper.get_energies():
+            for year in helper.get_years():
+                for key in KEYS:
+                    for strict in [False, True]:
+                        for info in INFOS:
+                            values = []
+                            for source in [bundle, helper]:
+                                try:
+                                    value = source.get_value(name, energy, year, key, strict, info)
+                                except KeyError as error:
+                                    value = error
+                                values.append((type(value), str(value)))
+                            if values[0] != values[1]:
+                                differences.append((name, energy, year, key+(" (strict)" if strict else ""), info, values[0][1], values[1][1]))
+    return differences
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    from NormalisationTable import database_digest
+    parser = argparse.ArgumentParser(description="Export the resolved database, including signal dicts, into a binary bundle that loads without importing CrossSectionHelper, or read one.")
+
+    parser.add_argument("bundle", help="the bundle file.")
+    parser.add_argument("--export", action="store_true", help="write the bundle from the database.")
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to include.")
+    parser.add_argument("--verify", action="store_true", help="compare the bundle with the database (with the signal dicts of the bundle) and exit with an error if they differ.")
+
+    args = parser.parse_args()
+
+    if args.export:
+        start = time.perf_counter()
+        size = export_bundle(args.bundle, args.import_signal)
+        print("%s: %d bytes written in %.3f s"%(args.bundle, size, time.perf_counter()-start))
+    start = time.perf_counter()
+    bundle = load_bundle(args.bundle)
+    load_time = time.perf_counter() - start
+    digest = database_digest(bundle.signal)
+    print("%s: schema version %d, %d processes, energies %s, years %s, signal dicts %s, database %s%s, loaded in %.1f ms"%(
+          args.bundle, bundle.schema_version, len(bundle.get_processes()), " ".join(bundle.get_energies()), " ".join(bundle.get_years()),
+          " ".join(bundle.signal) or "none", bundle.digest.hex(), "" if bundle.digest == digest else " (differs from the current database %s)"%digest.hex(), 1e3*load_time))
+    if args.verify:
+        from CrossSectionHelper import MCSampleValuesHelper
+        helper = MCSampleValuesHelper(import_signal=bundle.signal)
+        # the strict lookups of the database print the dict of processes without the tuple
+        with contextlib.redirect_stdout(io.StringIO()):
+            differences = verify_bundle(bundle, helper)
+        for difference in differences:
+            print("%s %s %s %s%s: %s in the bundle, %s in the database"%difference)
+        print("%d difference(s) to the database"%len(differences))
+        if len(differences) > 0:
+            raise ValueError("%d difference(s) between %s and the database"%(len(differences), args.bundle))
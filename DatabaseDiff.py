@@ -0,0 +1,191 @@
+import os
+import re
+import subprocess
+from collections import namedtuple
+
+from CrossSectionHelper import MCSampleValuesHelper, UHH2_DATASETS_BASE
+from DatabaseBundle import build_bundle, read_bundle
+from ValidateChanges import DATABASE_FILE, SIGNAL_DICTS_DIR, read_process_entries
+
+
+# fields that can be compared, as in the records of iter_database_records
+DIFF_FIELDS = {"xs": "CrossSection", "br": "BranchingRatio", "kfactor": "kFactor", "corr": "Correction", "nevt": "NEvents", "xml": "XMLname"}
+
+ValueChange = namedtuple("ValueChange", ["file", "process", "energy", "year", "field", "old", "new"])
+DatabaseDiff = namedtuple("DatabaseDiff", ["added", "removed", "changed", "changes"])
+
+
+def _run_git(args, repo):
+    result = subprocess.run(["git", "-C", repo] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise ValueError("ERROR DatabaseDiff::git " + " ".join(args) + " failed: " + result.stderr.decode().strip())
+    return result.stdout
+
+
+def read_revision(spec, import_signal=None, repo=UHH2_DATASETS_BASE):
+    """Return the dict file -> source (`bytes`) of the database files of a revision.
+
+    Args:
+        spec (`str`): A git revision of repo, a directory with CrossSectionHelper.py (e.g. a checkout) or a single
+            database file, CrossSectionHelper.py or a signal dict. None is the working tree of repo.
+        import_signal (:obj:`list` of `str`): Signal dicts to read (default: all of the revision)
+        repo (`str`): The git repository of revisions
+    """
+    spec = repo if spec is None else spec
+    if os.path.isfile(spec):
+        name = os.path.basename(spec)
+        with open(spec, "rb") as f:
+            return {name if name == DATABASE_FILE else os.path.join(SIGNAL_DICTS_DIR, name): f.read()}
+    if os.path.isdir(spec):
+        directory = os.path.join(spec, SIGNAL_DICTS_DIR)
+        names = sorted(f for f in os.listdir(directory) if f.endswith(".py")) if os.path.isdir(directory) else []
+        paths = [DATABASE_FILE] + [os.path.join(SIGNAL_DICTS_DIR, name) for name in names]
+        sources = {}
+        for path in paths:
+            if import_signal is not None and path != DATABASE_FILE and not os.path.splitext(os.path.basename(path))[0] in import_signal:
+                continue
+            with open(os.path.join(spec, path), "rb") as f:
+                sources[path] = f.read()
+        return sources
+    listing = _run_git(["ls-tree", "-z", "--name-only", spec, "--", DATABASE_FILE, SIGNAL_DICTS_DIR + "/"], repo).decode().split("\0")
+    paths = [path for path in listing if path == DATABASE_FILE or (path.startswith(SIGNAL_DICTS_DIR + "/") and path.endswith(".py")
+             and (import_signal is None or os.path.splitext(os.path.basename(path))[0] in import_signal))]
+    if not DATABASE_FILE in paths:
+        raise ValueError("ERROR DatabaseDiff::" + spec + " is neither a file, a directory nor a git revision with " + DATABASE_FILE)
+    # one git process for all blobs instead of one git show per file
+    batch = subprocess.run(["git", "-C", repo, "cat-file", "--batch"], input="".join("%s:%s\n"%(spec, path) for path in paths).encode(),
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    sources, position = {}, 0
+    for path in paths:
+        header_end = batch.index(b"\n", position)
+        size = int(batch[position:header_end].split()[2])
+        sources[path] = batch[header_end+1:header_end+1+size]
+        position = header_end + 1 + size + 1
+    return sources
+
+
+def entries_table(entries):
+    """Return the BundledValuesHelper (the compiled index of DatabaseBundle) of a dict process -> {key: values}."""
+    return read_bundle(build_bundle(MCSampleValuesHelper.from_values(entries)))
+
+
+def diff_entries(old_entries, new_entries, filename="", fields=("xs", "nevt", "xml"), energies=None, years=None, sample_pattern=None):
+    """Return the DatabaseDiff of two dicts process -> {key: values} of a database file, see read_process_entries.
+
+    Processes whose entries are equal are skipped without resolving any value. The added, removed and changed processes
+    of each revision are compiled into an indexed table (see entries_table), and the tables are compared cell by cell.
+    Values that are missing (the default of the database) in both revisions are not reported, added and removed
+    processes are reported with the values they have.
+
+    Args:
+        fields (:obj:`list` of `str`): Fields to compare, see DIFF_FIELDS
+        energies (:obj:`list` of `str`): Energies to compare (default: all)
+        years (:obj:`list` of `str`): Years to compare (default: all)
+        sample_pattern (`str`): Regular expression of the processes to compare (default: all)
+    """
+    pattern = re.compile(sample_pattern) if sample_pattern is not None else None
+    names = [name for name in sorted(set(old_entries) | set(new_entries))
+             if (pattern is None or pattern.search(name)) and old_entries.get(name) != new_entries.get(name)]
+    old_table = entries_table({name: old_entries[name] for name in names if name in old_entries})
+    new_table = entries_table({name: new_entries[name] for name in names if name in new_entries})
+    energies = new_table.get_energies() if energies is None else energies
+    years = new_table.get_years() if years is None else years
+    added, removed, changed, changes = [], [], [], []
+    for name in names:
+        in_old, in_new = name in old_entries, name in new_entries
+        n_changes = len(changes)
+        for energy in energies:
+            for year in years:
+                for field in fields:
+                    key = DIFF_FIELDS[field]
+                    old = old_table.get_value(name, energy, year, key) if in_old else old_table.defaults[key]
+                    new = new_table.get_value(name, energy, year, key) if in_new else new_table.defaults[key]
+                    if old != new:
+                        changes.append(ValueChange(filename, name, energy, year, field, old if in_old else None, new if in_new else None))
+        if not in_old:
+            added.append(name)
+        elif not in_new:
+            removed.append(name)
+        elif len(changes) > n_changes:
+            # changes of other fields or of sources only are not reported
+            changed.append(name)
+    return DatabaseDiff(added, removed, changed, changes)
+
+
+def relative_delta(old, new):
+    """Return the relative change (new - old)/|old| of a number, or None if it is not a number or was not known (-1)."""
+    if isinstance(old, str) or isinstance(new, str) or old is None or new is None or old in (0, -1) or new == -1:
+        return None
+    return (new - old)/abs(old)
+
+
+def diff_revisions(old_spec, new_spec=None, import_signal=None, repo=UHH2_DATASETS_BASE, **kwargs):
+    """Return the DatabaseDiff of CrossSectionHelper.py and the signal dicts between two revisions, see read_revision.
+
+    Files with identical sources are not executed, the processes of the others are compared with diff_entries, file by
+    file. The keyword arguments are passed to diff_entries.
+    """
+    old_sources, new_sources = read_revision(old_spec, import_signal, repo), read_revision(new_spec, import_signal, repo)
+    for sources, other, spec in [(old_sources, new_sources, old_spec), (new_sources, old_sources, new_spec)]:
+        if spec is not None and os.path.isfile(spec):
+            # a single file is only compared to the same file of the other revision
+            for path in set(other) - set(sources):
+                del other[path]
+    diff = DatabaseDiff([], [], [], [])
+    for path in sorted(set(old_sources) | set(new_sources)):
+        old_source, new_source = old_sources.get(path), new_sources.get(path)
+        if old_source == new_source:
+            continue
+        entries = []
+        for source, spec in [(old_source, old_spec), (new_source, new_spec)]:
+            try:
+                entries.append(read_process_entries(source, path) if source is not None else {})
+            except Exception as error:
+                raise ValueError("ERROR DatabaseDiff::" + path + " of " + (spec or "the working tree") + " cannot be executed: " + repr(error))
+        old_entries, new_entries = entries
+        file_diff = diff_entries(old_entries, new_entries, path, **kwargs)
+        for total, part in zip(diff, file_diff):
+            total += part
+    return diff
+
+
+def format_change(change):
+    """Return a line of a ValueChange: + for values of added processes, - of removed ones and ~ for changed ones."""
+    if change.old is None:
+        return "+ {:<60s} {:<12s} {:<8s} {}".format(change.process, change.year, change.field, change.new)
+    if change.new is None:
+        return "- {:<60s} {:<12s} {:<8s} {}".format(change.process, change.year, change.field, change.old)
+    delta = relative_delta(change.old, change.new)
+    return "~ {:<60s} {:<12s} {:<8s} {} -> {}{}".format(change.process, change.year, change.field, change.old, change.new,
+                                                       "" if delta is None else " (%+.3g%%)"%(100*delta))
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import sys
+    import time
+    parser = argparse.ArgumentParser(description="Show the cross sections, NEVT and XMLs of processes that are added, removed or changed between two revisions of the database.")
+
+    parser.add_argument("old", nargs="?", default="HEAD", help="old revision: a git revision, a directory with CrossSectionHelper.py or a database file (default: %(default)s).")
+    parser.add_argument("new", nargs="?", default=None, help="new revision, as old (default: the working tree).")
+    parser.add_argument("--fields", nargs="+", default=["xs", "nevt", "xml"], choices=list(DIFF_FIELDS), help="fields to compare (default: %(default)s).")
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to compare (default: all).")
+    parser.add_argument("--year", nargs="+", default=None, choices=MCSampleValuesHelper.get_years(), help="year(s) to compare (default: all).")
+    parser.add_argument("--energy", nargs="+", default=None, choices=MCSampleValuesHelper.get_energies(), help="energy(ies) to compare (default: all).")
+    parser.add_argument("--sample", default=None, help="regular expression of the processes to compare (default: all).")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if the revisions differ.")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    diff = diff_revisions(args.old, args.new, args.import_signal, fields=args.fields, energies=args.energy, years=args.year, sample_pattern=args.sample)
+    current_file = None
+    for change in diff.changes:
+        if change.file != current_file:
+            current_file = change.file
+            if current_file:
+                print("### " + current_file)
+        print(format_change(change))
+    print("%d process(es) added, %d removed, %d changed, %d value(s) in %.3f s"%(len(diff.added), len(diff.removed), len(diff.changed), len(diff.changes), time.perf_counter()-start), file=sys.stderr)
+    if args.throw and len(diff.changes) > 0:
+        raise ValueError("%d value(s) differ between %s and %s"%(len(diff.changes), args.old, args.new or "the working tree"))
@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from CrossSectionHelper import MCSampleValuesHelper, UHH2_DATASETS_BASE, collect_xml_references
+from DatasetXMLHelper import STATUSES, STATUS_EMPTY, STATUS_BAD, XMLScanner, find_xml_files
+
+
+HealthRow = namedtuple("HealthRow", ["name", "xmls", "processes"] + STATUSES + ["total", "affected_fraction"])
+
+SORT_KEYS = {
+    "affected": lambda row: (-row.affected_fraction, -row.total, row.name),
+    "total": lambda row: (-row.total, row.name),
+    "name": lambda row: row.name,
+}
+
+
+def count_xml_statuses(xml, base=UHH2_DATASETS_BASE):
+    """Return the number of entries per status of a dataset XML, or None if it cannot be read."""
+    try:
+        with XMLScanner(os.path.join(base, xml)) as scanner:
+            return scanner.count_statuses()
+    except OSError:
+        return None
+
+
+def make_row(name, xmls, processes, counts):
+    total = sum(counts[status] for status in STATUSES)
+    affected = counts[STATUS_EMPTY] + counts[STATUS_BAD]
+    return HealthRow(name, sorted(xmls), sorted(processes), *[counts[status] for status in STATUSES],
+                     total=total, affected_fraction=affected/total if total > 0 else 0.0)
+
+
+def health_report(xmls, helper=None, base=UHH2_DATASETS_BASE, workers=None):
+    """Count the active, EMPTY, BAD and otherwise commented-out entries of dataset XMLs in one streaming pass.
+
+    Each XML is memory-mapped and its entries are counted with bytes searches, no XML is loaded into memory as a whole.
+    The XMLs are mapped to processes through the Xml_* fields of the database (i.e. get_xml), and the counts of all
+    XMLs of a process (over all years) are summed up.
+
+    Args:
+        xmls (:obj:`list` of `str`): Dataset XMLs, relative to base
+        helper (:obj:`MCSampleValuesHelper`): The database used to map XMLs to processes. No process rows are made if None.
+        base (`str`): The UHH2-datasets directory
+        workers (`int`): Number of worker processes reading the XMLs (default: number of CPUs)
+
+    Returns:
+        (:obj:`list` of :obj:`HealthRow`, :obj:`list` of :obj:`HealthRow`): The rows per XML and per process.
+    """
+    processes_per_xml = {}
+    if helper is not None:
+        for process, energy, year, xml in collect_xml_references(helper):
+            processes_per_xml.setdefault(os.path.normpath(xml), set()).add(process)
+    xmls = sorted(set(os.path.normpath(xml) for xml in xmls) | set(processes_per_xml))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(xmls)//(4*(workers or os.cpu_count() or 1)))
+        counts_per_xml = dict(zip(xmls, executor.map(count_xml_statuses, xmls, [base]*len(xmls), chunksize=chunksize)))
+
+    xml_rows = []
+    counts_per_process = {}
+    for xml, counts in counts_per_xml.items():
+        if counts is None:
+            continue
+        processes = processes_per_xml.get(xml, set())
+        xml_rows.append(make_row(xml, [xml], processes, counts))
+        for process in processes:
+            process_xmls, process_counts = counts_per_process.setdefault(process, (set(), {status: 0 for status in STATUSES}))
+            process_xmls.add(xml)
+            for status in STATUSES:
+                process_counts[status] += counts[status]
+    process_rows = [make_row(process, xmls, [process], counts) for process, (xmls, counts) in counts_per_process.items()]
+    return xml_rows, process_rows
+
+
+def print_table(rows):
+    if len(rows) == 0:
+        return
+    width = max(len(row.name) for row in rows) + 3
+    header = "{name: <{width}}" + "".join("{%s: >10}"%status for status in STATUSES) + "{total: >10}{affected: >10}"
+    print(header.format(name="name", width=width, total="total", affected="affected", **{status: status for status in STATUSES}))
+    for row in rows:
+        print(header.format(name=row.name, width=width, total=row.total, affected="%.2f%%"%(100*row.affected_fraction),
+                            **{status: getattr(row, status) for status in STATUSES}))
+
+
+def print_json(rows):
+    json.dump([row._asdict() for row in rows], fp=sys.stdout, indent=1)
+    print("")
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Report the number and fraction of active, EMPTY and BAD entries per dataset XML or per process.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs to report on (default: all XMLs of the selected campaigns).")
+    parser.add_argument("--campaign", nargs="*", default=None, help="campaign directories to report on, e.g. RunII_106X_v2 (default: all).")
+    parser.add_argument("--level", choices=["xml", "process"], default="xml", help="report per XML or per process (default: %(default)s).")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="affected", help="sort order of the rows (default: %(default)s).")
+    parser.add_argument("--top", type=int, default=None, help="only show the first N rows.")
+    parser.add_argument("--only-affected", action="store_true", help="only show rows with EMPTY or BAD entries.")
+    parser.add_argument("--format", choices=["table", "json"], default="table", help="output format (default: %(default)s).")
+    parser.add_argument("--import-signal", nargs="*", default=[], help="signal dict(s) of xsec_signal_dicts used to map XMLs to processes.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes reading the XMLs (default: number of CPUs).")
+
+    args = parser.parse_args()
+
+    xmls = args.xmls if len(args.xmls) > 0 else list(find_xml_files(campaigns=args.campaign))
+    helper = MCSampleValuesHelper(import_signal=args.import_signal)
+    xml_rows, process_rows = health_report(xmls, helper=helper, workers=args.workers)
+    rows = xml_rows if args.level == "xml" else process_rows
+    if args.level == "xml" and (len(args.xmls) > 0 or args.campaign is not None):
+        # XMLs referenced by the database are always read, but only report the requested ones
+        requested = set(os.path.normpath(xml) for xml in xmls)
+        rows = [row for row in rows if row.name in requested]
+    if args.only_affected:
+        rows = [row for row in rows if row.affected_fraction > 0]
+    rows = sorted(rows, key=SORT_KEYS[args.sort])[:args.top]
+
+    if args.format == "json":
+        print_json(rows)
+    else:
+        print_table(rows)
@@ -0,0 +1,442 @@
+import functools
+import hashlib
+import mmap
+import os
+import posixpath
+import re
+import tempfile
+from collections import namedtuple
+
+
+UHH2_DATASETS_BASE = os.path.dirname(os.path.abspath(__file__))
+
+STATUS_ACTIVE = "active"
+STATUS_EMPTY = "EMPTY"
+STATUS_BAD = "BAD"
+STATUS_COMMENTED = "commented"
+STATUSES = [STATUS_ACTIVE, STATUS_EMPTY, STATUS_BAD, STATUS_COMMENTED]
+
+XMLEntry = namedtuple("XMLEntry", ["filename", "status"])
+NumberEntries = namedtuple("NumberEntries", ["value", "method"])
+
+_FILENAME_TAG = b'FileName="'
+_NUMBERENTRIES_TAG = b'NumberEntries="'
+# "+" separating the parts of a summed NumberEntries value, not the one of an exponent
+_NUMBERENTRIES_SUM = re.compile(r"(?<![eE])\+")
+_METHOD_TAG = b"Method="
+_COMMENT_OPEN = b"<!--"
+_COMMENT_CLOSE = b"-->"
+_COMMENT_HEAD_LENGTH = 12
+_DIGITS = re.compile(r"(\d+)")
+
+# named prefix rewrites for parse_prefix_rewrites, from the normalised /pnfs paths of the XMLs
+SITE_PREFIXES = {
+    "xrootd-desy": ("/pnfs/desy.de/cms/tier2/", "root://dcache-cms-xrootd.desy.de:1094//pnfs/desy.de/cms/tier2/"),
+    "xrootd-global": ("/pnfs/desy.de/cms/tier2/store/", "root://cms-xrd-global.cern.ch//store/"),
+}
+
+
+def normalise_filename(filename):
+    """Return the canonical form of an ntuple path, e.g. with repeated slashes collapsed.
+
+    Use this to build lookup or deduplication keys, the same file can be written in several ways in the XMLs, e.g.
+    /pnfs/desy.de/cms/tier2//store/... and /pnfs/desy.de/cms/tier2/store/...
+    URLs such as root://host//pnfs/... keep their scheme and host, only the path is normalised and written with the
+    double slash expected by xrootd.
+    """
+    filename = filename.strip()
+    scheme, separator, rest = filename.partition("://")
+    if separator != "":
+        host, _, path = rest.partition("/")
+        return scheme + "://" + host + "/" + normalise_filename("/" + path)
+    filename = posixpath.normpath(filename)
+    # normpath keeps exactly two leading slashes
+    return filename[1:] if filename.startswith("//") else filename
+
+
+def _natural_parts(text):
+    parts = _DIGITS.split(text)
+    parts[1::2] = [int(part) for part in parts[1::2]]
+    return tuple(parts)
+
+
+_natural_directory_parts = functools.lru_cache(maxsize=4096)(_natural_parts)
+
+
+def natural_sort_key(filename):
+    """Return a sort key that orders ntuple paths naturally, i.e. by directory (timestamp, block) and then by index.
+
+    Numbers compare by value, so Ntuple_2.root comes before Ntuple_10.root and the files of a block are contiguous
+    and in the order they were written. The keys of the directories are cached, as they are shared by many files.
+    """
+    directory, _, name = filename.rpartition("/")
+    return _natural_directory_parts(directory), _natural_parts(name), filename
+
+
+def rewrite_prefix(filename, prefixes):
+    """Replace the first matching prefix of a filename, e.g. to point /pnfs paths to a local mirror.
+
+    Args:
+        filename (`str`): The ntuple path
+        prefixes (:obj:`list` of `tuple`): (old, new) prefix pairs, the first matching pair is applied
+    """
+    for old, new in prefixes:
+        if filename.startswith(old):
+            return new + filename[len(old):]
+    return filename
+
+
+def parse_prefix_rewrites(rewrites):
+    """Parse a list of "old=new" strings or names of SITE_PREFIXES, e.g. from the command line, into (old, new) prefix pairs."""
+    pairs = []
+    for rewrite in rewrites:
+        if rewrite in SITE_PREFIXES:
+            pairs.append(SITE_PREFIXES[rewrite])
+            continue
+        if not "=" in rewrite:
+            raise ValueError("ERROR DatasetXMLHelper::Prefix rewrite \"" + rewrite + "\" is not of the form old=new or one of " + ", ".join(sorted(SITE_PREFIXES)))
+        pairs.append(tuple(rewrite.split("=", 1)))
+    return pairs
+
+
+class PathNormaliser():
+    """Normalisation stage for ntuple paths: normalise_filename followed by optional prefix rewrites.
+
+    The rewrites are applied to the normalised paths, so their old prefixes have to be given in normalised form, e.g.
+    /pnfs/desy.de/cms/tier2/store/ and not /pnfs/desy.de/cms/tier2//store/.
+
+    Args:
+        prefixes (:obj:`list` of `tuple`): (old, new) prefix pairs, see rewrite_prefix and parse_prefix_rewrites
+
+    Example:
+        normaliser = PathNormaliser(parse_prefix_rewrites(["xrootd-desy"]))
+        for filename in iter_active_filenames(xml, normaliser):
+            ...
+    """
+
+    def __init__(self, prefixes=None):
+        self.prefixes = prefixes if prefixes is not None else []
+
+    def __call__(self, filename):
+        return rewrite_prefix(normalise_filename(filename), self.prefixes)
+
+
+def _normalise_filename_bytes(filename):
+    # normalise_filename of an ASCII path given as bytes, without decoding it
+    filename = filename.strip()
+    scheme, separator, rest = filename.partition(b"://")
+    if separator != b"":
+        host, _, path = rest.partition(b"/")
+        return scheme + b"://" + host + b"/" + _normalise_filename_bytes(b"/" + path)
+    filename = posixpath.normpath(filename)
+    return filename[1:] if filename.startswith(b"//") else filename
+
+
+def filename_key(filename):
+    """Return a 64-bit integer key of an ntuple path, computed from its normalised form.
+
+    The filename can be given as str or as bytes-like object (e.g. a memoryview from XMLScanner). ASCII paths given as
+    bytes are normalised and hashed as bytes, so that keys can be computed without decoding the entries.
+    """
+    if isinstance(filename, str):
+        filename = normalise_filename(filename).encode()
+    else:
+        filename = bytes(filename)
+        # str.strip also removes non-ASCII whitespace, such paths are normalised as str
+        filename = _normalise_filename_bytes(filename) if filename.isascii() else normalise_filename(filename.decode()).encode()
+    return int.from_bytes(hashlib.blake2b(filename, digest_size=8).digest(), "little")
+
+
+def find_campaigns(base=UHH2_DATASETS_BASE):
+    """Return the sorted list of campaign directories (e.g. RunII_106X_v2, Run3_130X_v1) found in base."""
+    return sorted(d for d in os.listdir(base) if d.startswith("Run") and os.path.isdir(os.path.join(base, d)))
+
+
+def find_xml_files(base=UHH2_DATASETS_BASE, campaigns=None):
+    """Yield the paths of all dataset XML files below the given campaign directories, relative to base.
+
+    Args:
+        base (`str`): The UHH2-datasets directory
+        campaigns (:obj:`list` of `str`): Campaign directories to walk. All campaigns are used if None.
+    """
+    if campaigns is None:
+        campaigns = find_campaigns(base)
+    for campaign in campaigns:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(base, campaign)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(".xml"):
+                    yield os.path.relpath(os.path.join(dirpath, filename), base)
+
+
+def _count(data, sub, start, end, chunk_size=1 << 20):
+    """Count the non-overlapping occurrences of sub in data[start:end], copying at most chunk_size bytes at a time.
+
+    mmap objects have find() but no count(), so count on bounded slices instead of copying the whole mapping.
+    """
+    n = 0
+    overlap = len(sub) - 1
+    for chunk_start in range(start, end, chunk_size):
+        n += data[chunk_start:min(chunk_start+chunk_size+overlap, end)].count(sub)
+    return n
+
+
+class XMLScanner():
+    """Memory-mapped, bytes-level scanner for dataset XML files.
+
+    The file is never decoded as a whole: FileName attributes, comment markers and NumberEntries trailers are located
+    with bytes searches on the mapped file, and the values are returned as memoryview slices of the mapping.
+    The slices are only valid as long as the scanner is open, use bytes(view) or view.tobytes().decode() to keep them.
+
+    Args:
+        path (`str`): Path to the dataset XML file
+
+    Example:
+        with XMLScanner("RunII_106X_v2/SM/UL18/TTToSemiLeptonic_CP5_powheg-pythia8_Summer20UL18_v2.xml") as scanner:
+            for status, filename in scanner.iter_filenames():
+                ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap cannot map empty files
+            self._map = None
+        self._view = memoryview(self._map if self._map is not None else b"")
+        self._comment_regions = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # slices handed out by the iterators are still alive, the mapping is released together with them
+                pass
+        self._file.close()
+
+    def _comments(self):
+        """Return the sorted list of (start, end, status) of all comments in the file.
+
+        Comments are rare compared to entries, so the status of an entry can be found by walking this list alongside
+        the entries instead of inspecting every line.
+        """
+        if self._comment_regions is None:
+            data = self._map
+            self._comment_regions = []
+            start = data.find(_COMMENT_OPEN) if data is not None else -1
+            while start >= 0:
+                end = data.find(_COMMENT_CLOSE, start)
+                if end < 0:
+                    end = len(data)
+                head = data[start+len(_COMMENT_OPEN):start+len(_COMMENT_OPEN)+_COMMENT_HEAD_LENGTH]
+                if b"EMPTY" in head:
+                    status = STATUS_EMPTY
+                elif b"BAD" in head:
+                    status = STATUS_BAD
+                else:
+                    status = STATUS_COMMENTED
+                self._comment_regions.append((start, end, status))
+                start = data.find(_COMMENT_OPEN, end)
+        return self._comment_regions
+
+    def iter_filenames(self):
+        """Yield (status, memoryview) for every FileName attribute in the file.
+
+        The status is one of STATUS_ACTIVE, STATUS_EMPTY, STATUS_BAD or STATUS_COMMENTED and is determined by the
+        comment enclosing the FileName attribute, if any.
+        """
+        data = self._map
+        if data is None:
+            return
+        view = self._view
+        comments = self._comments() + [(len(data), len(data), None)]
+        comment_index = 0
+        comment_start, comment_end, comment_status = comments[0]
+        pos = data.find(_FILENAME_TAG)
+        while pos >= 0:
+            start = pos + len(_FILENAME_TAG)
+            end = data.find(b'"', start)
+            if end < 0:
+                break
+            while pos > comment_end:
+                comment_index += 1
+                comment_start, comment_end, comment_status = comments[comment_index]
+            yield (comment_status if pos > comment_start else STATUS_ACTIVE), view[start:end]
+            pos = data.find(_FILENAME_TAG, end)
+
+    def count_statuses(self):
+        """Return a dict with the number of entries per status without iterating over the entries."""
+        counts = {status: 0 for status in STATUSES}
+        data = self._map
+        if data is None:
+            return counts
+        n_commented = 0
+        for start, end, status in self._comments():
+            n = _count(data, _FILENAME_TAG, start, end)
+            counts[status] += n
+            n_commented += n
+        counts[STATUS_ACTIVE] = _count(data, _FILENAME_TAG, 0, len(data)) - n_commented
+        return counts
+
+    def iter_number_entries(self):
+        """Yield (method, memoryview) for every NumberEntries comment in the file.
+
+        The method is the bytes value of the Method attribute (e.g. b"fast" or b"weights"), or b"" if not given.
+        """
+        data = self._map
+        if data is None:
+            return
+        view = self._view
+        pos = data.find(_NUMBERENTRIES_TAG)
+        while pos >= 0:
+            start = pos + len(_NUMBERENTRIES_TAG)
+            end = data.find(b'"', start)
+            if end < 0:
+                break
+            comment_end = data.find(b"-->", end)
+            if comment_end < 0:
+                comment_end = len(data)
+            method_pos = data.find(_METHOD_TAG, end, comment_end)
+            method = b""
+            if method_pos >= 0:
+                words = data[method_pos+len(_METHOD_TAG):comment_end].split(b"/")[0].split()
+                method = words[0] if len(words) > 0 else b""
+            yield method, view[start:end]
+            pos = data.find(_NUMBERENTRIES_TAG, end)
+
+
+def iter_entries(path, statuses=None, normaliser=None):
+    """Yield an XMLEntry with decoded filename and status for every FileName in a dataset XML file.
+
+    Args:
+        path (`str`): Path to the dataset XML file
+        statuses (:obj:`list` of `str`): Only yield entries with these statuses. All entries are yielded if None.
+        normaliser (`callable`): Applied to every filename, e.g. a PathNormaliser. The filenames are returned as
+            written in the XML if None.
+    """
+    with XMLScanner(path) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if statuses is None or status in statuses:
+                filename = filename.tobytes().decode()
+                yield XMLEntry(filename if normaliser is None else normaliser(filename), status)
+
+
+def iter_active_filenames(path, normaliser=None):
+    """Yield the decoded filenames of all active (not commented out) entries of a dataset XML file, see iter_entries."""
+    for entry in iter_entries(path, statuses=[STATUS_ACTIVE], normaliser=normaliser):
+        yield entry.filename
+
+
+def parse_number_entries(text):
+    """Return the number of a NumberEntries value, e.g. 2789243 or 1.04665737783e+11.
+
+    Samples merged from several parts may give the sum of the parts, e.g. 2789243+158145722, which is added up.
+
+    Raises:
+        ValueError: If the value is not a number or a sum of numbers
+    """
+    terms = _NUMBERENTRIES_SUM.split(text.strip())
+    try:
+        return sum(float(term) for term in terms) if len(terms) > 1 else float(terms[0])
+    except ValueError:
+        raise ValueError("ERROR DatasetXMLHelper::NumberEntries \"" + text + "\" is neither a number nor a sum of numbers")
+
+
+def read_number_entries(path):
+    """Return the list of NumberEntries trailers of a dataset XML file, with sums of parts added up (see
+    parse_number_entries). Empty values (NumberEntries="") are placeholders and skipped.
+
+    Raises:
+        ValueError: If a value is malformed
+    """
+    number_entries = []
+    with XMLScanner(path) as scanner:
+        for method, value in scanner.iter_number_entries():
+            text = value.tobytes().decode()
+            if text.strip() == "":
+                continue
+            try:
+                number = parse_number_entries(text)
+            except ValueError as error:
+                raise ValueError(str(error) + " in " + path)
+            number_entries.append(NumberEntries(number, method.decode()))
+    return number_entries
+
+
+def format_entry(filename, status=STATUS_ACTIVE):
+    """Return the XML line (without newline) of an entry, in the format used throughout the repository."""
+    line = '<In FileName="'+filename+'" Lumi="0.0"/>'
+    if status == STATUS_EMPTY:
+        return "<!--EMPTY "+line+" -->"
+    if status == STATUS_BAD:
+        return "<!-- BAD "+line+" -->"
+    if status == STATUS_COMMENTED:
+        return "<!--"+line+"-->"
+    return line
+
+
+def format_number_entries(value, method):
+    """Return the NumberEntries trailer line (without newline) of a dataset XML, e.g. for the "fast" or "weights" method."""
+    return '<!-- < NumberEntries="'+str(value)+'" Method='+method+' /> -->'
+
+
+def write_xml(path, filenames, number_entries=None):
+    """Write a dataset XML with one active entry per filename, followed by optional NumberEntries trailers.
+
+    Args:
+        path (`str`): The output file
+        filenames (:obj:`list` of `str`): The ntuple paths
+        number_entries (:obj:`list` of :obj:`NumberEntries`): Trailers appended after the entries
+    """
+    lines = [format_entry(filename) for filename in filenames]
+    lines += [format_number_entries(n.value, n.method) for n in (number_entries or [])]
+    atomic_write(path, "".join(line+"\n" for line in lines).encode())
+
+
+def atomic_write(path, data):
+    """Replace the content of a file by data (bytes) atomically.
+
+    The data is written to a temporary file in the same directory, which is then renamed to path, so readers never
+    see a partially written file. The permissions of an existing file are kept.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.path.exists(path):
+        mode = os.stat(path).st_mode & 0o7777
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="."+os.path.basename(path)+".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="DatasetXMLHelper: list the ntuples stored in dataset XML files.")
+
+    parser.add_argument("xmls", nargs="+", help="dataset XML file(s) to read.")
+    parser.add_argument("--status", nargs="+", default=[STATUS_ACTIVE], choices=STATUSES, help="only list entries with the given status(es) (default: %(default)s).")
+    parser.add_argument("--show-status", action="store_true", help="prefix each filename with its status.")
+
+    args = parser.parse_args()
+
+    for xml in args.xmls:
+        for entry in iter_entries(xml, statuses=args.status):
+            print(entry.status+" "+entry.filename if args.show_status else entry.filename)
@@ -0,0 +1,134 @@
+import os
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from DatasetXMLHelper import UHH2_DATASETS_BASE, STATUS_ACTIVE, XMLScanner, filename_key, find_xml_files
+
+
+Duplicate = namedtuple("Duplicate", ["filename", "xmls"])
+
+N_BUCKET_BITS = 6
+
+
+def _bucketed_keys(xml, base=UHH2_DATASETS_BASE):
+    """Return the keys of all active entries of an XML, split into 2**N_BUCKET_BITS arrays by their highest bits."""
+    buckets = [array("Q") for _ in range(1 << N_BUCKET_BITS)]
+    shift = 64 - N_BUCKET_BITS
+    with XMLScanner(os.path.join(base, xml)) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if status == STATUS_ACTIVE:
+                key = filename_key(filename)
+                buckets[key >> shift].append(key)
+    return buckets
+
+
+def _filenames_for_keys(xml, keys, base=UHH2_DATASETS_BASE):
+    """Return a dict key -> filename for the active entries of an XML whose key is in keys."""
+    filenames = {}
+    with XMLScanner(os.path.join(base, xml)) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if status == STATUS_ACTIVE:
+                filename = filename.tobytes().decode()
+                key = filename_key(filename)
+                if key in keys:
+                    filenames[key] = filename
+    return filenames
+
+
+def find_duplicates(xmls, base=UHH2_DATASETS_BASE, workers=None):
+    """Find ntuples that are listed as active entries more than once, in the same or in different XMLs.
+
+    Only 64-bit keys of the normalised paths and the index of their XML are kept while streaming the entries,
+    split into buckets by the highest key bits so that at most one bucket is held in a dict at a time.
+    The paths of the duplicated keys are recovered afterwards by rescanning only the XMLs involved.
+
+    Args:
+        xmls (:obj:`list` of `str`): Dataset XMLs, relative to base
+        base (`str`): The UHH2-datasets directory
+        workers (`int`): Number of worker processes reading the XMLs (default: number of CPUs)
+
+    Returns:
+        :obj:`list` of :obj:`Duplicate`: The duplicated ntuples with the XMLs listing them, once per occurrence.
+    """
+    xmls = list(xmls)
+    n_buckets = 1 << N_BUCKET_BITS
+    bucket_keys = [array("Q") for _ in range(n_buckets)]
+    bucket_xmls = [array("I") for _ in range(n_buckets)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(xmls)//(4*(workers or os.cpu_count() or 1)))
+        for xml_index, buckets in enumerate(executor.map(_bucketed_keys, xmls, [base]*len(xmls), chunksize=chunksize)):
+            for bucket, keys in enumerate(buckets):
+                bucket_keys[bucket].extend(keys)
+                bucket_xmls[bucket].extend(array("I", [xml_index])*len(keys))
+
+    duplicates = {}
+    for bucket in range(n_buckets):
+        first_seen = {}
+        for key, xml_index in zip(bucket_keys[bucket], bucket_xmls[bucket]):
+            if key in first_seen:
+                duplicates.setdefault(key, [first_seen[key]]).append(xml_index)
+            else:
+                first_seen[key] = xml_index
+        bucket_keys[bucket] = bucket_xmls[bucket] = None
+
+    keys_per_xml = {}
+    for key, xml_indices in duplicates.items():
+        for xml_index in set(xml_indices):
+            keys_per_xml.setdefault(xml_index, set()).add(key)
+    filenames = {}
+    for xml_index, keys in keys_per_xml.items():
+        filenames.update(_filenames_for_keys(xmls[xml_index], keys, base))
+
+    return sorted(Duplicate(filenames[key], [xmls[i] for i in xml_indices]) for key, xml_indices in duplicates.items())
+
+
+def group_by_xmls(duplicates):
+    """Return a dict (xml, ...) -> number of duplicated ntuples, for a compact overview of which XMLs overlap."""
+    groups = {}
+    for duplicate in duplicates:
+        xmls = tuple(sorted(set(duplicate.xmls)))
+        groups[xmls] = groups.get(xmls, 0) + 1
+    return groups
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Find ntuples listed more than once in the dataset XMLs, which would double-count events.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs to check (default: all XMLs of the selected campaigns).")
+    parser.add_argument("--campaign", nargs="*", default=None, help="campaign directories to check, e.g. Run3_130X_v1 (default: all).")
+    parser.add_argument("--per-campaign", action="store_true", help="only look for duplicates within each campaign, not across campaigns.")
+    parser.add_argument("--list", action="store_true", help="list every duplicated ntuple instead of the number of duplicates per group of XMLs.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes reading the XMLs (default: number of CPUs).")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if any duplicate is found.")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    xmls = args.xmls if len(args.xmls) > 0 else list(find_xml_files(campaigns=args.campaign))
+    if args.per_campaign:
+        campaigns = {}
+        for xml in xmls:
+            campaigns.setdefault(os.path.normpath(xml).split(os.sep, 1)[0], []).append(xml)
+        duplicates = []
+        for campaign_xmls in campaigns.values():
+            duplicates += find_duplicates(campaign_xmls, workers=args.workers)
+    else:
+        duplicates = find_duplicates(xmls, workers=args.workers)
+
+    if args.list:
+        for duplicate in duplicates:
+            print(duplicate.filename)
+            for xml in duplicate.xmls:
+                print("    "+xml)
+    else:
+        for xmls_group, n in sorted(group_by_xmls(duplicates).items(), key=lambda x: -x[1]):
+            print("%d duplicated ntuple(s) in:"%n)
+            for xml in xmls_group:
+                print("    "+xml)
+    print("")
+    print("%d duplicated ntuple(s) in %d XML(s), done in %.2f s"%(len(duplicates), len(set(x for d in duplicates for x in d.xmls)), time.perf_counter()-start))
+    if args.throw and len(duplicates) > 0:
+        raise ValueError("%d ntuple(s) are listed more than once"%len(duplicates))
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import shutil
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from DatasetXMLHelper import UHH2_DATASETS_BASE, STATUS_ACTIVE, XMLScanner, atomic_write, filename_key, find_xml_files, iter_active_filenames, normalise_filename
+
+
+XMLDigest = namedtuple("XMLDigest", ["xml", "size", "content_hash", "entries_hash", "keys"])
+NearDuplicate = namedtuple("NearDuplicate", ["xml_a", "xml_b", "n_a", "n_b", "n_common"])
+EntryDifference = namedtuple("EntryDifference", ["only_a", "only_b", "n_common"])
+
+SKETCH_SIZE = 64
+
+
+def digest_xml(xml, base=UHH2_DATASETS_BASE):
+    """Return the XMLDigest of a dataset XML.
+
+    The content hash identifies byte-identical files, the entries hash identical sets of active entries (independent of
+    their order, format and path normalisation). The keys are the sorted 64-bit keys of the active entries, see
+    filename_key, which take 8 bytes per entry.
+    """
+    path = os.path.join(base, xml)
+    with open(path, "rb") as f:
+        content_hash = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    keys = set()
+    with XMLScanner(path) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if status == STATUS_ACTIVE:
+                keys.add(filename_key(filename))
+    keys = array("Q", sorted(keys))
+    entries_hash = hashlib.blake2b(keys.tobytes(), digest_size=16).hexdigest()
+    return XMLDigest(xml, os.path.getsize(path), content_hash, entries_hash, keys)
+
+
+def digest_xmls(xmls, base=UHH2_DATASETS_BASE, workers=None):
+    """Return the XMLDigests of many XMLs, computed in parallel worker processes."""
+    xmls = list(xmls)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(xmls)//(4*(workers or os.cpu_count() or 1)))
+        return list(executor.map(digest_xml, xmls, [base]*len(xmls), chunksize=chunksize))
+
+
+def group_by(digests, field):
+    """Return the groups (lists of XMLDigests with more than one member) of digests with equal field, largest files first."""
+    groups = {}
+    for digest in digests:
+        groups.setdefault(getattr(digest, field), []).append(digest)
+    return sorted((group for group in groups.values() if len(group) > 1), key=lambda group: (-group[0].size*(len(group) - 1), group[0].xml))
+
+
+def find_near_duplicates(digests, min_overlap=0.8, sketch_size=SKETCH_SIZE):
+    """Return the NearDuplicates among XMLs with different entry sets, sorted by decreasing overlap.
+
+    The overlap of two XMLs is the fraction of the entries of the smaller one that are also in the larger one, so
+    near-identical XMLs as well as XMLs contained in others (e.g. a part of a sample) are found. Candidate pairs are
+    found with a bottom-k sketch of every XML: the sketch_size smallest keys of an XML are a random sample of its
+    entries, so an XML B overlapping with A by a fraction f contains about f*sketch_size of them. Only the candidates
+    are compared exactly. XMLs with identical entry sets are represented by their first member.
+    """
+    representatives = {}
+    for digest in digests:
+        if len(digest.keys) > 0:
+            representatives.setdefault(digest.entries_hash, digest)
+    representatives = list(representatives.values())
+    sketch_index = {}
+    for i, digest in enumerate(representatives):
+        for key in digest.keys[:sketch_size]:
+            sketch_index.setdefault(key, []).append(i)
+    near_duplicates = []
+    for j, digest_b in enumerate(representatives):
+        hits = {}
+        for key in digest_b.keys:
+            for i in sketch_index.get(key, ()):
+                if i != j:
+                    hits[i] = hits.get(i, 0) + 1
+        for i, n_hits in hits.items():
+            digest_a = representatives[i]
+            # every pair is seen from both sides, only compare it from the side of the smaller XML
+            if (len(digest_a.keys), i) > (len(digest_b.keys), j) or n_hits < min_overlap*min(sketch_size, len(digest_a.keys))/2:
+                continue
+            n_common = len(set(digest_a.keys).intersection(digest_b.keys))
+            if n_common >= min_overlap*len(digest_a.keys):
+                a, b = sorted([digest_a, digest_b], key=lambda digest: digest.xml)
+                near_duplicates.append(NearDuplicate(a.xml, b.xml, len(a.keys), len(b.keys), n_common))
+    return sorted(near_duplicates, key=lambda d: (-d.n_common/min(d.n_a, d.n_b), d.xml_a, d.xml_b))
+
+
+def entry_difference(xml_a, xml_b, base=UHH2_DATASETS_BASE):
+    """Return the EntryDifference of the active entries (normalised paths) of two XMLs."""
+    a = set(normalise_filename(filename) for filename in iter_active_filenames(os.path.join(base, xml_a)))
+    b = set(normalise_filename(filename) for filename in iter_active_filenames(os.path.join(base, xml_b)))
+    return EntryDifference(sorted(a - b), sorted(b - a), len(a & b))
+
+
+class ContentStore():
+    """Content-addressed store of dataset XMLs with a reference index.
+
+    Every distinct XML content is stored once as objects/<hash[:2]>/<hash[2:]>.xml, and index.json maps the XML paths
+    of the repository to their content hash. Consumers resolve XMLs through the index and load shared file lists only
+    once, e.g. identical signal samples of several campaigns.
+
+    Args:
+        path (`str`): The store directory
+
+    Example:
+        store = ContentStore("xml_store")
+        filenames = store.load_filenames("RunII_102X_v2/.../sample.xml")
+    """
+
+    INDEX = "index.json"
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self._filenames = {}
+        index_path = os.path.join(path, self.INDEX)
+        if os.path.isfile(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+
+    def object_path(self, content_hash):
+        return os.path.join(self.path, "objects", content_hash[:2], content_hash[2:] + ".xml")
+
+    def add(self, xml, content_hash, base=UHH2_DATASETS_BASE):
+        """Add an XML with the given content hash (see digest_xml), its content is only copied if not stored yet."""
+        object_path = self.object_path(content_hash)
+        if not os.path.isfile(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            shutil.copyfile(os.path.join(base, xml), object_path)
+        self.index[xml] = content_hash
+
+    def write_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        atomic_write(os.path.join(self.path, self.INDEX), json.dumps(self.index, indent=1, sort_keys=True).encode())
+
+    def resolve(self, xml):
+        """Return the path of the stored content of an XML of the index."""
+        if not xml in self.index:
+            raise KeyError("ERROR ContentStore::XML \"" + str(xml) + "\" is not in the index of " + self.path)
+        return self.object_path(self.index[xml])
+
+    def load_filenames(self, xml):
+        """Return the active filenames of an XML of the index as tuple, read only once per distinct content."""
+        content_hash = self.index.get(xml)
+        if not content_hash in self._filenames:
+            self._filenames[content_hash] = tuple(iter_active_filenames(self.resolve(xml)))
+        return self._filenames[content_hash]
+
+
+def build_store(digests, path, base=UHH2_DATASETS_BASE):
+    """Add the XMLs of the digests to the ContentStore at path, write its index and return the store."""
+    store = ContentStore(path)
+    for digest in digests:
+        store.add(digest.xml, digest.content_hash, base)
+    store.write_index()
+    return store
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Find identical and near-identical dataset XMLs, e.g. copies across campaigns, and optionally build a content-addressed store of them.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs relative to the repository (default: all XMLs of the selected campaigns).")
+    parser.add_argument("--campaign", nargs="*", default=None, help="campaign directories, e.g. RunII_102X_v1 RunII_102X_v2 (default: all).")
+    parser.add_argument("--min-overlap", type=float, default=0.8, help="minimal fraction of the active entries of the smaller XML that are also in the other one for near-duplicates (default: %(default)s).")
+    parser.add_argument("--show-differences", action="store_true", help="list the entries that differ between near-duplicates.")
+    parser.add_argument("--store", default=None, help="directory of a content-addressed store to add all XMLs to, with a reference index.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes reading the XMLs (default: number of CPUs).")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    xmls = args.xmls if len(args.xmls) > 0 else list(find_xml_files(campaigns=args.campaign))
+    digests = digest_xmls(xmls, workers=args.workers)
+
+    identical = group_by(digests, "content_hash")
+    print("%d group(s) of byte-identical XMLs, %.1f MB in redundant copies:"%(len(identical), sum(g[0].size*(len(g) - 1) for g in identical)/1e6))
+    for group in identical:
+        print("  %s: %d copies of %.1f kB"%(group[0].content_hash[:12], len(group), group[0].size/1e3))
+        for digest in group:
+            print("      " + digest.xml)
+
+    equivalent = [g for g in group_by(digests, "entries_hash") if len(g[0].keys) > 0 and len(set(d.content_hash for d in g)) > 1]
+    print("")
+    print("%d group(s) of XMLs with the same active entries but different content (order, format or comments):"%len(equivalent))
+    for group in equivalent:
+        print("  %d XMLs with %d entries:"%(len(group), len(group[0].keys)))
+        for digest in group:
+            print("      " + digest.xml)
+
+    near_duplicates = find_near_duplicates(digests, args.min_overlap)
+    print("")
+    print("%d pair(s) of near-duplicate XMLs (overlap >= %g):"%(len(near_duplicates), args.min_overlap))
+    for near_duplicate in near_duplicates:
+        print("  %d common, %d only in %s, %d only in %s"%(near_duplicate.n_common,
+              near_duplicate.n_a - near_duplicate.n_common, near_duplicate.xml_a, near_duplicate.n_b - near_duplicate.n_common, near_duplicate.xml_b))
+        if args.show_differences:
+            difference = entry_difference(near_duplicate.xml_a, near_duplicate.xml_b)
+            for filename in difference.only_a:
+                print("      - " + filename)
+            for filename in difference.only_b:
+                print("      + " + filename)
+
+    if args.store is not None:
+        store = build_store(digests, args.store)
+        print("")
+        print("%d XML(s) with %d distinct content(s) in %s"%(len(store.index), len(set(store.index.values())), args.store))
+    print("")
+    print("%d XML(s) done in %.2f s"%(len(digests), time.perf_counter()-start))
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict, namedtuple
+
+from DatasetXMLHelper import normalise_filename
+
+
+FileMetadata = namedtuple("FileMetadata", ["size", "entries", "mtime"], defaults=(None, None, None))
+
+CacheStats = namedtuple("CacheStats", ["memory_hits", "disk_hits", "misses", "expired"])
+
+METADATA_FIELDS = list(FileMetadata._fields)
+
+_SQLITE_MAX_VARIABLES = 500
+
+
+def _valid_fields(values, expires, now):
+    """Return the FileMetadata of the values whose expiry is not reached (the others are None), or None if none is left."""
+    values = [value if value is not None and (expiry is None or expiry > now) else None for value, expiry in zip(values, expires)]
+    return FileMetadata(*values) if any(value is not None for value in values) else None
+
+
+class FileMetadataCache():
+    """Persistent per-ntuple metadata cache (size, number of entries, modification time) keyed by normalised FileName.
+
+    Two tiers are used: an in-process LRU dictionary in front of an SQLite file on disk. Every field of an entry carries
+    its own expiry time, so that refreshing one field (e.g. the entries) does not extend the lifetime of the others.
+    Expired fields are returned as None, entries without any valid field are treated as misses. The bulk methods get_many and put_many resolve thousands of
+    paths with a handful of SQL statements, and should be preferred over get and put in loops.
+    Fields that are unknown are stored as None, and put/put_many only overwrite the fields that are given.
+
+    Args:
+        path (`str`): The SQLite file of the on-disk store, or None for an in-memory store that is not persisted
+        capacity (`int`): Maximum number of entries in the in-process LRU
+        ttl (`float`): Default time to live of new entries in seconds, None for entries that never expire
+
+    Example:
+        cache = FileMetadataCache("ntuple_metadata.db", ttl=7*24*3600)
+        cache.put_many({filename: FileMetadata(entries=n) for filename, n in entries.items()})
+        metadata = cache.get_many(filenames)
+    """
+
+    def __init__(self, path=None, capacity=100000, ttl=None):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lru = OrderedDict()
+        self._memory_hits = self._disk_hits = self._misses = self._expired = 0
+        self._db = sqlite3.connect(path if path is not None else ":memory:")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, size INTEGER, entries REAL, mtime REAL, "
+                         "size_expires REAL, entries_expires REAL, mtime_expires REAL)")
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _remember(self, key, values, expires):
+        self._lru[key] = (values, expires)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get(self, filename):
+        """Return the FileMetadata of a file, or None if it is not cached or expired."""
+        return self.get_many([filename]).get(filename)
+
+    def get_many(self, filenames):
+        """Return a dict filename -> FileMetadata for all given files that are cached and not expired."""
+        now = time.time()
+        found = {}
+        missing = {}
+        for filename in filenames:
+            key = normalise_filename(filename)
+            cached = self._lru.get(key)
+            if cached is not None:
+                metadata = _valid_fields(*cached, now)
+                if metadata is not None:
+                    self._lru.move_to_end(key)
+                    self._memory_hits += 1
+                    found[filename] = metadata
+                    continue
+                del self._lru[key]
+            missing.setdefault(key, []).append(filename)
+
+        keys = list(missing)
+        for start in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+            chunk = keys[start:start+_SQLITE_MAX_VARIABLES]
+            rows = self._db.execute("SELECT key, size, entries, mtime, size_expires, entries_expires, mtime_expires FROM files WHERE key IN (%s)"%",".join("?"*len(chunk)), chunk)
+            for row in rows:
+                key, values, expires = row[0], row[1:4], row[4:7]
+                filenames_of_key = missing.pop(key)
+                metadata = _valid_fields(values, expires, now)
+                if metadata is None:
+                    self._expired += len(filenames_of_key)
+                    continue
+                self._remember(key, values, expires)
+                self._disk_hits += len(filenames_of_key)
+                for filename in filenames_of_key:
+                    found[filename] = metadata
+        self._misses += sum(len(f) for f in missing.values())
+        return found
+
+    def put(self, filename, metadata, ttl=None):
+        self.put_many({filename: metadata}, ttl)
+
+    def put_many(self, metadata, ttl=None):
+        """Store the FileMetadata of many files at once.
+
+        Args:
+            metadata (:obj:`dict`): filename -> FileMetadata, None fields keep the value and the expiry already stored
+            ttl (`float`): Time to live of the given fields in seconds, the default of the cache is used if None
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+        rows = [(normalise_filename(filename), m.size, m.entries, m.mtime) + tuple(expires if value is not None else None for value in m)
+                for filename, m in metadata.items()]
+        self._db.executemany(
+            "INSERT INTO files (key, size, entries, mtime, size_expires, entries_expires, mtime_expires) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET " + ", ".join(
+                "{0}=COALESCE(excluded.{0}, {0}), {0}_expires=CASE WHEN excluded.{0} IS NULL THEN {0}_expires ELSE excluded.{0}_expires END".format(field)
+                for field in METADATA_FIELDS),
+            rows)
+        self._db.commit()
+        # merged values are only known to the database, so drop the stale in-process copies
+        for row in rows:
+            self._lru.pop(row[0], None)
+
+    def get_field(self, filenames, field):
+        """Return a dict normalised filename -> value of one metadata field, for the cached files where it is known.
+
+        The result can be used directly as per-file cost table, e.g. in JobSplitter or NodeAssignment.
+        """
+        table = {}
+        for filename, metadata in self.get_many(filenames).items():
+            value = getattr(metadata, field)
+            if value is not None:
+                table[normalise_filename(filename)] = value
+        return table
+
+    def purge(self):
+        """Remove all entries without any valid field from the on-disk store and return their number."""
+        now = time.time()
+        for field in METADATA_FIELDS:
+            self._db.execute("UPDATE files SET {0}=NULL, {0}_expires=NULL WHERE {0}_expires IS NOT NULL AND {0}_expires <= ?".format(field), (now,))
+        cursor = self._db.execute("DELETE FROM files WHERE " + " AND ".join("%s IS NULL"%field for field in METADATA_FIELDS))
+        self._db.commit()
+        self._lru.clear()
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def stats(self):
+        return CacheStats(self._memory_hits, self._disk_hits, self._misses, self._expired)
+
+    def hit_rate(self):
+        """Return the fraction of lookups served from memory or disk."""
+        hits = self._memory_hits + self._disk_hits
+        lookups = hits + self._misses + self._expired
+        return hits/lookups if lookups > 0 else 0.0
+
+
+def add_cache_arguments(parser, default_ttl=None):
+    """Add the --cache and --cache-ttl options shared by the tools using a FileMetadataCache to an argparse parser."""
+    parser.add_argument("--cache", default=None, help="per-file metadata cache (SQLite file) to read and fill, see FileMetadataCache.py.")
+    parser.add_argument("--cache-ttl", type=float, default=default_ttl, help="time to live of new cache entries in seconds (default: %s)."%("never expire" if default_ttl is None else "%g"%default_ttl))
+
+
+def open_cache(args):
+    """Return the FileMetadataCache selected by the options of add_cache_arguments, or None."""
+    if args.cache is None:
+        return None
+    return FileMetadataCache(args.cache, ttl=args.cache_ttl)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    from JobSplitter import read_costs
+    parser = argparse.ArgumentParser(description="Inspect and fill the per-file metadata cache used by the dataset tools.")
+
+    parser.add_argument("cache", help="the cache file (SQLite).")
+    parser.add_argument("--import-table", default=None, help="table of 'filename value' lines (or JSON) to import into the cache.")
+    parser.add_argument("--field", choices=METADATA_FIELDS, default="entries", help="metadata field of the imported values (default: %(default)s).")
+    parser.add_argument("--ttl", type=float, default=None, help="time to live of the imported entries in seconds (default: never expire).")
+    parser.add_argument("--purge", action="store_true", help="remove expired entries.")
+
+    args = parser.parse_args()
+
+    with FileMetadataCache(args.cache, ttl=args.ttl) as cache:
+        if args.import_table is not None:
+            table = read_costs(args.import_table)
+            cache.put_many({filename: FileMetadata(**{args.field: value}) for filename, value in table.items()})
+            print("imported %d %s value(s)"%(len(table), args.field))
+        if args.purge:
+            print("purged %d expired entries"%cache.purge())
+        print("%s: %d entries, %.1f MB"%(args.cache, len(cache), os.path.getsize(args.cache)/1e6))
@@ -0,0 +1,191 @@
+import heapq
+import json
+import os
+
+from DatasetXMLHelper import SITE_PREFIXES, PathNormaliser, iter_active_filenames, normalise_filename, parse_prefix_rewrites, write_xml
+from FileMetadataCache import METADATA_FIELDS, add_cache_arguments, open_cache
+
+
+def read_costs(path):
+    """Read a per-file cost table, e.g. the number of entries per ntuple.
+
+    The file is either a JSON object {filename: cost} or a text file with one "filename cost" pair per line.
+    The filenames are normalised, so they can be looked up with normalise_filename.
+    """
+    with open(path) as f:
+        if path.endswith(".json"):
+            table = json.load(f)
+        else:
+            table = {}
+            for line in f:
+                fields = line.split()
+                if len(fields) == 0 or fields[0].startswith("#"):
+                    continue
+                table[fields[0]] = fields[1]
+    return {normalise_filename(filename): float(cost) for filename, cost in table.items()}
+
+
+def lookup_costs(filenames, costs):
+    """Return the list of costs of the filenames.
+
+    Args:
+        filenames (:obj:`list` of `str`): The ntuple paths
+        costs (:obj:`dict` or `callable`): Per-file cost, either a dict with normalised filenames as keys or a function
+            of the filename. Files missing from the dict get the mean cost of the known files.
+    """
+    if callable(costs):
+        return [float(costs(filename)) for filename in filenames]
+    values = [costs.get(normalise_filename(filename)) for filename in filenames]
+    known = [value for value in values if value is not None]
+    default = sum(known)/len(known) if len(known) > 0 else 1.0
+    return [default if value is None else value for value in values]
+
+
+def split_by_count(filenames, n_shards):
+    """Split filenames into n_shards contiguous shards whose number of files differs by at most one."""
+    n_shards = max(1, min(n_shards, len(filenames)))
+    size, remainder = divmod(len(filenames), n_shards)
+    shards = []
+    start = 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < remainder else 0)
+        shards.append(filenames[start:end])
+        start = end
+    return shards
+
+
+def split_by_cost(filenames, n_shards, costs):
+    """Split filenames into n_shards contiguous shards of approximately equal total cost.
+
+    Each shard is filled in file order until its cost is closest to the remaining cost divided by the number of
+    remaining shards, while leaving at least one file for every remaining shard.
+    """
+    file_costs = lookup_costs(filenames, costs)
+    n_shards = max(1, min(n_shards, len(filenames)))
+    shards = []
+    remaining = sum(file_costs)
+    start = 0
+    for i in range(n_shards):
+        remaining_shards = n_shards - i
+        if remaining_shards == 1:
+            shards.append(filenames[start:])
+            break
+        target = remaining/remaining_shards
+        end = start + 1
+        shard_cost = file_costs[start]
+        max_end = len(filenames) - (remaining_shards - 1)
+        while end < max_end and shard_cost + file_costs[end]/2 <= target:
+            shard_cost += file_costs[end]
+            end += 1
+        shards.append(filenames[start:end])
+        remaining -= shard_cost
+        start = end
+    return shards
+
+
+def split_lpt(filenames, n_shards, costs):
+    """Split filenames into n_shards shards of approximately equal total cost with longest-processing-time-first packing.
+
+    The files are assigned in order of decreasing cost to the shard with the currently lowest total cost, which
+    balances skewed cost distributions much better than contiguous shards. Ties are broken by file and shard index,
+    and the files of each shard are returned in their original order to keep the storage access sequential.
+    """
+    file_costs = lookup_costs(filenames, costs)
+    n_shards = max(1, min(n_shards, len(filenames)))
+    heap = [(0.0, shard) for shard in range(n_shards)]
+    assignment = [[] for _ in range(n_shards)]
+    for index in sorted(range(len(filenames)), key=lambda i: (-file_costs[i], i)):
+        load, shard = heapq.heappop(heap)
+        assignment[shard].append(index)
+        heapq.heappush(heap, (load + file_costs[index], shard))
+    return [[filenames[index] for index in sorted(indices)] for indices in assignment]
+
+
+SPLIT_METHODS = {
+    "contiguous": split_by_cost,
+    "lpt": split_lpt,
+}
+
+
+def split_filenames(filenames, n_shards, costs=None, method="lpt"):
+    """Split a list of ntuples into n_shards balanced shards.
+
+    The result only depends on the inputs, so repeated runs give identical shards.
+    If there are fewer files than shards, one shard per file is returned.
+
+    Args:
+        filenames (:obj:`list` of `str`): The ntuple paths
+        n_shards (`int`): The number of shards
+        costs (:obj:`dict` or `callable`): Per-file cost, e.g. the number of entries, see lookup_costs.
+            The shards are contiguous and balanced by file count if None.
+        method (`str`): How to balance by cost, "lpt" (see split_lpt) or "contiguous" (see split_by_cost)
+    """
+    filenames = list(filenames)
+    if len(filenames) == 0:
+        return []
+    if costs is None:
+        return split_by_count(filenames, n_shards)
+    return SPLIT_METHODS[method](filenames, n_shards, costs)
+
+
+def split_xml(xml, n_shards, costs=None, method="lpt"):
+    """Return the shards of the active entries of a dataset XML, EMPTY, BAD and commented-out entries are skipped."""
+    return split_filenames(iter_active_filenames(xml), n_shards, costs, method)
+
+
+def shard_path(xml, index, n_shards, output_dir=None):
+    """Return the path of a shard of an XML, i.e. <output_dir>/<name>_<index>.xml with a zero-padded index."""
+    stem = os.path.splitext(os.path.basename(xml))[0]
+    width = len(str(n_shards - 1))
+    return os.path.join(output_dir if output_dir is not None else os.path.dirname(xml), "{}_{:0{}d}.xml".format(stem, index, width))
+
+
+def write_shards(xml, shards, output_dir=None, normaliser=None):
+    """Write the shards of an XML as XML fragments and return their paths.
+
+    The filenames are passed through normaliser (e.g. a PathNormaliser pointing to an xrootd redirector) if given.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for index, shard in enumerate(shards):
+        path = shard_path(xml, index, len(shards), output_dir)
+        write_xml(path, shard if normaliser is None else [normaliser(filename) for filename in shard])
+        paths.append(path)
+    return paths
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Split dataset XMLs into balanced XML fragments for batch jobs. EMPTY and BAD entries are skipped.")
+
+    parser.add_argument("xmls", nargs="+", help="dataset XMLs to split, or directories whose XMLs are all split (e.g. RunII_106X_v2/SM/UL18).")
+    parser.add_argument("-n", "--n-shards", type=int, required=True, help="number of fragments per XML.")
+    parser.add_argument("-o", "--output-dir", default=None, help="directory to write the fragments to, required unless --dry-run is given.")
+    parser.add_argument("--costs", "--entries-cache", default=None, help="per-file cost table, e.g. the number of entries per ntuple (JSON or 'filename cost' lines), to balance the fragments by instead of by file count. Takes precedence over --cache.")
+    parser.add_argument("--method", choices=sorted(SPLIT_METHODS), default="lpt", help="how to balance the fragments by cost (default: %(default)s).")
+    parser.add_argument("--cost-field", choices=METADATA_FIELDS, default="entries", help="metadata field used as cost with --cache (default: %(default)s).")
+    parser.add_argument("--rewrite", nargs="*", default=None, help="normalise the paths in the fragments and apply prefix rewrite(s) old=new, or one of: %s."%", ".join(sorted(SITE_PREFIXES)))
+    parser.add_argument("--dry-run", action="store_true", help="only print the number of files per fragment.")
+    add_cache_arguments(parser)
+
+    args = parser.parse_args()
+    if args.output_dir is None and not args.dry_run:
+        parser.error("-o/--output-dir is required unless --dry-run is given")
+
+    costs = read_costs(args.costs) if args.costs is not None else None
+    cache = open_cache(args)
+    xmls = []
+    for path in args.xmls:
+        if os.path.isdir(path):
+            xmls += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".xml"))
+        else:
+            xmls.append(path)
+    for xml in xmls:
+        filenames = list(iter_active_filenames(xml))
+        xml_costs = costs if cache is None else {**cache.get_field(filenames, args.cost_field), **(costs or {})} or None
+        shards = split_filenames(filenames, args.n_shards, xml_costs, args.method)
+        if args.dry_run:
+            print("{}: {}".format(xml, " ".join(str(len(shard)) for shard in shards)))
+        else:
+            write_shards(xml, shards, args.output_dir, None if args.rewrite is None else PathNormaliser(parse_prefix_rewrites(args.rewrite)))
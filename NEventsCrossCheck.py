@@ -0,0 +1,141 @@
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from CrossSectionHelper import MCSampleValuesHelper, UHH2_DATASETS_BASE, collect_xml_references
+from DatasetXMLHelper import read_number_entries
+
+
+XMLTotals = namedtuple("XMLTotals", ["fast", "weights"])
+NEventsMismatch = namedtuple("NEventsMismatch", ["process", "energy", "year", "nevt", "xml", "fast", "weights", "method", "rel_diff"])
+
+
+def read_xml_totals(xml, base=UHH2_DATASETS_BASE):
+    """Return the XMLTotals of a dataset XML, i.e. the list of NumberEntries values per method in file order.
+
+    XMLs that cannot be read are returned with empty lists.
+    """
+    totals = XMLTotals([], [])
+    try:
+        number_entries = read_number_entries(os.path.join(base, xml))
+    except OSError:
+        return totals
+    for number_entry in number_entries:
+        if number_entry.method in XMLTotals._fields:
+            getattr(totals, number_entry.method).append(number_entry.value)
+    return totals
+
+
+def total_candidates(values):
+    """Return the possible totals of a list of NumberEntries values of the same method.
+
+    Updated counts are appended to the end of the file, so the last value is usually the total. Samples merged from
+    several parts (e.g. ver1 and ver2 of Run2016B) instead list one value per part, so their sum is a candidate as well.
+    """
+    if len(values) == 0:
+        return []
+    if len(values) == 1:
+        return [values[0]]
+    return [values[-1], sum(values)]
+
+
+def read_all_xml_totals(xmls, base=UHH2_DATASETS_BASE, workers=None):
+    """Read the XMLTotals of many XMLs in one parallel pass. Returns a dict xml -> XMLTotals."""
+    xmls = sorted(set(xmls))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        totals = executor.map(read_xml_totals, xmls, [base]*len(xmls), chunksize=max(1, len(xmls)//(4*(workers or os.cpu_count() or 1))))
+        return dict(zip(xmls, totals))
+
+
+def relative_difference(value, reference):
+    if reference == 0:
+        return 0.0 if value == 0 else float("inf")
+    return (value - reference)/abs(reference)
+
+
+def cross_check_nevents(helper, tolerance=1e-3, energies=None, years=None, workers=None, base=UHH2_DATASETS_BASE, references=None):
+    """Compare the NEVT value of every process/year with the NumberEntries trailers of its XML.
+
+    NEVT is considered to agree if it is within the relative tolerance of either the "fast" (number of events) or the
+    "weights" (sum of generator weights) total, see total_candidates. Otherwise the closest total is used to compute the
+    relative difference. The fast and weights columns of the mismatches hold the last value of each method.
+
+    Only the given (process, energy, year, xml) references are checked if references is not None, e.g. the ones
+    affected by a change, see ValidateChanges.py. Otherwise all references of the database are checked.
+
+    Returns:
+        (:obj:`list` of :obj:`NEventsMismatch`, :obj:`list` of `tuple`): The mismatches, and the (process, energy, year, xml)
+        references that could not be checked because NEVT or the XML totals are missing.
+    """
+    if references is None:
+        references = collect_xml_references(helper, energies, years)
+    totals = read_all_xml_totals([ref[3] for ref in references], base=base, workers=workers)
+    mismatches = []
+    unchecked = []
+    for process, energy, year, xml in references:
+        try:
+            nevt = helper.get_nevt(process, energy, year)
+        except KeyError:
+            nevt = -1
+        xml_totals = totals[xml]
+        candidates = [(method, value) for method, values in zip(XMLTotals._fields, xml_totals) for value in total_candidates(values)]
+        if nevt < 0 or len(candidates) == 0:
+            unchecked.append((process, energy, year, xml))
+            continue
+        method, rel_diff = min(((method, relative_difference(nevt, value)) for method, value in candidates), key=lambda x: abs(x[1]))
+        if abs(rel_diff) > tolerance:
+            fast = xml_totals.fast[-1] if len(xml_totals.fast) > 0 else None
+            weights = xml_totals.weights[-1] if len(xml_totals.weights) > 0 else None
+            mismatches.append(NEventsMismatch(process, energy, year, nevt, xml, fast, weights, method, rel_diff))
+    return mismatches, unchecked
+
+
+def print_mismatches(mismatches, unchecked=None):
+    def format_value(value):
+        return "/" if value is None else "%.6g"%value
+
+    if len(mismatches) > 0:
+        width = max(len(m.process) for m in mismatches) + 3
+        print("{process: <{width}}{year: <13}{nevt: >14}{fast: >14}{weights: >14}{method: >9}{rel_diff: >11}".format(
+            process="process", width=width, year="year", nevt="NEVT", fast="fast", weights="weights", method="closest", rel_diff="rel. diff"))
+        for m in mismatches:
+            print("{process: <{width}}{year: <13}{nevt: >14}{fast: >14}{weights: >14}{method: >9}{rel_diff: >+11.2%}".format(
+                process=m.process, width=width, year=m.year, nevt=format_value(m.nevt), fast=format_value(m.fast),
+                weights=format_value(m.weights), method=m.method, rel_diff=m.rel_diff))
+    if unchecked is not None and len(unchecked) > 0:
+        print("")
+        print("Could not check (missing NEVT or NumberEntries):")
+        for process, energy, year, xml in unchecked:
+            print("{: <60} {: <13} {}".format(process, year, xml))
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Cross-check the NEVT values of the CrossSectionHelper database against the NumberEntries comments of the dataset XMLs.")
+
+    parser.add_argument("--import-signal", nargs="*", default=[], help="signal dict(s) of xsec_signal_dicts to include in the check.")
+    parser.add_argument("--year", nargs="*", default=None, help="only check the given year(s).")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="relative tolerance for NEVT to agree with the XML totals (default: %(default)s).")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes reading the XMLs (default: number of CPUs).")
+    parser.add_argument("--xml", default=None, help="only check the XMLs whose path matches this regular expression, e.g. \"Run2016B-HIPM\".")
+    parser.add_argument("--show-unchecked", action="store_true", help="also list process/year combinations without NEVT or NumberEntries.")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if any mismatch is found.")
+    parser.add_argument("--throw-unchecked", action="store_true", help="exit with an error if any process/year could not be checked.")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    helper = MCSampleValuesHelper(import_signal=args.import_signal)
+    references = None
+    if args.xml is not None:
+        references = [reference for reference in collect_xml_references(helper, years=args.year) if re.search(args.xml, reference[3])]
+    mismatches, unchecked = cross_check_nevents(helper, tolerance=args.tolerance, years=args.year, workers=args.workers, references=references)
+    print_mismatches(mismatches, unchecked if args.show_unchecked else None)
+    print("")
+    print("%d mismatch(es), %d unchecked, done in %.2f s"%(len(mismatches), len(unchecked), time.perf_counter()-start))
+    if args.throw and len(mismatches) > 0:
+        raise ValueError("NEVT disagrees with the XML NumberEntries for %d process/year combination(s)"%len(mismatches))
+    if args.throw_unchecked and len(unchecked) > 0:
+        raise ValueError("NEVT could not be checked for %d process/year combination(s)"%len(unchecked))
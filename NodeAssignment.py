@@ -0,0 +1,191 @@
+import hashlib
+from collections import namedtuple
+
+from DatasetXMLHelper import STATUS_ACTIVE, XMLScanner, filename_key, iter_active_filenames
+from FileMetadataCache import METADATA_FIELDS, add_cache_arguments, open_cache
+from JobSplitter import lookup_costs
+
+
+NodeLoad = namedtuple("NodeLoad", ["node", "n_files", "cost"])
+
+_MASK64 = (1 << 64) - 1
+
+
+def jump_hash(key, n_nodes):
+    """Return the node in [0, n_nodes) of a 64-bit key with jump consistent hashing (Lamping & Veach, 2014).
+
+    When the number of nodes changes from n to m, only |n-m|/max(n, m) of the keys move to another node.
+    """
+    node, j = -1, 0
+    while j < n_nodes:
+        node = j
+        key = (key*2862933555777941757 + 1) & _MASK64
+        j = int((node + 1)*(float(1 << 31)/float((key >> 33) + 1)))
+    return node
+
+
+def _mix64(value):
+    # splitmix64 finaliser
+    value = ((value ^ (value >> 30))*0xbf58476d1ce4e5b9) & _MASK64
+    value = ((value ^ (value >> 27))*0x94d049bb133111eb) & _MASK64
+    return value ^ (value >> 31)
+
+
+def node_seed(node):
+    """Return the 64-bit seed of a named node, used for rendezvous hashing."""
+    return int.from_bytes(hashlib.blake2b(str(node).encode(), digest_size=8).digest(), "little")
+
+
+def rendezvous_hash(key, node_seeds):
+    """Return the index of the node with the highest score for a 64-bit key (rendezvous / highest random weight hashing).
+
+    Unlike jump_hash, nodes can be named and any node can be removed, only the keys of that node move.
+
+    Args:
+        key (`int`): The 64-bit key of the file
+        node_seeds (:obj:`list` of `int`): The seeds of the nodes, see node_seed
+    """
+    best, best_score = 0, -1
+    for index, seed in enumerate(node_seeds):
+        score = _mix64(key ^ seed)
+        if score > best_score:
+            best, best_score = index, score
+    return best
+
+
+class NodeAssigner():
+    """Deterministic assignment of ntuples to processing nodes without any coordination between the nodes.
+
+    Every node computes the same assignment from the normalised ntuple paths only, so each node can independently
+    select its own files. With integer node counts jump consistent hashing is used, with named nodes rendezvous hashing.
+    In both cases a change of the node count moves a minimal number of files.
+
+    Args:
+        nodes (`int` or :obj:`list` of `str`): The number of nodes, or the node names
+
+    Example:
+        assigner = NodeAssigner(10)
+        my_files = list(assigner.iter_node_filenames(["RunII_106X_v2/SM/UL18/TTToSemiLeptonic_CP5_powheg-pythia8_Summer20UL18_v2.xml"], node=3))
+    """
+
+    def __init__(self, nodes):
+        if isinstance(nodes, int):
+            self.nodes = list(range(nodes))
+            self._seeds = None
+        else:
+            self.nodes = list(nodes)
+            self._seeds = [node_seed(node) for node in self.nodes]
+        if len(self.nodes) == 0:
+            raise ValueError("ERROR NodeAssigner::At least one node is needed")
+
+    def node_index(self, filename):
+        """Return the index of the node (in self.nodes) that processes an ntuple, given as str or bytes-like object."""
+        key = filename_key(filename)
+        if self._seeds is None:
+            return jump_hash(key, len(self.nodes))
+        return rendezvous_hash(key, self._seeds)
+
+    def node(self, filename):
+        return self.nodes[self.node_index(filename)]
+
+    def iter_node_filenames(self, xmls, node):
+        """Yield the active entries of the XMLs that are assigned to the given node.
+
+        The XMLs are streamed with XMLScanner, the keys are hashed from the raw bytes of the entries (see filename_key) and
+        only the entries of this node are decoded.
+        """
+        index = self.nodes.index(node)
+        for xml in xmls:
+            with XMLScanner(xml) as scanner:
+                for status, filename in scanner.iter_filenames():
+                    if status == STATUS_ACTIVE and self.node_index(filename) == index:
+                        yield filename.tobytes().decode()
+
+    def loads(self, xmls, costs=None):
+        """Return the NodeLoad of every node for the active entries of the XMLs.
+
+        Args:
+            xmls (:obj:`list` of `str`): Dataset XMLs
+            costs (:obj:`dict`): Optional per-file cost with normalised filenames as keys, missing files get the mean
+                cost of the known files, see JobSplitter.lookup_costs
+        """
+        n_files = [0]*len(self.nodes)
+        indices, filenames = [], []
+        for xml in xmls:
+            with XMLScanner(xml) as scanner:
+                for status, filename in scanner.iter_filenames():
+                    if status != STATUS_ACTIVE:
+                        continue
+                    index = self.node_index(filename)
+                    n_files[index] += 1
+                    if costs is not None:
+                        indices.append(index)
+                        filenames.append(filename.tobytes().decode())
+        if costs is None:
+            cost = [float(n) for n in n_files]
+        else:
+            cost = [0.0]*len(self.nodes)
+            for index, value in zip(indices, lookup_costs(filenames, costs)):
+                cost[index] += value
+        return [NodeLoad(node, n, c) for node, n, c in zip(self.nodes, n_files, cost)]
+
+
+def load_imbalance(loads):
+    """Return the cost of the most loaded node divided by the mean cost per node, minus one."""
+    costs = [load.cost for load in loads]
+    mean = sum(costs)/len(costs)
+    return max(costs)/mean - 1 if mean > 0 else 0.0
+
+
+def count_moved(xmls, old_assigner, new_assigner):
+    """Return (number of moved files, number of files) when switching from one assignment to another."""
+    moved, total = 0, 0
+    for xml in xmls:
+        with XMLScanner(xml) as scanner:
+            for status, filename in scanner.iter_filenames():
+                if status != STATUS_ACTIVE:
+                    continue
+                total += 1
+                if old_assigner.node(filename) != new_assigner.node(filename):
+                    moved += 1
+    return moved, total
+
+
+def make_assigner(n_nodes, node_names):
+    return NodeAssigner(node_names if node_names is not None else n_nodes)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Assign the ntuples of dataset XMLs to processing nodes by consistent hashing.")
+
+    parser.add_argument("xmls", nargs="+", help="dataset XMLs to assign.")
+    parser.add_argument("-n", "--nodes", type=int, default=None, help="number of nodes (jump consistent hashing).")
+    parser.add_argument("--node-names", nargs="+", default=None, help="names of the nodes (rendezvous hashing), instead of --nodes.")
+    parser.add_argument("--node", default=None, help="print the files of this node (index, or name with --node-names).")
+    parser.add_argument("--report", action="store_true", help="print the number of files per node and the load imbalance.")
+    parser.add_argument("--compare-nodes", type=int, default=None, help="print how many files move when changing to this number of nodes (the first N names with --node-names).")
+
+    parser.add_argument("--cost-field", choices=METADATA_FIELDS, default="entries", help="metadata field used as per-file cost in --report with --cache (default: %(default)s).")
+    add_cache_arguments(parser)
+
+    args = parser.parse_args()
+    if (args.nodes is None) == (args.node_names is None):
+        parser.error("exactly one of --nodes and --node-names is required")
+
+    assigner = make_assigner(args.nodes, args.node_names)
+    if args.node is not None:
+        node = int(args.node) if args.node_names is None else args.node
+        for filename in assigner.iter_node_filenames(args.xmls, node):
+            print(filename)
+    if args.report:
+        cache = open_cache(args)
+        costs = None if cache is None else cache.get_field((f for xml in args.xmls for f in iter_active_filenames(xml)), args.cost_field)
+        loads = assigner.loads(args.xmls, costs)
+        for load in loads:
+            print("{: <20} {: >8} {: >14.6g}".format(str(load.node), load.n_files, load.cost))
+        print("load imbalance: %.2f%%"%(100*load_imbalance(loads)))
+    if args.compare_nodes is not None:
+        new_assigner = make_assigner(args.compare_nodes, None if args.node_names is None else args.node_names[:args.compare_nodes])
+        moved, total = count_moved(args.xmls, assigner, new_assigner)
+        print("%d of %d files (%.2f%%) move from %d to %d nodes"%(moved, total, 100*moved/max(total, 1), len(assigner.nodes), args.compare_nodes))
@@ -0,0 +1,208 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+from DatasetXMLHelper import UHH2_DATASETS_BASE, atomic_write
+
+
+MAGIC = b"UHH2NORM"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIIIIIQQ16s")
+FIELDS = ["xs", "br", "kfactor", "corr", "nevt", "lumi"]
+LABEL_WIDTH = 16
+
+
+def database_digest(import_signal=None, base=UHH2_DATASETS_BASE):
+    """Return the 16-byte blake2b digest of CrossSectionHelper.py and the given signal dicts, identifying the database version."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in [os.path.join(base, "CrossSectionHelper.py")] + [os.path.join(base, "xsec_signal_dicts", name + ".py") for name in sorted(import_signal or [])]:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def _label(text):
+    data = text.encode()
+    if len(data) > LABEL_WIDTH:
+        raise ValueError("ERROR NormalisationTable::Label \"" + text + "\" is longer than %d bytes"%LABEL_WIDTH)
+    return data.ljust(LABEL_WIDTH, b"\0")
+
+
+def build_table(helper, energy=None, digest=b"\0"*16):
+    """Return the bytes of the normalisation table of all processes and years of the database.
+
+    The table is one little-endian file that C++ code can load with a single read() and search without parsing:
+
+        offset 0     header (64 bytes, HEADER):
+                         char[8]  magic "UHH2NORM"
+                         uint32   format version (FORMAT_VERSION)
+                         uint32   number of processes P
+                         uint32   number of years Y
+                         uint32   number of fields F
+                         uint32   width of a process name N (bytes)
+                         uint32   width of a label L (bytes)
+                         uint64   offset of the process names
+                         uint64   offset of the values
+                         char[16] digest of the database files the table was written from, see database_digest
+        offset 64    labels, L bytes each, NUL-padded: the energy, the Y years, the F fields (FIELDS)
+        names        P process names, N bytes each, NUL-padded, sorted bytewise, so they can be binary searched
+        values       P*Y*F float64, 8-byte aligned, the F fields of process p and year y at ((p*Y + y)*F)*8
+
+    Missing cross sections and NEVT keep the default of the database (-1), the luminosity (as get_lumi) is NaN for
+    data and if it cannot be calculated.
+    """
+    from CrossSectionHelper import iter_database_records, record_lumi
+    energy = helper.get_energies()[0] if energy is None else energy
+    years = helper.get_years()
+    processes = sorted(helper.get_processes(), key=lambda name: name.encode())
+    name_width = max([len(name.encode()) for name in processes] + [1])
+    values = {}
+    for record in iter_database_records(helper, energies=[energy]):
+        lumi = None if record["is_data"] else record_lumi(record)
+        values[(record["process"], record["year"])] = [record["xs"], record["br"], record["kfactor"], record["corr"], record["nevt"], math.nan if lumi is None else lumi]
+    labels = b"".join(_label(text) for text in [energy] + years + FIELDS)
+    names = b"".join(name.encode().ljust(name_width, b"\0") for name in processes)
+    names_offset = HEADER.size + len(labels)
+    table_offset = (names_offset + len(names) + 7)//8*8
+    table = struct.pack("<%dd"%(len(processes)*len(years)*len(FIELDS)), *(value for name in processes for year in years for value in values[(name, year)]))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(processes), len(years), len(FIELDS), name_width, LABEL_WIDTH, names_offset, table_offset, digest)
+    return header + labels + names + b"\0"*(table_offset - names_offset - len(names)) + table
+
+
+def export_table(path, import_signal=None, energy=None):
+    """Write the normalisation table of the database with the given signal dicts to path (atomically) and return its size."""
+    from CrossSectionHelper import MCSampleValuesHelper
+    helper = MCSampleValuesHelper(import_signal=import_signal)
+    data = build_table(helper, energy, database_digest(import_signal))
+    atomic_write(path, data)
+    return len(data)
+
+
+class NormalisationTable():
+    """Memory-mapped reader of a normalisation table written by export_table, see build_table for the format.
+
+    Processes are found by binary search over the fixed-width names, and only the values of the requested process are
+    unpacked, so opening the table costs the same for any number of processes. The database module is not imported.
+
+    Args:
+        path (`str`): The table file
+
+    Example:
+        with NormalisationTable("normalisation.bin") as table:
+            lumi = table.get("TTToSemiLeptonic", "UL18", "lumi")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError("ERROR NormalisationTable::" + path + " is too short for a normalisation table")
+        (magic, self.version, self.n_processes, n_years, n_fields, self._name_width, label_width,
+         self._names_offset, self._table_offset, self.digest) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("ERROR NormalisationTable::" + path + " is not a normalisation table")
+        if self.version > FORMAT_VERSION:
+            raise ValueError("ERROR NormalisationTable::" + path + " has format version %d, only versions up to %d can be read"%(self.version, FORMAT_VERSION))
+        labels = [self._map[HEADER.size+i*label_width:HEADER.size+(i+1)*label_width].rstrip(b"\0").decode() for i in range(1 + n_years + n_fields)]
+        self.energy = labels[0]
+        self.years = labels[1:1+n_years]
+        self.fields = labels[1+n_years:]
+        self._year_index = {year: i for i, year in enumerate(self.years)}
+        self._values = struct.Struct("<%dd"%n_fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def _name(self, index):
+        start = self._names_offset + index*self._name_width
+        return self._map[start:start+self._name_width]
+
+    def find(self, process):
+        """Return the index of a process, or -1 if it is not in the table."""
+        key = process.encode()
+        if len(key) > self._name_width:
+            return -1
+        key = key.ljust(self._name_width, b"\0")
+        low, high = 0, self.n_processes
+        while low < high:
+            middle = (low + high)//2
+            if self._name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.n_processes and self._name(low) == key else -1
+
+    def processes(self):
+        return [self._name(i).rstrip(b"\0").decode() for i in range(self.n_processes)]
+
+    def lookup(self, process, year):
+        """Return a dict field -> value of a process and year."""
+        index = self.find(process)
+        if index < 0:
+            raise KeyError("ERROR NormalisationTable::Unknown process \"" + str(process) + "\"")
+        if not year in self._year_index:
+            raise KeyError("ERROR NormalisationTable::Unknown year \"" + str(year) + "\"")
+        offset = self._table_offset + (index*len(self.years) + self._year_index[year])*self._values.size
+        return dict(zip(self.fields, self._values.unpack_from(self._map, offset)))
+
+    def get(self, process, year, field):
+        return self.lookup(process, year)[field]
+
+
+def verify_table(table, helper):
+    """Return the list of (process, year, field, table value, database value) that differ between a table and the database."""
+    from CrossSectionHelper import iter_database_records, record_lumi
+    differences = []
+    for record in iter_database_records(helper, energies=[table.energy], years=table.years):
+        lumi = None if record["is_data"] else record_lumi(record)
+        expected = dict(record, lumi=math.nan if lumi is None else lumi)
+        values = table.lookup(record["process"], record["year"])
+        for field in table.fields:
+            if not (values[field] == expected[field] or (math.isnan(values[field]) and math.isnan(expected[field]))):
+                differences.append((record["process"], record["year"], field, values[field], expected[field]))
+    return differences
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    from CrossSectionHelper import MCSampleValuesHelper
+    parser = argparse.ArgumentParser(description="Export the cross sections, BR, k-factors, corrections, NEVT and luminosities of the database into a compact binary table for C++ code, or read one.")
+
+    parser.add_argument("table", help="the normalisation table file.")
+    parser.add_argument("--export", action="store_true", help="write the table from the database.")
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to include.")
+    parser.add_argument("--energy", default=None, choices=MCSampleValuesHelper.get_energies(), help="energy of the values (default: %s)."%MCSampleValuesHelper.get_energies()[0])
+    parser.add_argument("--lookup", nargs="+", default=None, help="print the values of these processes from the table.")
+    parser.add_argument("--verify", action="store_true", help="compare the table with the database (with the given signal dicts) and exit with an error if they differ.")
+
+    args = parser.parse_args()
+
+    if args.export:
+        start = time.perf_counter()
+        size = export_table(args.table, args.import_signal, args.energy)
+        print("%s: %d bytes written in %.3f s"%(args.table, size, time.perf_counter()-start))
+    with NormalisationTable(args.table) as table:
+        digest = database_digest(args.import_signal)
+        print("%s: format version %d, %d processes, years %s, energy %s, database %s%s"%(args.table, table.version, table.n_processes, " ".join(table.years),
+              table.energy, table.digest.hex(), "" if table.digest == digest else " (differs from the current database %s)"%digest.hex()))
+        for process in args.lookup or []:
+            for year in table.years:
+                values = table.lookup(process, year)
+                print("{:<40s} {:<12s} ".format(process, year) + " ".join("%s=%g"%(field, values[field]) for field in table.fields))
+        if args.verify:
+            differences = verify_table(table, MCSampleValuesHelper(import_signal=args.import_signal))
+            for difference in differences:
+                print("%s %s %s: %r in the table, %r in the database"%difference)
+            print("%d difference(s) to the database"%len(differences))
+            if len(differences) > 0:
+                raise ValueError("%d difference(s) between %s and the database"%(len(differences), args.table))
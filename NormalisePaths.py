@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from DatasetXMLHelper import SITE_PREFIXES, UHH2_DATASETS_BASE, STATUSES, STATUS_ACTIVE, PathNormaliser, atomic_write, find_xml_files, iter_entries, parse_prefix_rewrites
+
+
+_FILENAME = re.compile(rb'FileName="([^"]*)"')
+
+
+def normalise_xml_bytes(data, normaliser):
+    """Return the content of a dataset XML with every FileName attribute passed through normaliser, and the number of
+    changed FileNames. Everything else, including comments and the EMPTY/BAD status of entries, is kept byte by byte."""
+    n_changed = 0
+
+    def replace(match):
+        nonlocal n_changed
+        filename = match.group(1).decode()
+        normalised = normaliser(filename)
+        if normalised == filename:
+            return match.group(0)
+        n_changed += 1
+        return b'FileName="' + normalised.encode() + b'"'
+
+    return _FILENAME.sub(replace, data), n_changed
+
+
+def normalise_xml(path, normaliser, dry_run=False):
+    """Normalise the FileNames of a dataset XML in place and return the number of changed FileNames.
+
+    The file is only rewritten (atomically) if at least one FileName changes.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    new_data, n_changed = normalise_xml_bytes(data, normaliser)
+    if n_changed > 0 and not dry_run:
+        atomic_write(path, new_data)
+    return n_changed
+
+
+def normalise_xmls(xmls, normaliser, dry_run=False, workers=None):
+    """Normalise many dataset XMLs in place in parallel worker processes and yield (xml, number of changed FileNames) in input order."""
+    xmls = list(xmls)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(xmls)//(4*(workers or os.cpu_count() or 1)))
+        yield from zip(xmls, executor.map(normalise_xml, xmls, [normaliser]*len(xmls), [dry_run]*len(xmls), chunksize=chunksize))
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Normalise the ntuple paths of dataset XMLs (e.g. /pnfs/desy.de/cms/tier2//store -> /pnfs/desy.de/cms/tier2/store), optionally rewriting their prefixes. "
+                                     "By default the normalised paths are streamed to stdout, with --in-place the XMLs are rewritten.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs (default: all XMLs of the selected campaigns).")
+    parser.add_argument("--campaign", nargs="*", default=None, help="campaign directories, e.g. Run3_130X_v1 (default: all).")
+    parser.add_argument("--rewrite", nargs="*", default=[], help="prefix rewrite(s) old=new of the normalised paths, or one of: %s."%", ".join(sorted(SITE_PREFIXES)))
+    parser.add_argument("--status", nargs="+", default=[STATUS_ACTIVE], choices=STATUSES, help="entries to stream (default: %(default)s).")
+    parser.add_argument("--stdin", action="store_true", help="stream paths read from stdin (one per line) instead of the XMLs.")
+    parser.add_argument("--in-place", action="store_true", help="rewrite the FileNames of all entries in the XMLs, only XMLs that change are written.")
+    parser.add_argument("--check", action="store_true", help="like --in-place, but only list the XMLs that would change and exit with an error if there are any.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes with --in-place or --check (default: number of CPUs).")
+
+    args = parser.parse_args()
+
+    normaliser = PathNormaliser(parse_prefix_rewrites(args.rewrite))
+    if args.stdin:
+        for line in sys.stdin:
+            if line.strip() != "":
+                sys.stdout.write(normaliser(line)+"\n")
+        sys.exit(0)
+
+    xmls = args.xmls if len(args.xmls) > 0 else [os.path.join(UHH2_DATASETS_BASE, xml) for xml in find_xml_files(campaigns=args.campaign)]
+    if args.in_place or args.check:
+        n_xmls, n_filenames = 0, 0
+        for xml, n_changed in normalise_xmls(xmls, normaliser, dry_run=args.check, workers=args.workers):
+            if n_changed > 0:
+                n_xmls += 1
+                n_filenames += n_changed
+                print("%s: %d path(s)"%(xml, n_changed))
+        print("%d path(s) in %d of %d XML(s) %s"%(n_filenames, n_xmls, len(xmls), "not normalised" if args.check else "rewritten"))
+        if args.check and n_xmls > 0:
+            raise ValueError("%d XML(s) contain paths that are not normalised"%n_xmls)
+    else:
+        for xml in xmls:
+            sys.stdout.write("".join(entry.filename+"\n" for entry in iter_entries(xml, statuses=args.status, normaliser=normaliser)))
@@ -0,0 +1,123 @@
+import re
+import sys
+from collections import namedtuple
+from xml.sax.saxutils import quoteattr
+
+from CrossSectionHelper import MCSampleValuesHelper, UHH2_DATASETS_BASE, iter_database_records, record_lumi
+from DatasetXMLHelper import atomic_write
+
+
+SteeringSample = namedtuple("SteeringSample", ["name", "process", "year", "type", "lumi", "xml"])
+SkippedSample = namedtuple("SkippedSample", ["process", "year", "reason"])
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def sample_name(process, year):
+    """Return the entity name and Version of a sample, e.g. TTToSemiLeptonic_UL18, made a valid XML name."""
+    name = _INVALID_NAME_CHARACTERS.sub("_", process + "_" + year)
+    return name if re.match(r"[A-Za-z_]", name) else "_" + name
+
+
+def collect_samples(helper, years=None, energy=None, sample_patterns=None, data=True, mc=True, kfactor=False, corrections=False):
+    """Resolve the InputData of the selected samples in one pass over the database records.
+
+    The luminosity of MC samples is get_lumi (NEVT / (cross section * BR)), optionally divided by the k-factor and the
+    correction, data samples get a Lumi of 1 as usual in UHH2 steering files. Years without XML of a process are left
+    out, samples whose luminosity cannot be calculated are skipped.
+
+    Args:
+        helper (:obj:`MCSampleValuesHelper`): The database, including the signal dicts to use
+        years (:obj:`list` of `str`): Years to write (default: all)
+        energy (`str`): Energy of the samples (default: the first energy of the database)
+        sample_patterns (:obj:`list` of `str`): Regular expressions, a process is selected if any of them matches (default: all)
+        data (`bool`): Select data samples
+        mc (`bool`): Select MC samples
+        kfactor (`bool`): Apply the k-factor to the luminosity of MC samples
+        corrections (`bool`): Apply the correction to the luminosity of MC samples
+
+    Returns:
+        (:obj:`list` of :obj:`SteeringSample`, :obj:`list` of :obj:`SkippedSample`): The samples ordered by year and
+        process, and the skipped samples.
+    """
+    energy = helper.get_energies()[0] if energy is None else energy
+    pattern = None if not sample_patterns else "|".join("(?:%s)"%p for p in sample_patterns)
+    samples, skipped = [], []
+    for record in iter_database_records(helper, years=years, energies=[energy], sample_pattern=pattern):
+        if (record["is_data"] and not data) or (not record["is_data"] and not mc):
+            continue
+        if record["xml"] == "":
+            # the sample does not exist for this year
+            continue
+        if record["is_data"]:
+            lumi = 1.0
+        else:
+            lumi = record_lumi(record, kfactor, corrections)
+            if lumi is None:
+                skipped.append(SkippedSample(record["process"], record["year"], "no luminosity (NEVT %g, cross section %g)"%(record["nevt"], record["xs"])))
+                continue
+        samples.append(SteeringSample(sample_name(record["process"], record["year"]), record["process"], record["year"],
+                                      "DATA" if record["is_data"] else "MC", lumi, record["xml"]))
+    samples.sort(key=lambda s: (helper.get_years().index(s.year), s.process))
+    return samples, skipped
+
+
+def format_entities(samples, datasets_dir=UHH2_DATASETS_BASE):
+    """Return the ENTITY declarations of the dataset XMLs of the samples, for the DOCTYPE of a steering file."""
+    return "".join("<!ENTITY %s SYSTEM %s>\n"%(sample.name, quoteattr(datasets_dir.rstrip("/") + "/" + sample.xml)) for sample in samples)
+
+
+def format_input_data(samples, nevents_max=-1, cacheable=False, input_tree="AnalysisTree", output_tree=None, indent="        "):
+    """Return the InputData blocks of the samples, including their dataset XML entities, for the Cycle of a steering file."""
+    blocks = []
+    for sample in samples:
+        lines = ['<InputData Lumi="%.10g" NEventsMax="%d" Type="%s" Version="%s" Cacheable="%s">'%(sample.lumi, nevents_max, sample.type, sample.name, cacheable),
+                 '    &%s; <InputTree Name="%s"/>'%(sample.name, input_tree)]
+        if output_tree is not None:
+            lines.append('    <OutputTree Name="%s"/>'%output_tree)
+        lines.append('</InputData>')
+        blocks.append("".join(indent + line + "\n" for line in lines))
+    return "\n".join(blocks)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Write the ENTITY declarations and InputData blocks of UHH2 steering files for a selection of samples and years, with the Lumi of the database.")
+
+    parser.add_argument("--sample", nargs="+", default=None, help="regular expression(s) of the processes, e.g. \"^TTTo\" \"^ST_\" (default: all).")
+    parser.add_argument("--year", nargs="+", default=None, choices=MCSampleValuesHelper.get_years(), help="year(s) to write (default: all).")
+    parser.add_argument("--energy", default=None, choices=MCSampleValuesHelper.get_energies(), help="energy of the samples (default: %s)."%MCSampleValuesHelper.get_energies()[0])
+    parser.add_argument("--import-signal", nargs="+", default=None, help="signal dict(s) of xsec_signal_dicts to include.")
+    parser.add_argument("--no-data", action="store_true", help="skip data samples.")
+    parser.add_argument("--no-mc", action="store_true", help="skip MC samples.")
+    parser.add_argument("--kfactor", action="store_true", help="apply the k-factors to the Lumi of MC samples.")
+    parser.add_argument("--corrections", action="store_true", help="apply the corrections to the Lumi of MC samples.")
+    parser.add_argument("--datasets-dir", default=UHH2_DATASETS_BASE, help="directory of the dataset XMLs in the ENTITY declarations, e.g. relative to the steering file (default: %(default)s).")
+    parser.add_argument("--nevents-max", type=int, default=-1, help="NEventsMax of the InputData (default: %(default)s).")
+    parser.add_argument("--cacheable", action="store_true", help="write Cacheable=\"True\".")
+    parser.add_argument("--input-tree", default="AnalysisTree", help="name of the InputTree (default: %(default)s).")
+    parser.add_argument("--output-tree", default=None, help="name of an OutputTree to write for every sample.")
+    parser.add_argument("--entities", default=None, help="file to write the ENTITY declarations to (default: stdout, together with the InputData blocks).")
+    parser.add_argument("--blocks", default=None, help="file to write the InputData blocks to (default: stdout, together with the ENTITY declarations).")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if the luminosity of a selected sample cannot be calculated.")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    helper = MCSampleValuesHelper(import_signal=args.import_signal)
+    samples, skipped = collect_samples(helper, args.year, args.energy, args.sample, data=not args.no_data, mc=not args.no_mc,
+                                       kfactor=args.kfactor, corrections=args.corrections)
+    entities = format_entities(samples, args.datasets_dir)
+    blocks = format_input_data(samples, args.nevents_max, args.cacheable, args.input_tree, args.output_tree)
+    if args.entities is not None:
+        atomic_write(args.entities, entities.encode())
+    if args.blocks is not None:
+        atomic_write(args.blocks, blocks.encode())
+    if args.entities is None or args.blocks is None:
+        sys.stdout.write((entities if args.entities is None else "") + ("\n" if args.entities is None and args.blocks is None else "") + (blocks if args.blocks is None else ""))
+    for s in skipped:
+        print("WARNING SteeringConfigGenerator: skipped %s (%s): %s"%s, file=sys.stderr)
+    print("%d sample(s) written, %d skipped, in %.3f s"%(len(samples), len(skipped), time.perf_counter()-start), file=sys.stderr)
+    if args.throw and len(skipped) > 0:
+        raise ValueError("%d selected sample(s) without luminosity"%len(skipped))
@@ -0,0 +1,193 @@
+import itertools
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from DatasetXMLHelper import PathNormaliser, iter_active_filenames, parse_prefix_rewrites
+from FileMetadataCache import FileMetadata, add_cache_arguments, open_cache
+
+
+FileStatus = namedtuple("FileStatus", ["filename", "path", "status", "size", "error", "mtime"], defaults=(None,))
+
+STATUS_OK = "ok"
+STATUS_EMPTY_FILE = "empty"
+STATUS_MISSING = "missing"
+STATUS_ERROR = "error"
+
+# time to live of the sizes stored in a cache, after which the existence of a file is checked again
+STATUS_CACHE_TTL = 24*3600
+
+
+def stat_file(filename, path, retries=2, retry_delay=1.0):
+    """Return the FileStatus of one file.
+
+    Missing files are reported immediately, other errors (e.g. timeouts of a shared filesystem) are retried with an
+    increasing delay before the file is reported with STATUS_ERROR.
+
+    Args:
+        filename (`str`): The ntuple path as written in the XML
+        path (`str`): The path to stat, i.e. the filename after prefix rewriting
+        retries (`int`): Number of retries on errors other than a missing file
+        retry_delay (`float`): Delay before the first retry in seconds, doubled for every further retry
+    """
+    for attempt in range(retries + 1):
+        try:
+            stat = os.stat(path)
+            return FileStatus(filename, path, STATUS_OK if stat.st_size > 0 else STATUS_EMPTY_FILE, stat.st_size, "", stat.st_mtime)
+        except FileNotFoundError:
+            return FileStatus(filename, path, STATUS_MISSING, -1, "")
+        except OSError as error:
+            if attempt == retries:
+                return FileStatus(filename, path, STATUS_ERROR, -1, str(error))
+            time.sleep(retry_delay*2**attempt)
+
+
+class StorageChecker():
+    """Checks that ntuples exist and are non-empty on storage, with a bounded number of concurrent stat calls.
+
+    The filenames are consumed lazily in batches, and at most one batch is in flight at any time, so millions of
+    entries can be streamed from the XMLs. Results are returned in the order of the input.
+    If a FileMetadataCache is given, files with a cached size are not checked again until it expires: the sizes and
+    modification times of the checked files are stored in the cache for cache_ttl seconds, so that lost files are found
+    again.
+
+    Args:
+        concurrency (`int`): Maximum number of concurrent stat calls
+        prefixes (:obj:`list` of `tuple`): (old, new) prefix rewrites applied to the normalised filenames, e.g. to
+            check a local mirror instead of /pnfs
+        retries (`int`): Number of retries per file on errors other than a missing file
+        retry_delay (`float`): Delay before the first retry in seconds
+        progress (`file`): Stream to print progress to, or None for no progress output
+        progress_interval (`float`): Minimum time between two progress lines in seconds
+        cache (:obj:`FileMetadataCache`): Optional cache of file sizes
+        batch_size (`int`): Number of files looked up in the cache and checked together
+        cache_ttl (`float`): Time to live of the cached sizes in seconds
+
+    Example:
+        checker = StorageChecker(concurrency=64, prefixes=[("/pnfs/desy.de/cms/tier2/", "/data/mirror/")])
+        for result in checker.check(iter_active_filenames(xml)):
+            ...
+    """
+
+    def __init__(self, concurrency=32, prefixes=None, retries=2, retry_delay=1.0, progress=None, progress_interval=5.0, cache=None, batch_size=1000, cache_ttl=STATUS_CACHE_TTL):
+        self.concurrency = concurrency
+        self.normaliser = PathNormaliser(prefixes)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.cache = cache
+        self.batch_size = max(batch_size, concurrency)
+        self.cache_ttl = cache_ttl
+
+    def path(self, filename):
+        return self.normaliser(filename)
+
+    def _check_batch(self, executor, batch):
+        cached = self.cache.get_many(batch) if self.cache is not None else {}
+        futures = {}
+        for filename in batch:
+            metadata = cached.get(filename)
+            if metadata is None or metadata.size is None:
+                futures[filename] = executor.submit(stat_file, filename, self.path(filename), self.retries, self.retry_delay)
+        results = []
+        for filename in batch:
+            if filename in futures:
+                results.append(futures[filename].result())
+            else:
+                size = cached[filename].size
+                results.append(FileStatus(filename, self.path(filename), STATUS_OK if size > 0 else STATUS_EMPTY_FILE, size, "", cached[filename].mtime))
+        if self.cache is not None:
+            self.cache.put_many({r.filename: FileMetadata(size=r.size, mtime=r.mtime) for r in results
+                                 if r.filename in futures and r.status in (STATUS_OK, STATUS_EMPTY_FILE)}, ttl=self.cache_ttl)
+        return results
+
+    def check(self, filenames):
+        """Yield the FileStatus of every filename, in input order."""
+        counts = {}
+        start = last_progress = time.perf_counter()
+        filenames = iter(filenames)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                batch = list(itertools.islice(filenames, self.batch_size))
+                if len(batch) == 0:
+                    break
+                for result in self._check_batch(executor, batch):
+                    counts[result.status] = counts.get(result.status, 0) + 1
+                    last_progress = self._print_progress(counts, start, last_progress)
+                    yield result
+        self._print_progress(counts, start, None)
+
+    def _print_progress(self, counts, start, last_progress):
+        now = time.perf_counter()
+        if self.progress is None or (last_progress is not None and now - last_progress < self.progress_interval):
+            return last_progress
+        n = sum(counts.values())
+        print("%d files checked (%s) in %.1f s, %.0f files/s"%(n, ", ".join("%s: %d"%item for item in sorted(counts.items())),
+              now - start, n/max(now - start, 1e-9)), file=self.progress)
+        return now
+
+
+def write_status_table(results, output):
+    """Write FileStatus results as a tab-separated table with a header line and return the number of rows per status."""
+    counts = {}
+    output.write("#filename\tstatus\tsize\tpath\terror\n")
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+        output.write("%s\t%s\t%d\t%s\t%s\n"%(result.filename, result.status, result.size, result.path, result.error))
+    return counts
+
+
+def read_manifest(path):
+    """Yield the filenames of a manifest, i.e. a text file with one ntuple path per line."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line != "" and not line.startswith("#"):
+                yield line.split()[0]
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Check that all active ntuples of dataset XMLs exist and are non-empty on storage.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs whose active entries are checked.")
+    parser.add_argument("--manifest", nargs="*", default=[], help="text file(s) with one ntuple path per line to check as well.")
+    parser.add_argument("--rewrite", nargs="*", default=[], help="prefix rewrite(s) old=new applied to the normalised paths before checking, e.g. /pnfs/desy.de/cms/tier2/=/data/mirror/, see NormalisePaths.py.")
+    parser.add_argument("-j", "--concurrency", type=int, default=32, help="maximum number of concurrent stat calls (default: %(default)s).")
+    parser.add_argument("--retries", type=int, default=2, help="number of retries per file on errors other than a missing file (default: %(default)s).")
+    parser.add_argument("-o", "--output", default=None, help="file to write the status table to (default: stdout).")
+    parser.add_argument("--only-problems", action="store_true", help="only write missing, empty and failed files to the status table.")
+    parser.add_argument("--quiet", action="store_true", help="do not print progress to stderr.")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if any file is missing, empty or failed.")
+    add_cache_arguments(parser, default_ttl=STATUS_CACHE_TTL)
+
+    args = parser.parse_args()
+
+    def iter_filenames():
+        for xml in args.xmls:
+            yield from iter_active_filenames(xml)
+        for manifest in args.manifest:
+            yield from read_manifest(manifest)
+
+    cache = open_cache(args)
+    checker = StorageChecker(concurrency=args.concurrency, prefixes=parse_prefix_rewrites(args.rewrite), retries=args.retries,
+                             progress=None if args.quiet else sys.stderr, cache=cache, cache_ttl=args.cache_ttl)
+    results = checker.check(iter_filenames())
+    if args.only_problems:
+        results = (result for result in results if result.status != STATUS_OK)
+    output = open(args.output, "w") if args.output is not None else sys.stdout
+    try:
+        counts = write_status_table(results, output)
+    finally:
+        if args.output is not None:
+            output.close()
+    if cache is not None:
+        if not args.quiet:
+            print("cache hit rate: %.1f%% %s"%(100*cache.hit_rate(), str(cache.stats())), file=sys.stderr)
+        cache.close()
+    n_problems = sum(n for status, n in counts.items() if status != STATUS_OK)
+    if args.throw and n_problems > 0:
+        raise ValueError("%d file(s) are missing, empty or could not be checked"%n_problems)
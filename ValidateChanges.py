@@ -0,0 +1,389 @@
+import collections
+import collections.abc
+import contextlib
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from CrossSectionHelper import MCSampleValuesHelper, UHH2_DATASETS_BASE, collect_xml_references, record_subject, run_checks
+from DatasetXMLHelper import STATUS_ACTIVE, XMLScanner, filename_key, find_campaigns
+
+
+DATABASE_FILE = "CrossSectionHelper.py"
+SIGNAL_DICTS_DIR = "xsec_signal_dicts"
+
+ChangeSet = namedtuple("ChangeSet", ["merge_base", "files", "xmls", "processes", "removed_processes"])
+ValidationPlan = namedtuple("ValidationPlan", ["processes", "xmls", "references"])
+ValidationError = namedtuple("ValidationError", ["subject", "message"])
+
+
+def _git(args, repo=UHH2_DATASETS_BASE, allow_failure=False):
+    result = subprocess.run(["git", "-C", repo] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        if allow_failure:
+            return None
+        raise ValueError("ERROR ValidateChanges::git " + " ".join(args) + " failed: " + result.stderr.strip())
+    return result.stdout
+
+
+def changed_files(base_revision, repo=UHH2_DATASETS_BASE):
+    """Return (merge base, sorted list of paths relative to repo) of the files changed since base_revision.
+
+    The working tree, including untracked files, is compared to the merge base of base_revision and HEAD, so that only
+    the changes of the current branch are returned, as in a pull request.
+    """
+    merge_base = _git(["merge-base", base_revision, "HEAD"], repo).strip()
+    paths = set(_git(["diff", "--name-only", "--no-renames", "--relative", "-z", merge_base, "--"], repo).split("\0"))
+    paths.update(_git(["ls-files", "--others", "--exclude-standard", "-z"], repo).split("\0"))
+    paths.discard("")
+    return merge_base, sorted(paths)
+
+
+def is_database_file(path):
+    return path == DATABASE_FILE or (os.path.dirname(path) == SIGNAL_DICTS_DIR and path.endswith(".py"))
+
+
+@contextlib.contextmanager
+def _collections_abc_aliases():
+    """Provide the aliases of collections.abc in collections (e.g. collections.Mapping) that Python 3.10 removed, so
+    that older revisions of the database can be executed."""
+    added = [name for name in collections.abc.__all__ if not hasattr(collections, name)]
+    for name in added:
+        setattr(collections, name, getattr(collections.abc, name))
+    try:
+        yield
+    finally:
+        for name in added:
+            delattr(collections, name)
+
+
+def read_process_entries(source, filename):
+    """Return the dict process -> {key: values} defined by the source of CrossSectionHelper.py or of a signal dict."""
+    namespace = {"__name__": "ValidateChanges_" + os.path.splitext(os.path.basename(filename))[0], "__file__": os.path.join(UHH2_DATASETS_BASE, filename)}
+    with _collections_abc_aliases():
+        exec(compile(source, filename, "exec"), namespace)
+    if "MCSignalValuesHelper" in namespace:
+        return dict(namespace["MCSignalValuesHelper"].signal_values_dict)
+    # the database is a private class attribute, read it directly so that any revision of the file can be compared
+    return dict(namespace["MCSampleValuesHelper"]._MCSampleValuesHelper__values_dict)
+
+
+def diff_process_entries(path, merge_base, repo=UHH2_DATASETS_BASE):
+    """Return (changed or added processes, removed processes) of a database file between merge_base and the working tree."""
+    old_source = _git(["show", merge_base + ":./" + path], repo, allow_failure=True)
+    try:
+        old_entries = read_process_entries(old_source, path) if old_source is not None else {}
+    except Exception as error:
+        print("WARNING ValidateChanges: %s of %s cannot be executed, all its processes are validated: %r"%(path, merge_base, error), file=sys.stderr)
+        old_entries = None
+    new_entries = {}
+    if os.path.isfile(os.path.join(repo, path)):
+        with open(os.path.join(repo, path)) as f:
+            new_entries = read_process_entries(f.read(), path)
+    if old_entries is None:
+        return set(new_entries), set()
+    changed = set(name for name, entry in new_entries.items() if old_entries.get(name) != entry)
+    removed = set(old_entries) - set(new_entries)
+    return changed, removed
+
+
+def find_changes(base_revision, repo=UHH2_DATASETS_BASE):
+    """Return the ChangeSet of the working tree with respect to base_revision: the changed files, the changed dataset
+    XMLs (added, modified or deleted) and the changed and removed processes of CrossSectionHelper.py and the signal dicts."""
+    merge_base, files = changed_files(base_revision, repo)
+    processes, removed = set(), set()
+    for path in files:
+        if is_database_file(path):
+            changed_in_file, removed_in_file = diff_process_entries(path, merge_base, repo)
+            processes |= changed_in_file
+            removed |= removed_in_file
+    xmls = set(os.path.normpath(path) for path in files if path.endswith(".xml"))
+    return ChangeSet(merge_base, files, xmls, processes, removed - processes)
+
+
+def signal_dict_names(repo=UHH2_DATASETS_BASE):
+    directory = os.path.join(repo, SIGNAL_DICTS_DIR)
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith(".py")) if os.path.isdir(directory) else []
+
+
+def plan_validation(changes, helper, base=UHH2_DATASETS_BASE):
+    """Return the ValidationPlan of a ChangeSet: the changed processes and XMLs together with their dependents.
+
+    Dependents are the XMLs referenced by the Xml_* fields of changed processes, and the processes referencing changed
+    XMLs or the XMLs of changed processes (so that an XML used twice is found). The references are the (process,
+    energy, year, xml) combinations involving any of them.
+    """
+    all_references = collect_xml_references(helper)
+    referenced_xmls = set(os.path.normpath(reference[3]) for reference in all_references if reference[0] in changes.processes) | changes.xmls
+    references = [reference for reference in all_references
+                  if reference[0] in changes.processes or os.path.normpath(reference[3]) in referenced_xmls]
+    processes = set(changes.processes) | set(reference[0] for reference in references)
+    referenced_xmls = set(os.path.normpath(reference[3]) for reference in references)
+    # missing XMLs are reported by the process checks, deleted XMLs that are not referenced anymore are fine
+    xmls = set(xml for xml in referenced_xmls | changes.xmls if os.path.isfile(os.path.join(base, xml)))
+    return ValidationPlan(sorted(processes), sorted(xmls), references)
+
+
+def validate_processes(helper, processes, base=UHH2_DATASETS_BASE):
+    """Run the integrity checks of CrossSectionHelper.py (CHECKS, see run_checks) on all records of the processes.
+
+    Returns:
+        (`dict`): (kind, name) -> list of ValidationErrors, with kind "process" for the failures of a record (every
+        process has an entry) and "xml" for the failures of an XML (e.g. referenced twice or without active entries)
+    """
+    records = [helper.get_record(process, energy, year) for process in processes for energy in helper.get_energies() for year in helper.get_years()]
+    owners = {record_subject(record): ("process", record["process"]) for record in records}
+    errors = {("process", process): [] for process in processes}
+    for result in run_checks(helper, records=records, base=base)[1:]:
+        for failure in result.failures:
+            key = owners.get(failure.subject, ("xml", os.path.normpath(failure.subject)))
+            errors.setdefault(key, []).append(ValidationError(failure.subject, failure.message))
+    return errors
+
+
+def validate_xml(xml, base=UHH2_DATASETS_BASE, check_format=False):
+    """Return the ValidationErrors of a dataset XML: it must exist, have at least one active entry and list every
+    ntuple only once. With check_format, it must also only contain entries and NumberEntries trailers, so that
+    XMLSorter.py can sort it."""
+    path = os.path.join(base, xml)
+    if not os.path.isfile(path):
+        return [ValidationError(xml, "XML not found")]
+    errors = []
+    if check_format:
+        from XMLSorter import sort_xml_bytes
+        with open(path, "rb") as f:
+            try:
+                sort_xml_bytes(f.read())
+            except ValueError as error:
+                errors.append(ValidationError(xml, str(error)))
+    keys = set()
+    n_duplicates = 0
+    with XMLScanner(path) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if status == STATUS_ACTIVE:
+                key = filename_key(filename)
+                if key in keys:
+                    n_duplicates += 1
+                keys.add(key)
+    if len(keys) == 0:
+        errors.append(ValidationError(xml, "no active entries"))
+    if n_duplicates > 0:
+        errors.append(ValidationError(xml, "%d ntuple(s) listed more than once"%n_duplicates))
+    return errors
+
+
+def validate_changes(base_revision, check_nevents=False, tolerance=1e-3, base=UHH2_DATASETS_BASE, check_format=False):
+    """Validate the processes and XMLs affected by the changes since base_revision, see find_changes and plan_validation.
+
+    Returns:
+        (:obj:`ChangeSet`, :obj:`ValidationPlan`, :obj:`list` of :obj:`ValidationError`)
+    """
+    changes = find_changes(base_revision, base)
+    helper = MCSampleValuesHelper(import_signal=signal_dict_names(base))
+    plan = plan_validation(changes, helper, base)
+    errors = []
+    for process_errors in validate_processes(helper, plan.processes, base).values():
+        errors += process_errors
+    for xml in plan.xmls:
+        errors += validate_xml(xml, base, check_format)
+    if check_nevents and len(plan.references) > 0:
+        from NEventsCrossCheck import cross_check_nevents
+        mismatches, unchecked = cross_check_nevents(helper, tolerance, references=plan.references, base=base)
+        for m in mismatches:
+            errors.append(ValidationError("%s (%s, %s)"%(m.process, m.energy, m.year), "NEVT %g differs by %.2g%% from the XML %s"%(m.nevt, 100*m.rel_diff, m.method)))
+    return changes, plan, errors
+
+
+def scan_tree(base=UHH2_DATASETS_BASE):
+    """Return a dict path (relative to base) -> (mtime in ns, size) of all dataset XMLs and database files.
+
+    Only directory listings and the stat information of the entries are read, which is cheap enough to poll.
+    """
+    snapshot = {}
+
+    def scan(directory, relative):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                path = relative + "/" + entry.name if relative != "" else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    scan(entry.path, path)
+                elif entry.name.endswith(".xml") or (relative == SIGNAL_DICTS_DIR and entry.name.endswith(".py")):
+                    stat = entry.stat()
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    for directory in find_campaigns(base) + ([SIGNAL_DICTS_DIR] if os.path.isdir(os.path.join(base, SIGNAL_DICTS_DIR)) else []):
+        scan(os.path.join(base, directory), directory)
+    if os.path.isfile(os.path.join(base, DATABASE_FILE)):
+        stat = os.stat(os.path.join(base, DATABASE_FILE))
+        snapshot[DATABASE_FILE] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+WatchReport = namedtuple("WatchReport", ["changes", "plan", "new_errors", "fixed", "seconds"])
+
+
+class ChangeWatcher():
+    """Incremental validation of the working tree: every poll revalidates only what changed since the previous one.
+
+    The tree is polled with scan_tree, so no inotify or other service is needed. The process entries of every database
+    file, the loaded database and the validation results of every process and XML are kept between polls. A change of
+    a database file is diffed against its kept entries to find the changed processes, and the changed processes and
+    XMLs are validated together with their dependents as in validate_changes.
+
+    Args:
+        base (`str`): The UHH2-datasets directory
+        check_nevents (`bool`): Also cross-check NEVT against the NumberEntries of the XMLs
+        tolerance (`float`): Relative tolerance of the NEVT cross-check
+        check_format (`bool`): Also check that the XMLs can be sorted by XMLSorter.py, see validate_xml
+    """
+
+    def __init__(self, base=UHH2_DATASETS_BASE, check_nevents=False, tolerance=1e-3, check_format=False):
+        self.base = base
+        self.check_nevents = check_nevents
+        self.tolerance = tolerance
+        self.check_format = check_format
+        self.snapshot = scan_tree(base)
+        self.entries = {path: self._read_entries(path) for path in self.snapshot if is_database_file(path)}
+        self.helper = self._load_helper()
+        # (kind, name) -> list of ValidationErrors of the last validation of a process or XML
+        self.errors = {}
+
+    def _read_entries(self, path):
+        with open(os.path.join(self.base, path)) as f:
+            return read_process_entries(f.read(), path)
+
+    def _load_helper(self):
+        # a fresh execution of CrossSectionHelper.py, the imported module keeps the database of the start
+        from CrossSectionDaemon import load_helper
+        return load_helper(signal_dict_names(self.base), os.path.join(self.base, DATABASE_FILE))
+
+    def open_errors(self):
+        return [error for errors in self.errors.values() for error in errors]
+
+    def poll(self):
+        """Scan the tree, validate the changes since the previous poll and return a WatchReport, or None if nothing changed.
+
+        A database file that cannot be loaded (e.g. while it is being edited) is reported as error of that file, and
+        is read again at its next change.
+        """
+        snapshot = scan_tree(self.base)
+        changed = sorted(path for path in set(snapshot) | set(self.snapshot) if snapshot.get(path) != self.snapshot.get(path))
+        self.snapshot = snapshot
+        if len(changed) == 0:
+            return None
+        start = time.perf_counter()
+        results = {}
+        processes, removed = set(), set()
+        database_changed = False
+        for path in changed:
+            if not is_database_file(path):
+                continue
+            database_changed = True
+            try:
+                new_entries = self._read_entries(path) if path in snapshot else {}
+            except Exception as error:
+                results[("file", path)] = [ValidationError(path, "cannot be loaded: %s"%error)]
+                continue
+            results[("file", path)] = []
+            old_entries = self.entries.get(path, {})
+            processes |= set(name for name, entry in new_entries.items() if old_entries.get(name) != entry)
+            removed |= set(old_entries) - set(new_entries)
+            self.entries[path] = new_entries
+        if database_changed and not any(results[key] for key in results):
+            try:
+                self.helper = self._load_helper()
+            except Exception as error:
+                results[("file", DATABASE_FILE)] = [ValidationError(DATABASE_FILE, "cannot be loaded: %s"%error)]
+        for name in removed - processes:
+            results[("process", name)] = []
+        xmls = set(os.path.normpath(path) for path in changed if path.endswith(".xml"))
+        changes = ChangeSet(None, changed, xmls, processes, removed - processes)
+        plan = plan_validation(changes, self.helper, self.base)
+        for xml in plan.xmls:
+            results[("xml", xml)] = validate_xml(xml, self.base, self.check_format)
+        for key, errors in validate_processes(self.helper, plan.processes, self.base).items():
+            results[key] = results.get(key, []) + errors
+        for xml in xmls - set(plan.xmls):
+            # deleted and not referenced anymore
+            results[("xml", xml)] = []
+        if self.check_nevents and len(plan.references) > 0:
+            from NEventsCrossCheck import cross_check_nevents
+            mismatches, unchecked = cross_check_nevents(self.helper, self.tolerance, references=plan.references, base=self.base)
+            for m in mismatches:
+                results[("process", m.process)].append(ValidationError("%s (%s, %s)"%(m.process, m.energy, m.year), "NEVT %g differs by %.2g%% from the XML %s"%(m.nevt, 100*m.rel_diff, m.method)))
+        new_errors, fixed = [], []
+        for key, errors in sorted(results.items()):
+            old_errors = self.errors.get(key, [])
+            new_errors += [error for error in errors if not error in old_errors]
+            if len(old_errors) > 0 and len(errors) == 0:
+                fixed.append(key[1])
+            if len(errors) > 0:
+                self.errors[key] = errors
+            else:
+                self.errors.pop(key, None)
+        return WatchReport(changes, plan, new_errors, fixed, time.perf_counter() - start)
+
+    def watch(self, interval=1.0, callback=None):
+        """Poll every interval seconds until interrupted and pass every WatchReport to callback."""
+        while True:
+            report = self.poll()
+            if report is not None and callback is not None:
+                callback(report)
+            time.sleep(interval)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Validate only the database entries and dataset XMLs changed since a base revision, and their dependents.")
+
+    parser.add_argument("--base", default="origin/master", help="git revision to compare to, the merge base with HEAD is used (default: %(default)s).")
+    parser.add_argument("--check-nevents", action="store_true", help="also cross-check NEVT against the NumberEntries of the XMLs, see NEventsCrossCheck.py.")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="relative tolerance of the NEVT cross-check (default: %(default)s).")
+    parser.add_argument("--check-format", action="store_true", help="also check that the XMLs only contain entries and NumberEntries trailers, as needed by XMLSorter.py.")
+    parser.add_argument("--list", action="store_true", help="list the validated processes and XMLs.")
+    parser.add_argument("--throw", action="store_true", help="exit with an error if any check fails.")
+    parser.add_argument("--watch", action="store_true", help="instead of comparing to --base, poll the working tree and revalidate the entries and XMLs affected by every change, until interrupted.")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two polls of the tree with --watch (default: %(default)s).")
+
+    args = parser.parse_args()
+
+    if args.watch:
+        watcher = ChangeWatcher(check_nevents=args.check_nevents, tolerance=args.tolerance, check_format=args.check_format)
+        print("watching %d XML(s) and database file(s), interrupt with Ctrl-C"%len(watcher.snapshot), flush=True)
+
+        def report_changes(report):
+            print("[%s] %d changed file(s): validated %d process(es) and %d XML(s) in %.2f s"%(
+                time.strftime("%H:%M:%S"), len(report.changes.files), len(report.plan.processes), len(report.plan.xmls), report.seconds))
+            if args.list:
+                for name in report.plan.processes + report.plan.xmls:
+                    print("    " + name)
+            for error in report.new_errors:
+                print("Error: %s: %s"%error)
+            for name in report.fixed:
+                print("Fixed: " + name)
+            print("%d open error(s)"%len(watcher.open_errors()), flush=True)
+
+        try:
+            watcher.watch(args.interval, report_changes)
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    changes, plan, errors = validate_changes(args.base, args.check_nevents, args.tolerance, check_format=args.check_format)
+    print("%d changed file(s) since %s (%s): %d changed XML(s), %d changed and %d removed process(es)"%(
+        len(changes.files), args.base, changes.merge_base[:12], len(changes.xmls), len(changes.processes), len(changes.removed_processes)))
+    print("validating %d process(es) and %d XML(s) including dependents"%(len(plan.processes), len(plan.xmls)))
+    if args.list:
+        for name in plan.processes + plan.xmls:
+            print("    " + name)
+    if len(errors) > 0:
+        print("")
+        for error in errors:
+            print("Error: %s: %s"%error)
+    print("")
+    print("%d error(s), done in %.2f s"%(len(errors), time.perf_counter()-start))
+    if args.throw and len(errors) > 0:
+        raise ValueError("%d validation error(s) in the changed database entries and XMLs"%len(errors))
@@ -0,0 +1,114 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from DatasetXMLHelper import UHH2_DATASETS_BASE, atomic_write, find_xml_files, natural_sort_key
+
+
+_TOKEN = re.compile(rb"<!--.*?-->|<[^>]*>", re.DOTALL)
+_FILENAME = re.compile(rb'FileName="([^"]*)"')
+
+SORT_UNCHANGED = "unchanged"
+SORT_CHANGED = "sorted"
+SORT_FAILED = "failed"
+
+
+def sort_xml_bytes(data):
+    """Return the content of a dataset XML with its entries in natural order, one entry per line.
+
+    Entries are kept verbatim, including the EMPTY/BAD or commented-out status of commented entries, and are ordered
+    with natural_sort_key by their (first) FileName. Equal filenames keep their relative order. NumberEntries trailers
+    are moved after the entries in their original order, also if they were found in the middle of the file, e.g.
+    after XMLs were concatenated.
+
+    Raises:
+        ValueError: If the file contains anything else than entries and NumberEntries trailers, or an unterminated
+            comment, so that reordering could change its meaning.
+    """
+    if data.count(b"<!--") != data.count(b"-->"):
+        raise ValueError("ERROR XMLSorter::Unbalanced comment markers")
+    entries = []
+    trailers = []
+    pos = 0
+    for match in _TOKEN.finditer(data):
+        if data[pos:match.start()].strip() != b"":
+            raise ValueError("ERROR XMLSorter::Unexpected text at byte %d"%pos)
+        token = match.group()
+        filename = _FILENAME.search(token)
+        if filename is not None:
+            entries.append((natural_sort_key(filename.group(1).decode()), token))
+        elif b'NumberEntries="' in token:
+            trailers.append(token)
+        else:
+            raise ValueError("ERROR XMLSorter::Unexpected element at byte %d: %s"%(match.start(), token[:80].decode(errors="replace")))
+        pos = match.end()
+    if data[pos:].strip() != b"":
+        raise ValueError("ERROR XMLSorter::Unexpected text at byte %d"%pos)
+    entries.sort(key=lambda entry: entry[0])
+    return b"".join(token+b"\n" for token in [entry[1] for entry in entries] + trailers)
+
+
+def sort_xml(path, dry_run=False):
+    """Sort the entries of a dataset XML in natural order in place, see sort_xml_bytes.
+
+    The file is only rewritten (atomically) if its content changes.
+
+    Args:
+        path (`str`): The dataset XML
+        dry_run (`bool`): Do not write the file
+
+    Returns:
+        `bool`: Whether the content changed, or would change with dry_run.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    sorted_data = sort_xml_bytes(data)
+    if sorted_data == data:
+        return False
+    if not dry_run:
+        atomic_write(path, sorted_data)
+    return True
+
+
+def _sort_xml_status(path, dry_run):
+    try:
+        return (SORT_CHANGED if sort_xml(path, dry_run) else SORT_UNCHANGED), ""
+    except ValueError as error:
+        return SORT_FAILED, str(error)
+
+
+def sort_xmls(xmls, dry_run=False, workers=None):
+    """Sort many dataset XMLs in parallel worker processes and yield (xml, status, error message) in input order.
+
+    Every worker only holds the XML it is sorting, so the memory use does not grow with the number of XMLs.
+    The status is SORT_CHANGED, SORT_UNCHANGED or SORT_FAILED.
+    """
+    xmls = list(xmls)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(xmls)//(4*(workers or os.cpu_count() or 1)))
+        for xml, (status, error) in zip(xmls, executor.map(_sort_xml_status, xmls, [dry_run]*len(xmls), chunksize=chunksize)):
+            yield xml, status, error
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sort the entries of dataset XMLs in natural (block, index) order, in place. EMPTY/BAD entries and NumberEntries trailers are kept.")
+
+    parser.add_argument("xmls", nargs="*", help="dataset XMLs to sort (default: all XMLs of the selected campaigns).")
+    parser.add_argument("--campaign", nargs="*", default=None, help="campaign directories to sort, e.g. Run3_130X_v1 (default: all).")
+    parser.add_argument("--check", action="store_true", help="do not write anything, list the XMLs that are not sorted and exit with an error if there are any.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs).")
+
+    args = parser.parse_args()
+
+    xmls = args.xmls if len(args.xmls) > 0 else [os.path.join(UHH2_DATASETS_BASE, xml) for xml in find_xml_files(campaigns=args.campaign)]
+    counts = {SORT_CHANGED: 0, SORT_UNCHANGED: 0, SORT_FAILED: 0}
+    for xml, status, error in sort_xmls(xmls, dry_run=args.check, workers=args.workers):
+        counts[status] += 1
+        if status == SORT_FAILED:
+            print("%s: %s"%(xml, error))
+        elif status == SORT_CHANGED:
+            print(("not sorted: " if args.check else "sorted: ")+xml)
+    print("%d XML(s) %s, %d already sorted, %d could not be sorted"%(counts[SORT_CHANGED], "not sorted" if args.check else "sorted", counts[SORT_UNCHANGED], counts[SORT_FAILED]))
+    if args.check and counts[SORT_CHANGED] + counts[SORT_FAILED] > 0:
+        raise ValueError("%d XML(s) are not in natural order"%(counts[SORT_CHANGED] + counts[SORT_FAILED]))
@@ -0,0 +1,77 @@
+"""Benchmark CrabXMLGenerator on a synthetic crab output tree against a serial os.walk/fnmatch generator.
+
+Creates crab_<task>/<timestamp>/000N/Ntuple_*.root with empty files (1000 per block, as written by crab) in a
+temporary directory, checks that both generators write identical XMLs and prints the best wall time of each.
+
+    python benchmarks/bench_crab_xml_generator.py [--n-files 100000] [--repeat 3] [--workers 1 4 16] [--tmpdir /tmp]
+"""
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from CrabXMLGenerator import NTUPLE_PATTERN, generate_xml
+from DatasetXMLHelper import format_entry, natural_sort_key
+
+
+def make_tree(base, n_files, files_per_block=1000):
+    crab_dir = os.path.join(base, "crab_TTToSemiLeptonic_CP5_powheg-pythia8_Summer20UL18_v2")
+    for index in range(1, n_files + 1):
+        block = os.path.join(crab_dir, "211116_134348", "%04d"%(index//files_per_block))
+        if index == 1 or index % files_per_block == 0:
+            os.makedirs(os.path.join(block, "log"), exist_ok=True)
+        open(os.path.join(block, "Ntuple_%d.root"%index), "w").close()
+    return crab_dir
+
+
+def generate_serial(crab_dir, output):
+    # the approach of the old scripts: walk the whole tree and write line by line
+    filenames = []
+    for root, dirs, files in os.walk(crab_dir):
+        for name in files:
+            if fnmatch.fnmatch(name, NTUPLE_PATTERN):
+                filenames.append(os.path.join(root, name))
+    with open(output, "w") as f:
+        for filename in sorted(filenames, key=natural_sort_key):
+            f.write(format_entry(filename)+"\n")
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the crab output tree XML generator on a synthetic tree.")
+    parser.add_argument("--n-files", type=int, default=100000, help="number of ntuples in the synthetic tree (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions, the best time is shown (default: %(default)s).")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="numbers of concurrent block listings (default: %(default)s).")
+    parser.add_argument("--tmpdir", default=None, help="directory to create the synthetic tree in, e.g. on the shared filesystem.")
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(dir=args.tmpdir)
+    try:
+        start = time.perf_counter()
+        crab_dir = make_tree(base, args.n_files)
+        print("created %d files in %.1f s"%(args.n_files, time.perf_counter() - start))
+
+        reference = os.path.join(base, "serial.xml")
+        print("{:<24s} {:>10.3f} s".format("serial os.walk", best_time(lambda: generate_serial(crab_dir, reference), args.repeat)))
+        with open(reference) as f:
+            expected = f.read()
+        for workers in args.workers:
+            output = os.path.join(base, "generated_%d.xml"%workers)
+            elapsed = best_time(lambda: generate_xml([crab_dir], output, workers=workers), args.repeat)
+            with open(output) as f:
+                same = f.read() == expected
+            print("{:<24s} {:>10.3f} s{}".format("scandir, %d worker(s)"%workers, elapsed, "" if same else "  OUTPUT DIFFERS"))
+    finally:
+        shutil.rmtree(base)
@@ -0,0 +1,100 @@
+"""Benchmark cross section lookups through CrossSectionDaemon against cold imports of CrossSectionHelper.
+
+Measures the wall time of short-lived Python processes doing a few get_lumi calls, as spawned by job preparation,
+once importing CrossSectionHelper and once using the client of a running server, and the throughput of batched and
+single lookups within one process.
+
+    python benchmarks/bench_crosssection_daemon.py [--processes 20] [--lookups 5] [--batch 1000] [--import-signal AZHToLLTTBar]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+from CrossSectionDaemon import CrossSectionClient
+from CrossSectionHelper import MCSampleValuesHelper, is_data
+
+COLD = """
+import sys
+sys.path.insert(0, {base!r})
+from CrossSectionHelper import MCSampleValuesHelper
+helper = MCSampleValuesHelper(import_signal={signal!r})
+for process in {processes!r}:
+    helper.get_lumi(process, "13TeV", "UL18")
+"""
+
+CLIENT = """
+import sys
+sys.path.insert(0, {base!r})
+from CrossSectionDaemon import CrossSectionClient
+client = CrossSectionClient(import_signal={signal!r}, socket_path={socket!r})
+client.lookup([("lumi", process, "13TeV", "UL18") for process in {processes!r}])
+assert client.using_server
+"""
+
+
+def time_processes(code, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times)//2], sum(times)
+
+
+def wait_for_server(client, timeout=30):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if client.ping() is not None:
+            return
+        time.sleep(0.05)
+    raise ValueError("ERROR bench_crosssection_daemon::The server did not start within %d s"%timeout)
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the cross section lookup server against cold imports.")
+    parser.add_argument("--processes", type=int, default=20, help="number of short-lived processes per method (default: %(default)s).")
+    parser.add_argument("--lookups", type=int, default=5, help="number of get_lumi calls per short-lived process (default: %(default)s).")
+    parser.add_argument("--batch", type=int, default=1000, help="number of lookups of the throughput measurement (default: %(default)s).")
+    parser.add_argument("--import-signal", nargs="+", default=[], help="signal dict(s) to load in every process and in the server.")
+    args = parser.parse_args()
+
+    helper = MCSampleValuesHelper(import_signal=args.import_signal)
+    samples = [p for p in helper.get_processes() if not is_data(p) and helper.get_nevt(p, "13TeV", "UL18") > 0]
+    processes = samples[:args.lookups]
+    queries = [("lumi", samples[i % len(samples)], "13TeV", "UL18") for i in range(args.batch)]
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "xsec.sock")
+    command = [sys.executable, os.path.join(BASE, "CrossSectionDaemon.py"), "--serve", "--socket", socket_path]
+    server = subprocess.Popen(command + (["--import-signal"] + args.import_signal if args.import_signal else []), stdout=subprocess.DEVNULL)
+    try:
+        client = CrossSectionClient(args.import_signal, socket_path)
+        wait_for_server(client)
+
+        print("{:<34s} {:>12s} {:>12s}".format("short-lived processes", "median", "total"))
+        for name, code in [("cold import", COLD), ("client + server", CLIENT)]:
+            median, total = time_processes(code.format(base=BASE, signal=args.import_signal, processes=processes, socket=socket_path), args.processes)
+            print("{:<34s} {:>10.1f} ms {:>10.2f} s".format("%s, %d lookup(s)"%(name, len(processes)), 1e3*median, total))
+
+        print("")
+        print("{:<34s} {:>12s}".format("lookups in one process", "per second"))
+        start = time.perf_counter()
+        expected = [helper.get_lumi(process, energy, year) for op, process, energy, year in queries]
+        print("{:<34s} {:>12.0f}".format("in-process helper", len(queries)/(time.perf_counter() - start)))
+        start = time.perf_counter()
+        values = client.lookup(queries)
+        print("{:<34s} {:>12.0f}{}".format("server, one batch", len(queries)/(time.perf_counter() - start), "" if values == expected else "  VALUES DIFFER"))
+        n_single = min(len(queries), 200)
+        start = time.perf_counter()
+        for op, process, energy, year in queries[:n_single]:
+            client.get_lumi(process, energy, year)
+        print("{:<34s} {:>12.0f}".format("server, single lookups", n_single/(time.perf_counter() - start)))
+        client.close()
+    finally:
+        server.terminate()
+        server.wait()
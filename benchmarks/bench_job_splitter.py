@@ -0,0 +1,58 @@
+"""Benchmark the makespan imbalance of the JobSplitter strategies on synthetic, skewed per-file event counts.
+
+The makespan imbalance is the total cost of the largest shard divided by the mean shard cost, minus one,
+i.e. how much longer the slowest job runs than a perfectly balanced one.
+
+    python benchmarks/bench_job_splitter.py [--n-files 2000] [--n-shards 50] [--seed 1]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from JobSplitter import split_by_count, split_by_cost, split_lpt
+
+
+def make_distributions(n_files, rng):
+    return {
+        "uniform": [rng.uniform(50000, 150000) for _ in range(n_files)],
+        "lognormal": [rng.lognormvariate(11, 1.0) for _ in range(n_files)],
+        "pareto": [10000*rng.paretovariate(1.5) for _ in range(n_files)],
+        "bimodal": [rng.choice([5000, 200000])*rng.uniform(0.9, 1.1) for _ in range(n_files)],
+        # event counts that grow along the file list, as when late crab jobs process larger lumi blocks
+        "sorted": sorted(rng.lognormvariate(11, 1.0) for _ in range(n_files)),
+    }
+
+
+def imbalance(shards, costs):
+    loads = [sum(costs[f] for f in shard) for shard in shards]
+    return max(loads)/(sum(loads)/len(loads)) - 1
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the makespan imbalance of naive and event-balanced job splitting.")
+    parser.add_argument("--n-files", type=int, default=2000, help="number of files per synthetic sample (default: %(default)s).")
+    parser.add_argument("--n-shards", type=int, default=50, help="number of shards (default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s).")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    strategies = [
+        ("naive (count)", lambda files, costs: split_by_count(files, args.n_shards)),
+        ("contiguous", lambda files, costs: split_by_cost(files, args.n_shards, costs)),
+        ("lpt", lambda files, costs: split_lpt(files, args.n_shards, costs)),
+    ]
+    row = "{:<12s}" + " {:>20s}"*len(strategies)
+    print(row.format("distribution", *[name for name, _ in strategies]))
+    for name, values in make_distributions(args.n_files, rng).items():
+        files = ["Ntuple_%d.root"%i for i in range(args.n_files)]
+        costs = dict(zip(files, values))
+        results = []
+        for _, strategy in strategies:
+            start = time.perf_counter()
+            shards = strategy(files, costs)
+            elapsed = time.perf_counter() - start
+            results.append("%6.2f%% (%5.1f ms)"%(100*imbalance(shards, costs), 1e3*elapsed))
+        print(row.format(name, *results))
@@ -0,0 +1,110 @@
+"""Benchmark the memory-mapped XMLScanner against xml.etree and a line-based regex.
+
+Runs the readers on the five largest dataset XMLs in the tree (or the files given on the command line),
+checks that they find the same number of active/commented entries, and prints the best wall time of each.
+
+    python benchmarks/bench_xml_scanner.py [--repeat 5] [xml ...]
+"""
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DatasetXMLHelper import UHH2_DATASETS_BASE, STATUS_ACTIVE, XMLScanner, find_xml_files
+
+
+def count_mmap(path):
+    n_active, n_commented = 0, 0
+    with XMLScanner(path) as scanner:
+        for status, filename in scanner.iter_filenames():
+            if status == STATUS_ACTIVE:
+                n_active += 1
+            else:
+                n_commented += 1
+        for method, value in scanner.iter_number_entries():
+            pass
+    return n_active, n_commented
+
+
+def count_mmap_bulk(path):
+    with XMLScanner(path) as scanner:
+        counts = scanner.count_statuses()
+    return counts[STATUS_ACTIVE], sum(counts.values()) - counts[STATUS_ACTIVE]
+
+
+def count_etree(path):
+    # dataset XMLs are entity fragments without a root element, so wrap them before parsing
+    n_active, n_commented = 0, 0
+    parser = ET.XMLPullParser(events=("start", "comment"))
+    parser.feed(b"<root>")
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start" and "FileName" in element.attrib:
+                    n_active += 1
+                elif event == "comment" and 'FileName="' in element.text:
+                    n_commented += 1
+    parser.feed(b"</root>")
+    parser.close()
+    return n_active, n_commented
+
+
+_line_pattern = re.compile(r'^(?P<comment><!--)?.*?FileName="(?P<filename>[^"]*)"')
+
+
+def count_regex(path):
+    n_active, n_commented = 0, 0
+    with open(path) as f:
+        for line in f:
+            match = _line_pattern.match(line)
+            if match is None:
+                continue
+            if match.group("comment") is None:
+                n_active += 1
+            else:
+                n_commented += 1
+    return n_active, n_commented
+
+
+def largest_xml_files(n=5):
+    paths = [os.path.join(UHH2_DATASETS_BASE, p) for p in find_xml_files()]
+    return sorted(paths, key=os.path.getsize, reverse=True)[:n]
+
+
+def best_time(function, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if(__name__ == "__main__"):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark XMLScanner against xml.etree and line-based regex parsing.")
+    parser.add_argument("xmls", nargs="*", help="XML files to benchmark (default: the five largest XMLs in the tree).")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repetitions, the best time is reported (default: %(default)s).")
+    args = parser.parse_args()
+
+    paths = args.xmls if len(args.xmls) > 0 else largest_xml_files()
+    readers = [("mmap", count_mmap), ("mmap-count", count_mmap_bulk), ("etree", count_etree), ("regex", count_regex)]
+    totals = {name: 0.0 for name, _ in readers}
+
+    row = "{:<60s} {:>8s}" + " {:>16s}"*len(readers)
+    print(row.format("XML", "MB", *[name+" [ms]" for name, _ in readers]))
+    for path in paths:
+        times, results = [], []
+        for name, function in readers:
+            elapsed, result = best_time(function, path, args.repeat)
+            totals[name] += elapsed
+            times.append(elapsed)
+            results.append(result)
+        if any(result != results[0] for result in results):
+            raise RuntimeError("Readers disagree on "+path+": "+str(results))
+        print(row.format(os.path.basename(path)[-60:], "%.2f"%(os.path.getsize(path)/1e6), *["%.2f"%(t*1e3) for t in times]))
+    print(row.format("total", "", *["%.2f"%(totals[name]*1e3) for name, _ in readers]))